@@ -1,18 +1,16 @@
 from flask import Flask, render_template, request, jsonify
-from ultralytics import YOLO
 import cv2
 import numpy as np
 from PIL import Image
 import io
 
+from recognition.registry import get_model, registry
+from recognition.warmup import readiness, start_warmup
+
 app = Flask(__name__, template_folder='templates')
 
-# Load YOLOv8 face detection model
-try:
-    model = YOLO('yolov8n-face.pt')
-    print("YOLOv8 model loaded")
-except:
-    model = None
+# Exercise the detector on a dummy frame before reporting ready
+start_warmup(models=['yolov8n-face'], recognition_model=None, landmarks=False)
 
 @app.route('/')
 def index():
@@ -28,24 +26,26 @@ def detect_faces():
         img = Image.open(file.stream)
         img_array = np.array(img)
         
-        if model is None:
+        # Fetch the YOLOv8 face model from the shared registry on every request,
+        # so its memory budget and LRU eviction apply to this app as well
+        try:
+            model = get_model('yolov8n-face')
+        except Exception:
             return jsonify({'status': 'error', 'message': 'Model not loaded'}), 500
         
         # Detect faces with YOLOv8
-        results = model(img_array)
+        detections = model([img_array])[0]
         recognized_people = []
         
-        for result in results:
-            for box in result.boxes:
-                x1, y1, x2, y2 = box.xyxy[0].tolist()
-                conf = float(box.conf[0])
-                
-                recognized_people.append({
-                    'name': 'Face',
-                    'confidence': round(1 - conf, 3),
-                    'box': [int(x1), int(y1), int(x2), int(y2)],
-                    'is_allowed': True
-                })
+        for box, conf in zip(detections.boxes.tolist(), detections.scores.tolist()):
+            x1, y1, x2, y2 = box
+            
+            recognized_people.append({
+                'name': 'Face',
+                'confidence': round(1 - conf, 3),
+                'box': [int(x1), int(y1), int(x2), int(y2)],
+                'is_allowed': True
+            })
         
         return jsonify({
             'status': 'success',
@@ -56,5 +56,13 @@ def detect_faces():
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/ready')
+def ready():
+    return jsonify(readiness.status()), 200 if readiness.is_ready else 503
+
+@app.route('/stats/')
+def stats():
+    return jsonify({'models': registry.stats()})
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8000)
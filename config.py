@@ -46,6 +46,107 @@ class Settings(BaseSettings):
     # Telegram configuration
     TELEGRAM_BOT_TOKEN: Optional[str] = None
     TELEGRAM_CHANNEL_ID: Optional[str] = None
+    NOTIFY_IMAGE_MAX_SIDE: int = 1280
+    NOTIFY_IMAGE_QUALITY: int = 80
+    
+    # Background Telegram notification worker
+    TELEGRAM_API_URL: str = "https://api.telegram.org"
+    NOTIFY_QUEUE_SIZE: int = 100
+    NOTIFY_RATE_PER_MINUTE: float = 20.0
+    NOTIFY_BURST: int = 5
+    NOTIFY_MAX_RETRIES: int = 4
+    NOTIFY_BACKOFF_SECONDS: float = 1.0
+    NOTIFY_TIMEOUT_SECONDS: float = 10.0
+    
+    # Detection model registry
+    MODEL_CACHE_BUDGET_MB: int = 1024
+    
+    # Detector backend: "torch", "onnx" or "onnx-int8"
+    DETECTOR_BACKEND: str = "torch"
+    ONNX_CACHE_DIR: Path = BASE_DIR / "onnx_models"
+    ONNX_PROVIDERS: str = "CPUExecutionProvider"
+    
+    # Embedding backend: "deepface", "onnx" or "onnx-int8"
+    EMBEDDING_BACKEND: str = "deepface"
+    
+    # Matching (Facenet cosine distance), candidates returned per face and gallery face detector
+    RECOGNITION_THRESHOLD: float = 0.40
+    RECOGNITION_TOP_K: int = 3
+    GALLERY_DETECTOR: str = "yolov8n-face"
+    
+    # Gallery embedding encoding: "float32", "float16", "int8" or "pq"
+    GALLERY_ENCODING: str = "float32"
+    GALLERY_PQ_SUBSPACES: int = 16
+    
+    # Memory-mapped gallery file shared by all workers
+    GALLERY_STORE_ENABLED: bool = True
+    GALLERY_STORE_DIR: Path = BASE_DIR / "gallery_store"
+    
+    # Approximate nearest-neighbour gallery index (IVF), used from ANN_MIN_SIZE faces
+    ANN_ENABLED: bool = False
+    ANN_MIN_SIZE: int = 20000
+    ANN_NLIST: int = 0
+    ANN_NPROBE: int = 8
+    ANN_INDEX_DIR: Path = BASE_DIR / "gallery_index"
+    
+    # Decode large JPEG uploads at a reduced scale that still covers the detector input
+    DECODE_DOWNSCALE: bool = True
+    
+    # JPEG quality (1-100) browser clients encode captures with, see /api/faces/capture-profile
+    CAPTURE_JPEG_QUALITY: int = 85
+    
+    # Startup warm-up: GALLERY_DETECTOR, plus these comma-separated AVAILABLE_MODELS keys
+    PRELOAD_MODELS: str = ""
+    PRELOAD_RECOGNITION_MODEL: Optional[str] = "Facenet"
+    PRELOAD_LANDMARKS: bool = True
+    LANDMARK_PREDICTOR_PATH: Path = BASE_DIR / "shape_predictor_68_face_landmarks.dat"
+    
+    # Inference thread pool
+    INFERENCE_WORKERS: int = 4
+    INFERENCE_QUEUE_SIZE: int = 16
+    
+    # Results of byte-identical uploads, reused until the gallery changes
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_SIZE: int = 256
+    RESULT_CACHE_TTL: float = 30.0
+    RESULT_CACHE_NEGATIVE_TTL: float = 5.0
+    
+    # Live WebSocket stream, frames recognized per second and connection
+    STREAM_MAX_FPS: float = 10.0
+    
+    # Face tracking on streams: recognition runs for new tracks, uncertain ones every
+    # TRACK_RETRY_FRAMES and confident ones (distance <= TRACK_CONFIDENT_DISTANCE)
+    # every TRACK_REVERIFY_FRAMES
+    TRACK_IOU_THRESHOLD: float = 0.3
+    TRACK_MAX_AGE: int = 15
+    TRACK_CONFIDENT_DISTANCE: float = 0.30
+    TRACK_RETRY_FRAMES: int = 5
+    TRACK_REVERIFY_FRAMES: int = 30
+    
+    # Motion gate before detection on streams and ingestion: MOG2 variance threshold
+    # (lower is more sensitive), changed fraction of the region of interest, and the
+    # region as "x1,y1,x2,y2" fractions of the frame (empty for the whole frame)
+    MOTION_GATE_ENABLED: bool = False
+    MOTION_THRESHOLD: float = 16.0
+    MOTION_MIN_AREA: float = 0.005
+    MOTION_ROI: str = ""
+    
+    # Video ingestion service (ingest.py), frames detected per second of video
+    INGEST_TARGET_FPS: float = 5.0
+    
+    # Server-Sent Events for the admin dashboard; with EVENTS_SHARED they go through
+    # the events table, polled by every worker, so all processes see all events
+    EVENTS_HISTORY: int = 256
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_KEEPALIVE_SECONDS: float = 15.0
+    EVENTS_SHARED: bool = True
+    EVENTS_POLL_SECONDS: float = 1.0
+    EVENTS_RETENTION_SECONDS: float = 3600.0
+    
+    # Cross-request detection micro-batching
+    BATCH_ENABLED: bool = True
+    BATCH_WINDOW_MS: float = 10.0
+    BATCH_MAX_SIZE: int = 8
     
     def get_database_url(self) -> str:
         """Get the database URL based on configuration."""
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('face', '0002_face_is_allowed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='face',
+            name='crop',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='face',
+            name='embedding',
+            field=models.BinaryField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='face',
+            name='embedding_model',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='face',
+            name='embedding_version',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
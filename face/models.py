@@ -22,6 +22,15 @@ class Face(models.Model):
         default=True, help_text="Whether this person is allowed access"
     )
 
+    # Aligned face crop (JPEG) and its embedding, computed once at enrollment
+    # so recognition never has to read the raw gallery image again
+    crop = models.BinaryField(null=True, blank=True, editable=False)
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+
+    # Embedding model and version, used to detect embeddings that need recomputing
+    embedding_model = models.CharField(max_length=100, blank=True, default="")
+    embedding_version = models.CharField(max_length=100, blank=True, default="")
+
     # Automatically set timestamp when a face is first added to the system
     created_at = models.DateTimeField(auto_now_add=True)
 
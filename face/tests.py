@@ -1,3 +1,137 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from recognition.notifications import NotificationWorker, TokenBucket
+
+
+class StubTelegramHandler(BaseHTTPRequestHandler):
+    """Answers Bot API calls with the responses scripted on the server."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Content-Type", ""), body))
+        server.release.wait(5)
+        status, payload = server.responses.pop(0) if server.responses else (200, {"ok": True, "result": {}})
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NotificationWorkerTests(SimpleTestCase):
+    """The notification worker against a local stand-in for the Telegram Bot API."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubTelegramHandler)
+        self.server.requests = []
+        self.server.responses = []
+        self.server.release = threading.Event()
+        self.server.release.set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.server.release.set)
+
+    def worker(self, **kwargs):
+        options = {"rate_per_minute": 6000, "burst": 10, "backoff": 0.01, "timeout": 5}
+        options.update(kwargs)
+        host, port = self.server.server_address
+        return NotificationWorker("TOKEN", "@channel", api_url=f"http://{host}:{port}", **options)
+
+    def test_sends_text_message(self):
+        worker = self.worker()
+        self.assertTrue(worker.enqueue("hello"))
+        self.assertTrue(worker.drain(timeout=5))
+
+        path, _, body = self.server.requests[0]
+        self.assertEqual(path, "/botTOKEN/sendMessage")
+        self.assertEqual(json.loads(body), {"chat_id": "@channel", "text": "hello"})
+        self.assertEqual(worker.stats()["sent"], 1)
+
+    def test_sends_photo_with_caption(self):
+        worker = self.worker()
+        worker.enqueue("face", b"\xff\xd8jpeg")
+        self.assertTrue(worker.drain(timeout=5))
+
+        path, content_type, body = self.server.requests[0]
+        self.assertEqual(path, "/botTOKEN/sendPhoto")
+        self.assertTrue(content_type.startswith("multipart/form-data"))
+        self.assertIn(b"face", body)
+        self.assertIn(b"\xff\xd8jpeg", body)
+
+    def test_retries_server_errors(self):
+        self.server.responses = [(502, {"ok": False}), (500, {"ok": False, "description": "Internal"})]
+        worker = self.worker()
+        worker.enqueue("hello")
+        self.assertTrue(worker.drain(timeout=5))
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(worker.stats()["retries"], 2)
+        self.assertEqual(worker.stats()["sent"], 1)
+
+    def test_honours_retry_after(self):
+        self.server.responses = [(429, {"ok": False, "parameters": {"retry_after": 0.3}})]
+        worker = self.worker()
+        start = time.monotonic()
+        worker.enqueue("hello")
+        self.assertTrue(worker.drain(timeout=5))
+
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(worker.stats()["sent"], 1)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.responses = [(503, {"ok": False})] * 3
+        worker = self.worker(max_retries=2)
+        worker.enqueue("hello")
+        self.assertTrue(worker.drain(timeout=5))
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(worker.stats()["failed"], 1)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.responses = [(400, {"ok": False, "description": "Bad Request: chat not found"})]
+        worker = self.worker()
+        worker.enqueue("hello")
+        self.assertTrue(worker.drain(timeout=5))
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(worker.stats()["failed"], 1)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        self.server.release.clear()  # the first send hangs until released
+        worker = self.worker(queue_size=1)
+        start = time.monotonic()
+        queued = [worker.enqueue(f"message {i}") for i in range(4)]
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIn(False, queued)
+        self.assertEqual(worker.stats()["dropped"], queued.count(False))
+        self.server.release.set()
+        self.assertTrue(worker.drain(timeout=5))
+        self.assertEqual(worker.stats()["sent"], queued.count(True))
+
+    def test_unconfigured_worker_ignores_messages(self):
+        worker = NotificationWorker(None, None)
+        self.assertFalse(worker.enqueue("hello"))
+        self.assertTrue(worker.drain(timeout=0))
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_bursts_then_spaces_out(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        delays = [bucket.delay() for _ in range(4)]
+
+        self.assertEqual(delays[:2], [0.0, 0.0])
+        self.assertAlmostEqual(delays[2], 0.1, places=2)
+        self.assertAlmostEqual(delays[3], 0.2, places=2)
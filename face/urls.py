@@ -6,11 +6,20 @@ from .views import (
     FaceUpdateView,
     FaceDeleteView,
     FaceDetailView,
+    CaptureProfileView,
+    ReadyView,
+    StatsView,
 )
 
 urlpatterns = [
     # API endpoint for face detection and recognition
     path("detect/", FaceRecognitionView.as_view(), name="detect"),
+    # Capture size and JPEG quality for webcam frames of a model
+    path("capture-profile/", CaptureProfileView.as_view(), name="capture_profile"),
+    # Readiness probe, succeeds once models are warmed up
+    path("ready/", ReadyView.as_view(), name="ready"),
+    # Model cache hit/miss/eviction counters, batch sizes and upload sizes
+    path("stats/", StatsView.as_view(), name="stats"),
     # Face management views (CRUD operations)
     # List all faces in the system
     path("faces/", FaceListView.as_view(), name="face_list"),
@@ -13,30 +13,110 @@ from django.contrib import messages
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-import cv2
-import numpy as np
-from ultralytics import YOLO
-from deepface import DeepFace
-import os
-from django.conf import settings
 
+from recognition.alignment import align_detections
+from recognition.batching import detect, detection_batcher
+from recognition.decoding import capture_profile, decode_upload, upload_totals
+from recognition.enrollment import (
+    decode_embedding,
+    embedding_signature,
+    enroll_bytes,
+    enroll_file,
+)
+from recognition.gallery import Gallery
+from recognition.matching import recognize
+from recognition.metadata import FaceInfo, FaceMetadataCache
+from recognition.registry import registry, resolve_face_model_key, resolve_model_key
+from recognition.warmup import readiness
 from .models import Face
 from .forms import FaceForm
-from .utils import align_face, send_telegram_message_sync
+from .utils import send_telegram_message
+
+
+def apply_enrollment(face, enrollment):
+    """
+    Copy an enrollment's crop and embedding onto a Face instance.
+
+    Args:
+        face (Face): The face to update (not saved)
+        enrollment (Enrollment): Result of enrolling the face image
+    """
+    face.crop = enrollment.crop
+    face.embedding = enrollment.embedding
+    face.embedding_model = enrollment.embedding_model
+    face.embedding_version = enrollment.embedding_version
+
+
+def load_gallery():
+    """
+    Load the stored embeddings of all faces for the recognition gallery.
+
+    Faces enrolled before embeddings were stored, or with another embedding
+    model, are enrolled again from their image file and saved.
+
+    Returns:
+        list: (face id, embedding, is_allowed) triples
+    """
+    signature = embedding_signature()
+    entries = []
+    for face in Face.objects.defer("crop"):
+        if face.embedding is None or (face.embedding_model, face.embedding_version) != signature:
+            try:
+                apply_enrollment(face, enroll_file(face.image.path))
+            except ValueError:
+                continue
+            face.save(update_fields=["crop", "embedding", "embedding_model", "embedding_version"])
+        entries.append((face.id, decode_embedding(bytes(face.embedding)), face.is_allowed))
+    return entries
+
+
+# Embeddings of the enrolled faces, loaded once and kept in memory
+faces_gallery = Gallery(load_gallery, name="django-faces")
+
+
+def load_metadata():
+    """
+    Load the identity fields of all faces in one query.
+
+    Returns:
+        list: FaceInfo for every face
+    """
+    return [
+        FaceInfo(id=face.id, name=face.name, image_url=face.image.url, is_allowed=face.is_allowed)
+        for face in Face.objects.only("id", "name", "image", "is_allowed")
+    ]
+
+
+# Names, image URLs and access flags of the enrolled faces, keyed by id
+face_metadata = FaceMetadataCache(load_metadata, version=lambda: faces_gallery.version)
+
+
+def sync_gallery(face):
+    """
+    Apply a created or edited face to the in-memory gallery and metadata cache.
+
+    Args:
+        face (Face): The saved face
+    """
+    embedding = decode_embedding(bytes(face.embedding)) if face.embedding else None
+    faces_gallery.upsert(face.pk, embedding, face.is_allowed)
+    face_metadata.invalidate()
 
 
-# Define available face detection models
-# These are the pre-trained YOLO models that can be selected for face detection
-AVAILABLE_MODELS = {
-    "yolov8n": "yolov8n.pt",  # YOLOv8 nano - general object detection
-    "yolov8m": "yolov8m.pt",  # YOLOv8 medium - general object detection
-    "yolov8n-face": "yolov8n-face.pt",  # YOLOv8 nano - specific for face detection
-    "yolov8m-face": "yolov8m-face.pt",  # YOLOv8 medium - specific for face detection
-    "yolov8l-face": "yolov8l-face.pt",  # YOLOv8 large - specific for face detection
-    "yolov10s-face": "yolov10s-face.pt",  # YOLOv10 small - specific for face detection
-    "yolov11m-face": "yolov11m-face.pt",  # YOLOv11 medium - specific for face detection
-    "yolov11l-face": "yolov11l-face.pt",  # YOLOv11 large - specific for face detection
-}
+def candidates_data(recognition):
+    """
+    Serialize the nearest gallery candidates of a recognition result.
+
+    Args:
+        recognition (Recognition): Result for one detected face
+
+    Returns:
+        list: Candidate dictionaries, nearest first
+    """
+    return [
+        {"id": c.face_id, "distance": c.distance, "is_allowed": c.is_allowed}
+        for c in recognition.candidates
+    ]
 
 
 class FaceRecognitionView(LoginRequiredMixin, View):
@@ -46,8 +126,8 @@ class FaceRecognitionView(LoginRequiredMixin, View):
     This is the core functionality of the system. It:
     1. Receives an uploaded image
     2. Uses YOLO to detect faces in the image
-    3. Uses DeepFace to recognize detected faces
-    4. Sends Telegram notifications for recognized faces
+    3. Embeds all detected faces in one batch and matches them against the gallery
+    4. Queues Telegram notifications for recognized faces
     5. Returns recognition results as JSON
 
     Authentication is required to access this view.
@@ -61,8 +141,8 @@ class FaceRecognitionView(LoginRequiredMixin, View):
         1. Validate uploaded image
         2. Load appropriate face detection model
         3. Process image to detect faces
-        4. For each detected face, try to recognize using DeepFace
-        5. Send Telegram notifications
+        4. Recognize all detected faces with one batched embedding pass
+        5. Queue Telegram notifications
         6. Return results as JSON
 
         Args:
@@ -76,123 +156,106 @@ class FaceRecognitionView(LoginRequiredMixin, View):
         if not file:
             return JsonResponse({"error": "No image uploaded"}, status=400)
 
-        # Get model selection from request, default to yolov8n.pt
-        model_key = request.POST.get("model", "yolov8n")
-        model_path = AVAILABLE_MODELS.get(model_key, AVAILABLE_MODELS["yolov8n"])
-
-        # Initialize model for this request
-        model = YOLO(model_path)
-
-        # Convert uploaded file to OpenCV format
-        np_img = np.frombuffer(file.read(), np.uint8)
-        img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-
-        # Run face detection with YOLO
-        results = model(img)
+        # Get model selection from request, default to GALLERY_DETECTOR;
+        # general object detectors are rejected, their boxes are not faces
+        try:
+            model_key = resolve_face_model_key(request.POST.get("model"))
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        # Decode the upload only as large as the detector input needs
+        try:
+            frame = decode_upload(file.read(), registry.get(model_key).imgsz)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        # Run face detection with YOLO, batched with concurrent requests,
+        # and report the boxes in original-image coordinates
+        detections = detect(model_key, frame.image).scaled(frame.scale)
         recognized_people = []
 
-        # Save the input image temporarily for Telegram notifications
-        temp_image_path = os.path.join(settings.MEDIA_ROOT, "temp_detection.jpg")
-        cv2.imwrite(temp_image_path, img)
+        # Extract bounding box coordinates of every detected face
+        boxes = [[int(v) for v in box] for box in detections.boxes]
+
+        # Recognize all faces of the frame in one batched embedding pass
+        try:
+            # Crop and align each face from the detector keypoints to improve recognition accuracy
+            aligned_faces = align_detections(*frame.for_faces(detections))
+            recognitions, error = recognize([aligned_faces], faces_gallery)[0], None
+        except Exception as e:
+            recognitions, error = [None] * len(boxes), e
 
         # Process each detected face
-        for result in results:
-            for box in result.boxes:
-                # Extract bounding box coordinates
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-
-                # Crop the detected face from the image
-                face_img = img[y1:y2, x1:x2]
-
-                # Try to recognize the face using DeepFace
-                try:
-                    # Align the face to improve recognition accuracy
-                    aligned_face = align_face(face_img)
-
-                    # Search for the face in the database
-                    df_results = DeepFace.find(
-                        aligned_face, db_path="media/faces", model_name="Facenet"
-                    )
-
-                    # Check if any matches were found
-                    if df_results and len(df_results) > 0 and len(df_results[0]) > 0:
-                        # Get the most similar face
-                        best_match = df_results[0].iloc[0]
-
-                        # Extract the filename from the path
-                        face_path = best_match["identity"]
-                        filename = os.path.basename(face_path)
-
-                        # Try to find a matching face in the database
-                        try:
-                            # Find a face object with matching image filename
-                            face_obj = Face.objects.filter(
-                                image__contains=filename
-                            ).first()
-
-                            if face_obj:
-                                # Found matching face in database
-                                person_data = {
-                                    "id": face_obj.id,
-                                    "name": face_obj.name,
-                                    "filename": f"/media/faces/{filename}",
-                                    "confidence": float(best_match["distance"]),
-                                    "box": [int(x1), int(y1), int(x2), int(y2)],
-                                    "is_allowed": face_obj.is_allowed,  # Include allowed status
-                                }
-                                recognized_people.append(person_data)
-
-                                # Customize message based on allowed status
-                                access_status = (
-                                    "✅ ALLOWED" if face_obj.is_allowed else "⛔ DENIED"
-                                )
-                                message = f"✨ Face Recognized!\nName: {face_obj.name}\nAccess: {access_status}\nConfidence: {100*(1 - float(best_match['distance'])):.2f}%"
-                                send_telegram_message_sync(message, temp_image_path)
-
-                            else:
-                                # Found similar face but not in our database
-                                person_data = {
-                                    "name": "Unknown (Match found but not in database)",
-                                    "filename": f"/media/faces/{filename}",
-                                    "confidence": float(best_match["distance"]),
-                                    "box": [int(x1), int(y1), int(x2), int(y2)],
-                                    "is_allowed": False,  # Unknown faces are not allowed by default
-                                }
-                                recognized_people.append(person_data)
-
-                                # Send Telegram notification for unknown face
-                                message = "⚠️ Unknown Face Detected\nMatch found but not in database\nAccess: ⛔ DENIED"
-                                send_telegram_message_sync(message, temp_image_path)
-
-                        except Exception as e:
-                            # Error matching with database
-                            error_data = {
-                                "name": "Error matching with database",
-                                "error": str(e),
-                                "box": [int(x1), int(y1), int(x2), int(y2)],
-                            }
-                            recognized_people.append(error_data)
-
-                            # Send Telegram notification for error
-                            message = f"❌ Error in Face Recognition\nError: {str(e)}"
-                            send_telegram_message_sync(message)
-
-                except Exception as e:
-                    # Error in DeepFace recognition
-                    error_data = {
-                        "name": "Unknown",
-                        "error": str(e),
-                        "box": [int(x1), int(y1), int(x2), int(y2)],
+        for box, recognition in zip(boxes, recognitions):
+            if error:
+                # Error in face recognition
+                error_data = {
+                    "name": "Unknown",
+                    "error": str(error),
+                    "box": box,
+                }
+                recognized_people.append(error_data)
+
+                # Send Telegram notification for unrecognized face
+                message = f"❓ Unrecognized Face\nError: {str(error)}"
+                send_telegram_message(message, frame.snapshot())
+                continue
+
+            # Skip faces without a close enough gallery match
+            match = recognition.match
+            if match is None:
+                continue
+
+            # Try to find the matched face in the database
+            try:
+                # Resolve the id carried in the gallery match from the metadata cache
+                face_obj = face_metadata.get(match.face_id)
+
+                if face_obj:
+                    # Found matching face in database
+                    person_data = {
+                        "id": face_obj.id,
+                        "name": face_obj.name,
+                        "filename": face_obj.image_url,
+                        "confidence": match.distance,
+                        "box": box,
+                        "is_allowed": face_obj.is_allowed,  # Include allowed status
+                        "candidates": candidates_data(recognition),  # Nearest gallery faces
+                    }
+                    recognized_people.append(person_data)
+
+                    # Customize message based on allowed status
+                    access_status = "✅ ALLOWED" if face_obj.is_allowed else "⛔ DENIED"
+                    message = f"✨ Face Recognized!\nName: {face_obj.name}\nAccess: {access_status}\nConfidence: {100*(1 - match.distance):.2f}%"
+                    send_telegram_message(message, frame.snapshot())
+
+                else:
+                    # Found similar face but not in our database
+                    person_data = {
+                        "name": "Unknown (Match found but not in database)",
+                        "confidence": match.distance,
+                        "box": box,
+                        "is_allowed": False,  # Unknown faces are not allowed by default
+                        "candidates": candidates_data(recognition),
                     }
-                    recognized_people.append(error_data)
+                    recognized_people.append(person_data)
+
+                    # Send Telegram notification for unknown face
+                    message = "⚠️ Unknown Face Detected\nMatch found but not in database\nAccess: ⛔ DENIED"
+                    send_telegram_message(message, frame.snapshot())
 
-                    # Send Telegram notification for unrecognized face
-                    message = f"❓ Unrecognized Face\nError: {str(e)}"
-                    send_telegram_message_sync(message, temp_image_path)
+            except Exception as e:
+                # Error matching with database
+                error_data = {
+                    "name": "Error matching with database",
+                    "error": str(e),
+                    "box": box,
+                }
+                recognized_people.append(error_data)
 
-        # Clean up temporary image
-        if os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+                # Send Telegram notification for error
+                message = f"❌ Error in Face Recognition\nError: {str(e)}"
+                send_telegram_message(message)
 
         # Return recognition results as JSON
         return JsonResponse(
@@ -219,6 +282,78 @@ class FaceRecognitionView(LoginRequiredMixin, View):
         return JsonResponse({"error": "Invalid request"}, status=400)
 
 
+class CaptureProfileView(View):
+    """
+    Capture profile for browser clients.
+
+    Tells the webcam page how large to capture frames and how to compress
+    them for the selected model, so no pixels are uploaded that the
+    detector would throw away. No authentication is required.
+    """
+
+    def get(self, request):
+        """
+        Report the capture size and JPEG quality for a model.
+
+        Args:
+            request: The HTTP request, with an optional ``model`` parameter
+
+        Returns:
+            JsonResponse: Capture profile in JSON format
+        """
+        model_key = resolve_model_key(request.GET.get("model", "yolov8n"))
+        return JsonResponse({"model": model_key, **capture_profile(registry.get(model_key).imgsz)})
+
+
+class ReadyView(View):
+    """
+    Readiness probe for load balancers.
+
+    Returns 200 once the models have been preloaded and warmed up on this
+    worker, and 503 until then. No authentication is required.
+    """
+
+    def get(self, request):
+        """
+        Report the warm-up status of this worker.
+
+        Args:
+            request: The HTTP request
+
+        Returns:
+            JsonResponse: Readiness report in JSON format
+        """
+        status = 200 if readiness.is_ready else 503
+        return JsonResponse(readiness.status(), status=status)
+
+
+class StatsView(LoginRequiredMixin, View):
+    """
+    Model cache, batching and upload statistics of this worker.
+
+    The same counters as ``/api/faces/stats`` on the FastAPI app, for the
+    parts of the pipeline the Django views use.
+    """
+
+    def get(self, request):
+        """
+        Report the statistics of this worker.
+
+        Args:
+            request: The HTTP request
+
+        Returns:
+            JsonResponse: Model registry, batching and upload counters in JSON format
+        """
+        return JsonResponse(
+            {
+                "models": registry.stats(),
+                "batching": detection_batcher.stats(),
+                "uploads": upload_totals.stats(),
+            }
+        )
+
+
 # Face CRUD Operations
 class FaceListView(LoginRequiredMixin, ListView):
     """
@@ -247,7 +382,41 @@ class FaceListView(LoginRequiredMixin, ListView):
         return context
 
 
-class FaceCreateView(LoginRequiredMixin, CreateView):
+class FaceEnrollmentMixin:
+    """
+    Enrollment support for the face create and update views.
+
+    When a new image is uploaded, the face is detected, aligned, cropped and
+    embedded once, and the result is stored on the Face instance.
+    """
+
+    def enroll(self, form):
+        """
+        Enroll the uploaded image, if the form contains a new one.
+
+        Args:
+            form: The validated face form
+
+        Returns:
+            bool: False if no face could be enrolled (an error is added to the form)
+        """
+        if "image" not in form.changed_data:
+            return True
+
+        image = form.cleaned_data["image"]
+        try:
+            enrollment = enroll_bytes(image.read())
+        except ValueError as e:
+            form.add_error("image", str(e))
+            return False
+        finally:
+            image.seek(0)  # The image file itself is still saved by the form
+
+        apply_enrollment(form.instance, enrollment)
+        return True
+
+
+class FaceCreateView(LoginRequiredMixin, FaceEnrollmentMixin, CreateView):
     """
     View for adding new faces to the system.
 
@@ -279,7 +448,7 @@ class FaceCreateView(LoginRequiredMixin, CreateView):
         """
         Process valid form data.
 
-        Creates a new face entry and displays a success message.
+        Enrolls the face, creates a new face entry and displays a success message.
 
         Args:
             form: The validated form
@@ -287,11 +456,15 @@ class FaceCreateView(LoginRequiredMixin, CreateView):
         Returns:
             HttpResponse: Response with success message
         """
+        if not self.enroll(form):
+            return self.form_invalid(form)
         messages.success(self.request, "Face added successfully!")
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        sync_gallery(self.object)  # Add the new embedding to the gallery
+        return response
 
 
-class FaceUpdateView(LoginRequiredMixin, UpdateView):
+class FaceUpdateView(LoginRequiredMixin, FaceEnrollmentMixin, UpdateView):
     """
     View for updating existing faces.
 
@@ -323,7 +496,7 @@ class FaceUpdateView(LoginRequiredMixin, UpdateView):
         """
         Process valid form data.
 
-        Updates the face entry and displays a success message.
+        Re-enrolls a replaced image, updates the face entry and displays a success message.
 
         Args:
             form: The validated form
@@ -331,8 +504,12 @@ class FaceUpdateView(LoginRequiredMixin, UpdateView):
         Returns:
             HttpResponse: Response with success message
         """
+        if not self.enroll(form):
+            return self.form_invalid(form)
         messages.success(self.request, "Face updated successfully!")
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        sync_gallery(self.object)  # Update the embedding and access flag in place
+        return response
 
 
 class FaceDeleteView(LoginRequiredMixin, DeleteView):
@@ -362,6 +539,22 @@ class FaceDeleteView(LoginRequiredMixin, DeleteView):
         messages.success(self.request, "Face deleted successfully!")
         return super().delete(request, *args, **kwargs)
 
+    def form_valid(self, form):
+        """
+        Delete the face and drop it from the recognition gallery.
+
+        Args:
+            form: The (empty) confirmation form
+
+        Returns:
+            HttpResponse: Redirect to the success URL
+        """
+        face_id = self.object.pk  # Cleared by delete()
+        response = super().form_valid(form)
+        faces_gallery.remove(face_id)
+        face_metadata.invalidate()
+        return response
+
 
 class FaceDetailView(LoginRequiredMixin, TemplateView):
     """
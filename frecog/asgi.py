@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from recognition.warmup import start_warmup
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'frecog.settings')
 
 application = get_asgi_application()
+
+# Preload and warm up models so the first request is not served cold
+start_warmup()
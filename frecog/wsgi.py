@@ -11,6 +11,11 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from recognition.warmup import start_warmup
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'frecog.settings')
 
 application = get_wsgi_application()
+
+# Preload and warm up models so the first request is not served cold
+start_warmup()
@@ -0,0 +1,224 @@
+"""
+Long-running ingestion of a video file, RTSP stream or camera.
+
+    python ingest.py rtsp://camera.local/stream --fps 5
+    python ingest.py recording.mp4 --model yolov8n-face
+
+Frames are decoded in their own thread. Frames between samples are only
+grabbed, not converted, and detection runs on INGEST_TARGET_FPS samples
+per second of video. Live sources keep just the newest sample, so a slow
+detector drops samples instead of lagging behind the camera. Files are
+read no faster than they are processed, so nothing is dropped. With
+MOTION_GATE_ENABLED, samples without motion skip detection. Faces are
+tracked and recognized like on /api/faces/stream. Visits are logged and
+notifications queued when a track's identity is first known or changes;
+with EVENTS_SHARED, open dashboards see the visits as they are logged.
+
+Decode, sample, inference and drop rates are printed every ``--report``
+seconds, to size how many cameras one core can serve.
+"""
+
+import argparse
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from config import settings
+from database import SessionLocal, init_db
+from recognition.batching import detect
+from recognition.decoding import UploadedFrame
+from recognition.motion import MotionGate
+from recognition.notifications import notifier, send_telegram_message
+from recognition.registry import FACE_MODELS, resolve_face_model_key
+from recognition.tracking import Tracker
+from routes.events import share_events
+from routes.faces import log_visits, recognize_tracked
+
+logger = logging.getLogger("ingest")
+
+RECONNECT_DELAY = 2.0  # seconds between attempts to reopen a live source
+
+
+class FrameReader(threading.Thread):
+    """
+    Decodes a ``cv2.VideoCapture`` source and samples it at ``fps``.
+
+    Samples are timed by the video's own timestamps for files and by the
+    wall clock for live sources, which are reopened when they drop.
+    """
+
+    def __init__(self, source: Union[str, int], fps: float, live: bool):
+        super().__init__(name="frame-reader", daemon=True)
+        self.source = source
+        self.interval = 1 / fps if fps > 0 else 0
+        self.live = live
+        self._samples: queue.Queue = queue.Queue(maxsize=1)
+        self._stopping = threading.Event()
+        self.finished = threading.Event()
+        self.decoded = 0
+        self.sampled = 0
+        self.dropped = 0
+
+    def stop(self):
+        self._stopping.set()
+
+    def get(self, timeout: float) -> Optional[np.ndarray]:
+        """Next sampled frame, or None if none arrived within ``timeout``."""
+        try:
+            return self._samples.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, img: np.ndarray):
+        if not self.live:
+            # Files wait for the detector instead of dropping samples
+            while not self._stopping.is_set():
+                try:
+                    self._samples.put(img, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            return
+        try:
+            self._samples.get_nowait()
+            self.dropped += 1  # the detector never got to the previous sample
+        except queue.Empty:
+            pass
+        self._samples.put_nowait(img)
+
+    def run(self):
+        capture = cv2.VideoCapture(self.source)
+        next_sample = 0.0
+        try:
+            while not self._stopping.is_set():
+                if not capture.grab():
+                    if not self.live:
+                        break
+                    logger.warning("Lost %s, reconnecting in %.0fs", self.source, RECONNECT_DELAY)
+                    capture.release()
+                    self._stopping.wait(RECONNECT_DELAY)
+                    capture = cv2.VideoCapture(self.source)
+                    continue
+                self.decoded += 1
+                now = time.monotonic() if self.live else capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                if now < next_sample:
+                    continue  # skipped: grabbed but never converted to BGR
+                next_sample = max(next_sample + self.interval, now)
+                ok, img = capture.retrieve()
+                if ok:
+                    self.sampled += 1
+                    self._offer(img)
+        finally:
+            capture.release()
+            self.finished.set()
+
+
+def visit_message(visit: dict) -> str:
+    """Notification text for a logged visit, worded like the Django view's."""
+    if visit["face_id"] is None:
+        return "⚠️ Unknown Face Detected\nAccess: ⛔ DENIED"
+    access_status = "✅ ALLOWED" if visit["is_allowed"] else "⛔ DENIED"
+    return f"✨ Face Recognized!\nName: {visit['person_name']}\nAccess: {access_status}\nConfidence: {visit['confidence']}"
+
+
+class IngestStats:
+    """Counters of the inference loop, reported as rates since the last report."""
+
+    def __init__(self, reader: FrameReader, gate: Optional[MotionGate] = None):
+        self.reader = reader
+        self.gate = gate
+        self.processed = 0
+        self.faces = 0
+        self.inference_s = 0.0
+        self._last = (time.monotonic(), 0, 0, 0, 0, 0.0)
+
+    def report(self) -> str:
+        now = time.monotonic()
+        last_time, decoded, sampled, dropped, processed, inference_s = self._last
+        elapsed = max(now - last_time, 1e-9)
+        frames = self.processed - processed
+        ms = 1000 * (self.inference_s - inference_s) / frames if frames else 0.0
+        self._last = (now, self.reader.decoded, self.reader.sampled, self.reader.dropped, self.processed, self.inference_s)
+        return (
+            f"decode {(self.reader.decoded - decoded) / elapsed:.1f} fps | "
+            f"sampled {(self.reader.sampled - sampled) / elapsed:.1f} fps | "
+            f"processed {frames / elapsed:.1f} fps | "
+            f"dropped {(self.reader.dropped - dropped) / elapsed:.1f} fps | "
+            f"inference {ms:.1f} ms/frame ({1000 / ms if ms else 0:.1f} fps per worker) | "
+            f"faces {self.faces}"
+            + (f" | motion skipped {100 * self.gate.skipped_ratio:.0f}%" if self.gate else "")
+        )
+
+
+def ingest(source: Union[str, int], model: str, fps: float, notify: bool = True, report_every: float = 10.0):
+    """Run the ingestion loop until the source ends or the process is interrupted."""
+    model = resolve_face_model_key(model)
+    live = not (isinstance(source, str) and os.path.isfile(source))
+    reader = FrameReader(source, fps, live)
+    tracker = Tracker()
+    gate = MotionGate() if settings.MOTION_GATE_ENABLED else None
+    stats = IngestStats(reader, gate)
+    next_report = time.monotonic() + report_every
+    reader.start()
+    try:
+        while True:
+            finished = reader.finished.is_set()  # before get, so no last sample is missed
+            img = reader.get(timeout=0.5)
+            if img is None and finished:
+                break
+            if img is not None:
+                start = time.perf_counter()
+                if gate is not None and not gate.moving(img):
+                    stats.inference_s += time.perf_counter() - start
+                    stats.processed += 1
+                    continue
+                frame = UploadedFrame.from_image(img)
+                outcome = recognize_tracked(frame, detect(model, img), tracker)
+                stats.inference_s += time.perf_counter() - start
+                stats.processed += 1
+                stats.faces += len(outcome.results)
+                if outcome.visits:
+                    db = SessionLocal()
+                    try:
+                        log_visits(db, outcome.visits)
+                    finally:
+                        db.close()
+                    if notify:
+                        for visit in outcome.visits:
+                            send_telegram_message(visit_message(visit), frame.snapshot())
+            if time.monotonic() >= next_report:
+                logger.info(stats.report())
+                next_report += report_every
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.stop()
+        logger.info("finished: %s", stats.report())
+        if not notifier.drain(timeout=30):
+            logger.warning("Exiting with unsent notifications: %s", notifier.stats())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recognize faces in a video file, RTSP stream or camera")
+    parser.add_argument("source", help="video file, stream URL, or camera index")
+    parser.add_argument("--model", default=settings.GALLERY_DETECTOR, choices=FACE_MODELS, help="face detection model")
+    parser.add_argument("--fps", type=float, default=settings.INGEST_TARGET_FPS, help="frames detected per second of video")
+    parser.add_argument("--report", type=float, default=10.0, help="seconds between rate reports")
+    parser.add_argument("--no-notify", action="store_true", help="log visits without sending notifications")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    init_db()
+    share_events()  # visits reach the dashboards served by the API workers
+    source = int(args.source) if args.source.isdigit() else args.source
+    ingest(source, args.model, args.fps, notify=not args.no_notify, report_every=args.report)
+
+
+if __name__ == "__main__":
+    main()
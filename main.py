@@ -0,0 +1,46 @@
+"""
+FastAPI application entry point.
+"""
+
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+
+from config import settings
+from database import init_db
+from recognition.events import event_broker
+from recognition.executor import inference_executor
+from recognition.warmup import start_warmup
+from routes import auth, events, faces, frontend, health, visits
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create tables and start model warm-up before serving requests."""
+    init_db()
+    events.share_events()
+    start_warmup()
+    yield
+    event_broker.close()
+    inference_executor.shutdown(wait=False)
+    faces.faces_gallery.persist()
+
+
+app = FastAPI(title=settings.PROJECT_NAME, debug=settings.DEBUG, lifespan=lifespan)
+
+app.include_router(auth.router)
+app.include_router(faces.router)
+app.include_router(visits.router)
+app.include_router(events.router)
+app.include_router(health.router)
+app.include_router(frontend.router)
+
+settings.MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
+app.mount(settings.MEDIA_URL.rstrip("/"), StaticFiles(directory=settings.MEDIA_ROOT), name="media")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("main:app", host="0.0.0.0", port=8000)
@@ -2,7 +2,7 @@
 SQLAlchemy models for the face recognition system.
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, LargeBinary
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, LargeBinary, Text
 from sqlalchemy.sql import func
 from database import Base
 from passlib.context import CryptContext
@@ -42,6 +42,10 @@ class Face(Base):
     name = Column(String(100), nullable=False, index=True)
     image = Column(String(500), nullable=False)  # Path to image file
     is_allowed = Column(Boolean, default=True)
+    crop = Column(LargeBinary, nullable=True)  # Aligned face crop (JPEG) computed at enrollment
+    embedding = Column(LargeBinary, nullable=True)  # float32 embedding of the crop
+    embedding_model = Column(String(100), nullable=True)  # e.g. "Facenet/onnx"
+    embedding_version = Column(String(100), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -57,3 +61,15 @@ class Visit(Base):
     confidence = Column(String(50))
     is_allowed = Column(Boolean, default=False)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DashboardEvent(Base):
+    """Dashboard event shared between workers, see ``recognition.events``."""
+    
+    __tablename__ = "events"
+    __table_args__ = {"sqlite_autoincrement": True}  # never reuse ids, even after trimming every row
+    
+    id = Column(Integer, primary_key=True)
+    type = Column(String(20), nullable=False)
+    data = Column(Text, nullable=False)  # JSON
+    created = Column(Float, nullable=False, index=True)  # time.time(), for trimming
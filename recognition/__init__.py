@@ -0,0 +1 @@
+"""Recognition pipeline components shared by the Flask, Django and FastAPI apps."""
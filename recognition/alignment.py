@@ -0,0 +1,127 @@
+"""
+Face alignment for detected faces.
+
+The eye positions come from the 5-point landmarks that the ``*-face`` YOLO
+models output with every box. For models without landmarks, dlib's
+68-point predictor (loaded once per process) is run on the box the
+detector already found, without a second face detection. The face is
+then rotated about the eye midpoint so the eyes are horizontal. The
+rotation and crop are kept as one affine transform (``AlignedFace``) that
+the embedding stage applies together with its resize.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from config import settings
+
+MAX_ROLL_DEGREES = 45
+
+
+@lru_cache(maxsize=1)
+def get_landmark_predictor():
+    """Return the 68-point landmark predictor, loaded once per process."""
+    import dlib
+
+    return dlib.shape_predictor(str(settings.LANDMARK_PREDICTOR_PATH))
+
+
+def eyes_from_keypoints(keypoints: Optional[np.ndarray]) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """Image-left and image-right eye from YOLO face keypoints (eyes first)."""
+    if keypoints is None or len(keypoints) < 2:
+        return None
+    eyes = np.asarray(keypoints[:2], np.float32)
+    if not np.all(eyes > 0):  # YOLO reports invisible keypoints as (0, 0)
+        return None
+    left, right = sorted(eyes, key=lambda point: point[0])
+    return left, right
+
+
+def eyes_from_landmarks(img: np.ndarray, box) -> Optional[tuple[np.ndarray, np.ndarray]]:
+    """Eye centres from the dlib 68-point predictor run on a known face box."""
+    import dlib
+
+    x1, y1, x2, y2 = (int(v) for v in box)
+    x1, y1 = max(x1, 0), max(y1, 0)
+    # Only the box is converted; the predictor sees it as a face filling the image
+    gray = cv2.cvtColor(img[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    shape = get_landmark_predictor()(gray, dlib.rectangle(0, 0, w - 1, h - 1))
+    points = np.array([(shape.part(i).x + x1, shape.part(i).y + y1) for i in range(36, 48)], np.float32)
+    # Points 36-41 outline the image-left eye, 42-47 the image-right eye
+    return points[:6].mean(0), points[6:].mean(0)
+
+
+@dataclass
+class AlignedFace:
+    """
+    A detected face as its source frame and the transform that levels it.
+
+    ``matrix`` maps frame pixels onto a ``width`` x ``height`` crop of the
+    face box with the eyes rotated level. Nothing is copied until
+    ``crop()`` is called, so the embedding stage can fold its own resize
+    into the same warp.
+    """
+
+    img: np.ndarray
+    matrix: np.ndarray  # 2x3 affine, frame -> aligned crop
+    width: int
+    height: int
+
+    @property
+    def size(self) -> int:
+        """Pixel count of the crop, 0 for an empty box (like ``ndarray.size``)."""
+        return self.width * self.height
+
+    def crop(self) -> np.ndarray:
+        """Materialize the aligned crop."""
+        return cv2.warpAffine(self.img, self.matrix, (self.width, self.height), borderMode=cv2.BORDER_REPLICATE)
+
+
+def align_face_box(img: np.ndarray, box, keypoints: Optional[np.ndarray] = None) -> AlignedFace:
+    """
+    Transform that crops ``box`` out of ``img`` with the eyes rotated level.
+
+    Uses ``keypoints`` when the detector provided them and the landmark
+    predictor otherwise. Falls back to a plain crop when no plausible eyes
+    are found, so alignment never drops a face.
+    """
+    x1, y1, x2, y2 = (int(v) for v in box)
+    width, height = max(x2 - x1, 0), max(y2 - y1, 0)
+    # Plain crop: translate the box's top-left corner to the output origin
+    matrix = np.array([[1, 0, -x1], [0, 1, -y1]], np.float64)
+    if not width or not height:
+        return AlignedFace(img, matrix, width, height)
+
+    eyes = eyes_from_keypoints(keypoints)
+    if eyes is None:
+        try:
+            eyes = eyes_from_landmarks(img, (x1, y1, x2, y2))
+        except Exception:
+            eyes = None  # dlib or the predictor file is unavailable
+    if eyes is not None:
+        (lx, ly), (rx, ry) = eyes
+        angle = np.degrees(np.arctan2(ry - ly, rx - lx))
+        if abs(angle) <= MAX_ROLL_DEGREES:  # else implausible, e.g. a person box from a general model
+            centre = (float(lx + rx) / 2, float(ly + ry) / 2)
+            matrix = cv2.getRotationMatrix2D(centre, angle, 1.0)
+            matrix[:, 2] -= (x1, y1)
+    return AlignedFace(img, matrix, width, height)
+
+
+def align_crop(img: np.ndarray, box, keypoints: Optional[np.ndarray] = None) -> np.ndarray:
+    """Aligned crop of one face box, see ``align_face_box``."""
+    return align_face_box(img, box, keypoints).crop()
+
+
+def align_detections(img: np.ndarray, detections) -> list[AlignedFace]:
+    """Alignment transforms of every detected face, in detection order."""
+    keypoints = detections.keypoints
+    return [
+        align_face_box(img, box, None if keypoints is None else keypoints[i])
+        for i, box in enumerate(detections.boxes)
+    ]
@@ -0,0 +1,123 @@
+"""
+Cross-request dynamic micro-batching for YOLO detection.
+
+Frames submitted for the same model within a short window are stacked into
+a single inference call, which amortises per-call overhead on CPU-only
+hosts. A batch is dispatched as soon as it reaches ``max_batch`` frames or
+the window since its first frame expires, so the added latency is bounded
+by the window.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from config import settings
+from recognition.registry import get_model, resolve_model_key
+
+
+class MicroBatcher:
+    """Collects frames per model key and runs them through one batched call.
+
+    Results are the per-frame ``Detections`` returned by the detector backend.
+    """
+
+    def __init__(
+        self,
+        window_ms: float,
+        max_batch: int,
+        model_getter: Callable[[str], object] = get_model,
+    ):
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._model_getter = model_getter
+        self._queues: dict[str, queue.Queue] = {}
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+        self.largest_batch = 0
+
+    def submit(self, key: Optional[str], img) -> Future:
+        """Queue a frame for detection and return a future for its result."""
+        key = resolve_model_key(key)
+        future: Future = Future()
+        self._queue_for(key).put((img, future))
+        return future
+
+    def detect(self, key: Optional[str], img, timeout: Optional[float] = None):
+        """Detect on one frame, blocking until its batch has run."""
+        return self.submit(key, img).result(timeout)
+
+    def _queue_for(self, key: str) -> queue.Queue:
+        with self._lock:
+            q = self._queues.get(key)
+            if q is None:
+                q = self._queues[key] = queue.Queue()
+                threading.Thread(
+                    target=self._worker, args=(key, q), name=f"batcher-{key}", daemon=True
+                ).start()
+            return q
+
+    def _collect(self, q: queue.Queue) -> list:
+        """Block for a first frame, then gather more until the window closes."""
+        batch = [q.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self, key: str, q: queue.Queue):
+        while True:
+            batch = self._collect(q)
+            pending = [(img, fut) for img, fut in batch if fut.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+            try:
+                model = self._model_getter(key)
+                results = model([img for img, _ in pending])
+            except Exception as e:
+                for _, fut in pending:
+                    fut.set_exception(e)
+                continue
+
+            with self._lock:
+                self.batches += 1
+                self.frames += len(pending)
+                self.largest_batch = max(self.largest_batch, len(pending))
+            for (_, fut), result in zip(pending, results):
+                fut.set_result(result)
+
+    def stats(self) -> dict:
+        """Batch counters across all model keys."""
+        with self._lock:
+            return {
+                "enabled": settings.BATCH_ENABLED,
+                "window_ms": self.window * 1000.0,
+                "max_batch": self.max_batch,
+                "batches": self.batches,
+                "frames": self.frames,
+                "mean_batch": round(self.frames / self.batches, 2) if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "pending": {key: q.qsize() for key, q in self._queues.items()},
+            }
+
+
+detection_batcher = MicroBatcher(
+    window_ms=settings.BATCH_WINDOW_MS,
+    max_batch=settings.BATCH_MAX_SIZE,
+)
+
+
+def detect(key: Optional[str], img):
+    """Run detection on one frame, through the batcher when it is enabled."""
+    if settings.BATCH_ENABLED:
+        return detection_batcher.detect(key, img)
+    return get_model(key)([img])[0]
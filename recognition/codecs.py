@@ -0,0 +1,289 @@
+"""
+Compact encodings for gallery embeddings.
+
+Every codec turns L2-normalized float32 vectors into fixed-width rows of
+bytes, and scores probes against those rows without decoding the whole
+gallery first:
+
+* ``float32`` - the vectors as they are (4 bytes per dimension)
+* ``float16`` - half precision (2 bytes per dimension)
+* ``int8``    - per-vector symmetric int8 with a float32 scale (1 byte per
+  dimension plus 4)
+* ``pq``      - product quantization: the vector is split into
+  GALLERY_PQ_SUBSPACES chunks, each replaced by the index of its nearest
+  of 256 trained centroids (1 byte per chunk). Probes are scored with
+  asymmetric distance computation: one lookup table of probe-to-centroid
+  similarities per probe, summed over the codes.
+
+Compare memory per identity and accuracy against float32 with::
+
+    python -m recognition.codecs bench --size 100000
+"""
+
+import argparse
+import io
+import time
+from typing import Optional
+
+import numpy as np
+
+CHUNK = 65536  # gallery rows scored at a time, bounds temporary memory
+
+
+class Codec:
+    """Identity float32 encoding; subclasses override the conversions."""
+
+    name = "float32"
+
+    @property
+    def signature(self) -> str:
+        """Name plus any parameters that change the layout of the codes."""
+        return self.name
+
+    def width(self, dim: int) -> int:
+        """Bytes per encoded vector."""
+        return 4 * dim
+
+    def dimension(self, width: int) -> Optional[int]:
+        """Vector dimension of ``width``-byte codes, or None if this codec cannot have written them."""
+        return width // 4 if width % 4 == 0 else None
+
+    def fit(self, vectors: np.ndarray):
+        """Train on the gallery; only quantizers with codebooks need it."""
+
+    def needs_fit(self, size: int) -> bool:
+        """Whether a gallery of ``size`` vectors should be re-encoded from scratch."""
+        return False
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(vectors, np.float32).view(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(codes).view(np.float32)
+
+    def _score(self, probes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        return probes @ self.decode(codes).T
+
+    def similarity(self, probes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every probe to every encoded row."""
+        out = np.empty((len(probes), len(codes)), np.float32)
+        for start in range(0, len(codes), CHUNK):
+            out[:, start : start + CHUNK] = self._score(probes, codes[start : start + CHUNK])
+        return out
+
+    def state(self) -> bytes:
+        """Serialised training state, stored alongside the codes."""
+        return b""
+
+    def load_state(self, state: bytes):
+        pass
+
+
+class Float16Codec(Codec):
+    name = "float16"
+
+    def width(self, dim: int) -> int:
+        return 2 * dim
+
+    def dimension(self, width: int) -> Optional[int]:
+        return width // 2 if width % 2 == 0 else None
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(vectors, np.float16).view(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(codes).view(np.float16).astype(np.float32)
+
+
+class Int8Codec(Codec):
+    """Symmetric int8 per vector; the float32 scale follows the int8 values."""
+
+    name = "int8"
+
+    def width(self, dim: int) -> int:
+        return dim + 4
+
+    def dimension(self, width: int) -> Optional[int]:
+        return width - 4 if width > 4 else None
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, np.float32)
+        scale = np.maximum(np.abs(vectors).max(1, keepdims=True), 1e-12) / 127
+        codes = np.empty((len(vectors), self.width(vectors.shape[1])), np.uint8)
+        codes[:, :-4] = np.round(vectors / scale).astype(np.int8).view(np.uint8)
+        codes[:, -4:] = scale.astype(np.float32).view(np.uint8)
+        return codes
+
+    def _split(self, codes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        values = codes[:, :-4].view(np.int8)
+        scale = np.ascontiguousarray(codes[:, -4:]).view(np.float32)[:, 0]
+        return values, scale
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        values, scale = self._split(codes)
+        return values.astype(np.float32) * scale[:, None]
+
+    def _score(self, probes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        values, scale = self._split(codes)
+        return (probes @ values.T.astype(np.float32)) * scale
+
+
+class PQCodec(Codec):
+    """Product quantization with asymmetric distance computation."""
+
+    name = "pq"
+    ksub = 256  # centroids per subspace, so every code is one byte
+
+    def __init__(self, subspaces: int = 16):
+        self.subspaces = subspaces
+        self.codebooks = None  # (subspaces, ksub, dim // subspaces)
+        self.trained_size = 0
+
+    @property
+    def signature(self) -> str:
+        return f"{self.name}{self.subspaces}"
+
+    def width(self, dim: int) -> int:
+        return self.subspaces
+
+    def dimension(self, width: int) -> Optional[int]:
+        # Needs the codebooks from load_state, which give the sub-vector length
+        if self.codebooks is None or width != self.subspaces or len(self.codebooks) != self.subspaces:
+            return None
+        return self.subspaces * self.codebooks.shape[2]
+
+    def _chunks(self, vectors: np.ndarray) -> np.ndarray:
+        n, dim = vectors.shape
+        if dim % self.subspaces:
+            raise ValueError(f"dimension {dim} is not divisible by {self.subspaces} PQ subspaces")
+        return vectors.reshape(n, self.subspaces, dim // self.subspaces)
+
+    def fit(self, vectors: np.ndarray):
+        chunks = self._chunks(np.asarray(vectors, np.float32))
+        ksub = min(self.ksub, len(vectors))
+        books = []
+        for m in range(self.subspaces):
+            sub = chunks[:, m]
+            # Plain (not spherical) k-means: sub-vectors are not unit length
+            centroids = sub[np.random.default_rng(m).choice(len(sub), ksub, replace=False)].copy()
+            for _ in range(10):
+                nearest = self._nearest(sub, centroids)
+                counts = np.bincount(nearest, minlength=ksub)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, nearest, sub)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            books.append(centroids)
+        self.codebooks = np.stack(books).astype(np.float32)
+        self.trained_size = len(vectors)
+
+    def needs_fit(self, size: int) -> bool:
+        # Codebooks trained on a much smaller gallery quantize new faces poorly
+        return self.codebooks is None or size > 2 * self.trained_size
+
+    @staticmethod
+    def _nearest(sub: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+        return (sub @ centroids.T - 0.5 * (centroids**2).sum(1)).argmax(1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        chunks = self._chunks(np.asarray(vectors, np.float32))
+        codes = np.empty((len(vectors), self.subspaces), np.uint8)
+        for m in range(self.subspaces):
+            codes[:, m] = self._nearest(chunks[:, m], self.codebooks[m])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[m][codes[:, m]] for m in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def _score(self, probes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # Lookup tables of probe-chunk . centroid, shape (probes, subspaces, ksub)
+        tables = np.einsum("pmd,mkd->pmk", self._chunks(probes), self.codebooks)
+        columns = np.arange(self.subspaces)
+        return np.stack([table[columns, codes].sum(1) for table in tables])
+
+    def state(self) -> bytes:
+        if self.codebooks is None:
+            return b""
+        buffer = io.BytesIO()
+        np.savez(buffer, codebooks=self.codebooks, trained_size=self.trained_size)
+        return buffer.getvalue()
+
+    def load_state(self, state: bytes):
+        if not state:
+            self.codebooks, self.trained_size = None, 0
+            return
+        with np.load(io.BytesIO(state)) as data:
+            self.codebooks = data["codebooks"]
+            self.trained_size = int(data["trained_size"])
+
+
+CODECS = {codec.name: codec for codec in (Codec, Float16Codec, Int8Codec, PQCodec)}
+
+
+def make_codec(name: str, pq_subspaces: int = 16) -> Codec:
+    """Codec instance for a GALLERY_ENCODING name."""
+    if name not in CODECS:
+        raise ValueError(f"Unknown gallery encoding: {name}")
+    return PQCodec(pq_subspaces) if name == "pq" else CODECS[name]()
+
+
+def bench(size: int, queries: int = 1000, dim: int = 128, pq_subspaces: int = 16, threshold: float = 0.40) -> list[dict]:
+    """Memory per identity and accuracy of each encoding against float32 search."""
+    from recognition.ann import synthetic_embeddings  # ann builds on the codecs
+
+    rng = np.random.default_rng(size)
+    vectors = synthetic_embeddings(size, dim, rng)
+    picks = rng.integers(0, size, queries)
+    probes = vectors[picks] + rng.normal(scale=0.3 / np.sqrt(dim), size=(queries, dim)).astype(np.float32)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+
+    exact = probes @ vectors.T
+    truth = exact.argmax(1)
+    truth_distance = 1 - exact[np.arange(queries), truth]
+
+    rows = []
+    for name in CODECS:
+        codec = make_codec(name, pq_subspaces)
+        start = time.perf_counter()
+        codec.fit(vectors)
+        codes = codec.encode(vectors)
+        encode_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        similarity = codec.similarity(probes, codes)
+        search_ms = (time.perf_counter() - start) * 1000 / queries
+        found = similarity.argmax(1)
+        accepted = 1 - similarity[np.arange(queries), found] <= threshold
+        rows.append({
+            "encoding": name,
+            "bytes/identity": codes.shape[1] + len(codec.state()) / size,
+            "recall@1": round(float((found == truth).mean()), 4),
+            "distance_err": round(float(np.abs(1 - similarity[np.arange(queries), truth] - truth_distance).mean()), 5),
+            "same_decision": round(float((accepted == (truth_distance <= threshold)).mean()), 4),
+            "search_ms": round(search_ms, 3),
+            "encode_s": round(encode_s, 2),
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the compact gallery encodings")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench_cmd = sub.add_parser("bench", help="memory per identity and accuracy loss on synthetic embeddings")
+    bench_cmd.add_argument("--size", type=int, default=100_000)
+    bench_cmd.add_argument("--queries", type=int, default=1000)
+    bench_cmd.add_argument("--dim", type=int, default=128)
+    bench_cmd.add_argument("--pq-subspaces", type=int, default=16)
+    bench_cmd.add_argument("--threshold", type=float, default=0.40, help="match threshold for same_decision")
+    args = parser.parse_args(argv)
+
+    columns = ["encoding", "bytes/identity", "recall@1", "distance_err", "same_decision", "search_ms", "encode_s"]
+    print(" ".join(f"{c:>14s}" for c in columns))
+    for row in bench(args.size, args.queries, args.dim, args.pq_subspaces, args.threshold):
+        print(" ".join(f"{row[c]!s:>14s}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
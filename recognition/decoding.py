@@ -0,0 +1,200 @@
+"""
+Decode uploaded images only as large as each stage needs.
+
+Detection letterboxes every frame to the detector's input size (640 px),
+so a 12-megapixel upload is decoded at 1/2, 1/4 or 1/8 scale with
+libjpeg's DCT scaling (``IMREAD_REDUCED_COLOR_*``), as long as the reduced
+image still covers the detector input. Recognition then decodes the frame
+again only if the detected faces would be smaller than the embedding
+input at the detection scale, and only at the smallest scale that keeps
+them at least that large. Boxes are reported in original-image
+coordinates throughout.
+
+Notification snapshots are encoded from the detection-scale image, in
+memory and only when a notification is actually sent.
+
+Browser clients ask for a ``capture_profile`` and resize captures to the
+detector input before encoding them. ``upload_totals`` records the size,
+dimensions and decode time of every upload, to confirm that they do.
+"""
+
+import threading
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from config import settings
+from recognition.detectors import Detections
+from recognition.embedding import INPUT_SIZE
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Start-of-frame markers carry the image size; C4, C8 and CC are not SOF
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(data: bytes) -> Optional[tuple[int, int]]:
+    """(width, height) from a JPEG's frame header, without decoding it."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height = int.from_bytes(data[i + 5 : i + 7], "big")
+            width = int.from_bytes(data[i + 7 : i + 9], "big")
+            return width, height
+        if 0xD0 <= marker <= 0xD9 or marker == 0x01:  # markers without a length
+            i += 2
+            continue
+        i += 2 + int.from_bytes(data[i + 2 : i + 4], "big")
+    return None
+
+
+def reduction_for(long_side: int, needed: int) -> int:
+    """Largest DCT reduction that keeps ``long_side`` at least ``needed`` pixels."""
+    for factor in (8, 4, 2):
+        if long_side / factor >= needed:
+            return factor
+    return 1
+
+
+def capture_profile(detector_size: int) -> dict:
+    """Largest capture side and JPEG quality worth uploading to a detector with ``detector_size`` input."""
+    return {"max_side": detector_size, "jpeg_quality": settings.CAPTURE_JPEG_QUALITY}
+
+
+class UploadTotals:
+    """Bytes, dimensions and decode time of every upload decoded by the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.oversized = 0  # larger than the detector input, i.e. not resized by the client
+        self.bytes = 0
+        self.pixels = 0
+        self.decode_s = 0.0
+
+    def add(self, frame: "UploadedFrame", nbytes: int, detector_size: int):
+        with self._lock:
+            self.uploads += 1
+            self.oversized += frame.long_side > detector_size
+            self.bytes += nbytes
+            self.pixels += frame.width * frame.height
+            self.decode_s += frame.decode_s
+
+    def stats(self) -> dict:
+        with self._lock:
+            n = self.uploads or 1
+            return {
+                "uploads": self.uploads,
+                "oversized": self.oversized,
+                "mean_kb": round(self.bytes / n / 1024, 1),
+                "mean_megapixels": round(self.pixels / n / 1e6, 3),
+                "mean_decode_ms": round(1000 * self.decode_s / n, 2),
+            }
+
+
+upload_totals = UploadTotals()
+
+
+class UploadedFrame:
+    """
+    An uploaded image, decoded lazily at the reductions that are asked for.
+
+    ``image`` is the detection-scale decode. ``scale`` converts its pixel
+    coordinates to the original image, which is ``width`` x ``height``.
+    """
+
+    def __init__(self, data: bytes, detector_size: int):
+        self._buffer = np.frombuffer(data, np.uint8)
+        self._images: dict[int, np.ndarray] = {}
+        self._snapshot: Optional[bytes] = None
+        self.decode_s = 0.0
+        size = jpeg_size(data) if settings.DECODE_DOWNSCALE else None
+        self.factor = reduction_for(max(size), detector_size) if size else 1
+        self.image = self._decode(self.factor)
+        # EXIF rotation may swap the axes, so compare long sides
+        self.long_side = max(size) if size else max(self.image.shape[:2])
+        self.scale = self.long_side / max(self.image.shape[:2])
+        self.width = round(self.image.shape[1] * self.scale)
+        self.height = round(self.image.shape[0] * self.scale)
+
+    @classmethod
+    def from_image(cls, img: np.ndarray) -> "UploadedFrame":
+        """A frame that is already decoded, e.g. read from a video source."""
+        frame = cls.__new__(cls)
+        frame._buffer = None
+        frame._images = {1: img}
+        frame._snapshot = None
+        frame.decode_s = 0.0
+        frame.factor = 1
+        frame.image = img
+        frame.long_side = max(img.shape[:2])
+        frame.scale = 1.0
+        frame.height, frame.width = img.shape[:2]
+        return frame
+
+    def _decode(self, factor: int) -> np.ndarray:
+        if factor not in self._images:
+            start = time.perf_counter()
+            img = cv2.imdecode(self._buffer, REDUCED_FLAGS[factor])
+            self.decode_s += time.perf_counter() - start
+            if img is None:
+                raise ValueError("Invalid image")
+            self._images[factor] = img
+        return self._images[factor]
+
+    def for_faces(self, detections: Detections) -> tuple[np.ndarray, Detections]:
+        """
+        Image to crop faces from, and the detections in its coordinates.
+
+        ``detections`` are in original-image coordinates. Faces are
+        re-extracted from a larger decode only when they would fall below
+        the embedding input size at the detection scale.
+        """
+        if len(detections):
+            boxes = detections.boxes
+            smallest = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]).min()
+            factor = reduction_for(int(smallest), max(INPUT_SIZE))
+        else:
+            factor = self.factor
+        image = self.image if factor >= self.factor else self._decode(factor)
+        return image, detections.scaled(max(image.shape[:2]) / self.long_side)
+
+    def snapshot(self) -> bytes:
+        """
+        The frame as a JPEG for notifications, encoded on first use.
+
+        Downscaled to NOTIFY_IMAGE_MAX_SIDE and kept in memory, so requests
+        that notify nobody encode nothing and nothing touches disk.
+        """
+        if self._snapshot is None:
+            img = self.image
+            scale = settings.NOTIFY_IMAGE_MAX_SIDE / max(img.shape[:2])
+            if scale < 1:
+                img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, settings.NOTIFY_IMAGE_QUALITY])
+            if not ok:
+                raise ValueError("Cannot encode notification image")
+            self._snapshot = encoded.tobytes()
+        return self._snapshot
+
+
+def decode_upload(data: bytes, detector_size: int) -> UploadedFrame:
+    """Decode an upload for a detector with ``detector_size`` input; raises ValueError if unreadable."""
+    frame = UploadedFrame(data, detector_size)
+    upload_totals.add(frame, len(data), detector_size)
+    return frame
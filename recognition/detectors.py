@@ -0,0 +1,324 @@
+"""
+Pluggable face detector backends.
+
+``TorchDetector`` wraps the ultralytics PyTorch runtime. ``OnnxDetector``
+runs the same weights exported to ONNX (optionally INT8-quantized) through
+ONNX Runtime, which is considerably faster on CPU-only hosts; set
+``ONNX_PROVIDERS`` to ``OpenVINOExecutionProvider,CPUExecutionProvider`` to
+run it through OpenVINO instead. Both return ``Detections`` with boxes in
+source-image pixel coordinates, so callers do not care which one is active.
+
+Exported artifacts are cached under ``ONNX_CACHE_DIR``. To export ahead of
+time or compare a backend against PyTorch::
+
+    python -m recognition.detectors export yolov8n-face --int8
+    python -m recognition.detectors compare yolov8n-face media/faces --int8
+"""
+
+import argparse
+import ast
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+import cv2
+import numpy as np
+
+from config import settings
+from recognition.onnx_utils import create_session, quantize
+
+
+@dataclass
+class Detections:
+    """Detections for one frame, in source-image pixel coordinates."""
+
+    boxes: np.ndarray  # (N, 4) x1, y1, x2, y2
+    scores: np.ndarray  # (N,)
+    keypoints: Optional[np.ndarray] = None  # (N, K, 2) for models with landmarks
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def scaled(self, factor: float) -> "Detections":
+        """The same detections with coordinates multiplied by ``factor``."""
+        return Detections(
+            boxes=self.boxes * factor,
+            scores=self.scores,
+            keypoints=None if self.keypoints is None else self.keypoints * factor,
+        )
+
+    def select(self, indices) -> "Detections":
+        """The detections at ``indices``, in that order."""
+        indices = np.asarray(indices, np.intp)
+        return Detections(
+            boxes=self.boxes[indices],
+            scores=self.scores[indices],
+            keypoints=None if self.keypoints is None else self.keypoints[indices],
+        )
+
+    @classmethod
+    def empty(cls) -> "Detections":
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32))
+
+    @classmethod
+    def from_ultralytics(cls, result) -> "Detections":
+        """Convert an ultralytics ``Results`` object."""
+        keypoints = None
+        if getattr(result, "keypoints", None) is not None:
+            keypoints = result.keypoints.xy.cpu().numpy().astype(np.float32)
+        return cls(
+            boxes=result.boxes.xyxy.cpu().numpy().astype(np.float32),
+            scores=result.boxes.conf.cpu().numpy().astype(np.float32),
+            keypoints=keypoints,
+        )
+
+
+class TorchDetector:
+    """Detector backed by the ultralytics PyTorch runtime."""
+
+    backend = "torch"
+
+    def __init__(self, weights: str):
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.imgsz = 640
+
+    @property
+    def nbytes(self) -> int:
+        return sum(p.numel() * p.element_size() for p in self.model.model.parameters())
+
+    def __call__(self, imgs: Sequence[np.ndarray]) -> list[Detections]:
+        results = self.model(list(imgs), verbose=False)
+        return [Detections.from_ultralytics(r) for r in results]
+
+
+def letterbox(img: np.ndarray, size: int) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """Resize and pad to a square input the way ultralytics does."""
+    h, w = img.shape[:2]
+    gain = min(size / h, size / w)
+    new_w, new_h = int(round(w * gain)), int(round(h * gain))
+    dw, dh = (size - new_w) / 2, (size - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, gain, (left, top)
+
+
+class OnnxDetector:
+    """Detector running an exported YOLO graph through ONNX Runtime."""
+
+    backend = "onnx"
+
+    def __init__(
+        self,
+        onnx_path: str,
+        conf: float = 0.25,
+        iou: float = 0.7,
+        max_det: int = 300,
+        providers: Optional[list[str]] = None,
+    ):
+        self.session = create_session(onnx_path, providers)
+        self.input_name = self.session.get_inputs()[0].name
+        meta = self.session.get_modelmeta().custom_metadata_map
+        imgsz = ast.literal_eval(meta.get("imgsz", "[640, 640]"))
+        self.imgsz = int(imgsz[0])
+        self.num_classes = len(ast.literal_eval(meta.get("names", "{0: 'face'}")))
+        kpt_shape = meta.get("kpt_shape")
+        self.kpt_shape = tuple(ast.literal_eval(kpt_shape)) if kpt_shape else None
+        self.conf, self.iou, self.max_det = conf, iou, max_det
+        self.nbytes = os.path.getsize(onnx_path)
+
+    def __call__(self, imgs: Sequence[np.ndarray]) -> list[Detections]:
+        batch = np.empty((len(imgs), 3, self.imgsz, self.imgsz), np.float32)
+        transforms = []
+        for i, img in enumerate(imgs):
+            padded, gain, pad = letterbox(img, self.imgsz)
+            batch[i] = padded[:, :, ::-1].transpose(2, 0, 1)
+            transforms.append((gain, pad, img.shape[:2]))
+        batch *= 1 / 255.0
+
+        output = self.session.run(None, {self.input_name: batch})[0]
+        return [self._postprocess(output[i], *transforms[i]) for i in range(len(imgs))]
+
+    def _postprocess(self, pred: np.ndarray, gain: float, pad: tuple[int, int], shape) -> Detections:
+        channels = 4 + self.num_classes + (int(np.prod(self.kpt_shape)) if self.kpt_shape else 0)
+        if pred.shape[0] != channels:
+            # End-to-end graphs (YOLOv10) emit (max_det, 6) rows already past NMS
+            pred = pred[pred[:, 4] > self.conf]
+            boxes, scores, keypoints = pred[:, :4], pred[:, 4], None
+        else:
+            pred = pred.T
+            class_scores = pred[:, 4 : 4 + self.num_classes]
+            classes = class_scores.argmax(1)
+            scores = class_scores[np.arange(len(pred)), classes]
+            keep = scores > self.conf
+            pred, scores, classes = pred[keep], scores[keep], classes[keep]
+            if not len(pred):
+                return Detections.empty()
+
+            xy, wh = pred[:, :2], pred[:, 2:4]
+            boxes = np.concatenate([xy - wh / 2, xy + wh / 2], axis=1)
+            keep = cv2.dnn.NMSBoxesBatched(
+                np.concatenate([boxes[:, :2], wh], axis=1).tolist(),
+                scores.tolist(),
+                classes.tolist(),
+                self.conf,
+                self.iou,
+            )
+            keep = np.asarray(keep, dtype=int).reshape(-1)[: self.max_det]
+            boxes, scores = boxes[keep], scores[keep]
+            keypoints = None
+            if self.kpt_shape:
+                kpts = pred[keep, 4 + self.num_classes :].reshape(len(keep), *self.kpt_shape)
+                keypoints = (kpts[..., :2] - pad) / gain
+
+        h, w = shape
+        boxes = (boxes - [pad[0], pad[1], pad[0], pad[1]]) / gain
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, w)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, h)
+        return Detections(
+            boxes.astype(np.float32),
+            scores.astype(np.float32),
+            None if keypoints is None else keypoints.astype(np.float32),
+        )
+
+
+def onnx_path_for(weights: str, int8: bool = False) -> Path:
+    """Location of the cached ONNX artifact for a weights file."""
+    stem = Path(weights).stem
+    return Path(settings.ONNX_CACHE_DIR) / (f"{stem}.int8.onnx" if int8 else f"{stem}.onnx")
+
+
+def export_onnx(weights: str, int8: bool = False, calibration_dir: Optional[str] = None) -> Path:
+    """Export ``weights`` to ONNX once and return the cached artifact path."""
+    fp32_path = onnx_path_for(weights)
+    if not fp32_path.exists():
+        from ultralytics import YOLO
+
+        fp32_path.parent.mkdir(parents=True, exist_ok=True)
+        exported = YOLO(weights).export(format="onnx", dynamic=True, simplify=True)
+        shutil.move(exported, fp32_path)
+    if not int8:
+        return fp32_path
+
+    int8_path = onnx_path_for(weights, int8=True)
+    if not int8_path.exists():
+        feeds = _calibration_feeds(fp32_path, calibration_dir) if calibration_dir else None
+        quantize(fp32_path, int8_path, feeds)
+    return int8_path
+
+
+def _calibration_feeds(fp32_path: Path, calibration_dir: str):
+    """Letterboxed calibration inputs built from a directory of images."""
+    detector = OnnxDetector(str(fp32_path))
+    for img in _read_images(calibration_dir):
+        padded, _, _ = letterbox(img, detector.imgsz)
+        tensor = padded[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+        yield {detector.input_name: tensor}
+
+
+def load_detector(weights: str):
+    """Build the detector for ``weights`` according to DETECTOR_BACKEND."""
+    backend = settings.DETECTOR_BACKEND
+    if backend == "torch":
+        return TorchDetector(weights)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxDetector(str(export_onnx(weights, int8=backend == "onnx-int8")))
+    raise ValueError(f"Unknown detector backend: {backend}")
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between two sets of xyxy boxes."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = (rb - lt).clip(0).prod(2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _read_images(directory: str) -> list[np.ndarray]:
+    images = []
+    for path in sorted(Path(directory).iterdir()):
+        img = cv2.imread(str(path))
+        if img is not None:
+            images.append(img)
+    return images
+
+
+def compare(weights: str, images: list[np.ndarray], candidate, runs: int = 5, iou: float = 0.9) -> dict:
+    """Compare latency and box agreement of ``candidate`` against PyTorch."""
+    reference = TorchDetector(weights)
+    report = {}
+    outputs = {}
+    for name, detector in (("torch", reference), (candidate.backend, candidate)):
+        detector(images[:1])  # warm-up
+        timings = []
+        for _ in range(runs):
+            for img in images:
+                start = time.perf_counter()
+                outputs.setdefault(name, {})[id(img)] = detector([img])[0]
+                timings.append((time.perf_counter() - start) * 1000)
+        report[name] = {
+            "mean_ms": round(float(np.mean(timings)), 2),
+            "p50_ms": round(float(np.percentile(timings, 50)), 2),
+            "p95_ms": round(float(np.percentile(timings, 95)), 2),
+        }
+
+    matched = total = extra = 0
+    for img in images:
+        ref, got = outputs["torch"][id(img)], outputs[candidate.backend][id(img)]
+        total += len(ref)
+        if len(ref) and len(got):
+            ious = box_iou(ref.boxes, got.boxes)
+            matched += int((ious.max(1) >= iou).sum())
+        extra += max(0, len(got) - len(ref))
+    report["agreement"] = {
+        "reference_boxes": total,
+        "matched_boxes": matched,
+        "extra_boxes": extra,
+        "match_rate": round(matched / total, 4) if total else 1.0,
+        "iou_threshold": iou,
+    }
+    return report
+
+
+def main(argv=None):
+    from recognition.registry import AVAILABLE_MODELS
+
+    parser = argparse.ArgumentParser(description="Export and compare ONNX face detectors")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="export a model to the ONNX cache")
+    export_cmd.add_argument("model", choices=AVAILABLE_MODELS)
+    export_cmd.add_argument("--int8", action="store_true")
+    export_cmd.add_argument("--calibration", help="directory of images for static INT8 calibration")
+    compare_cmd = sub.add_parser("compare", help="compare ONNX Runtime against PyTorch")
+    compare_cmd.add_argument("model", choices=AVAILABLE_MODELS)
+    compare_cmd.add_argument("images", help="directory of test images")
+    compare_cmd.add_argument("--int8", action="store_true")
+    compare_cmd.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    weights = AVAILABLE_MODELS[args.model]
+    if args.command == "export":
+        print(export_onnx(weights, int8=args.int8, calibration_dir=args.calibration))
+        return
+
+    images = _read_images(args.images)
+    if not images:
+        parser.error(f"no readable images in {args.images}")
+    candidate = OnnxDetector(str(export_onnx(weights, int8=args.int8)))
+    if args.int8:
+        candidate.backend = "onnx-int8"
+    for name, values in compare(weights, images, candidate, runs=args.runs).items():
+        print(f"{name:10s} " + "  ".join(f"{k}={v}" for k, v in values.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Face embedding backends for the recognition stage.
+
+``DeepFaceEmbedder`` runs DeepFace's TensorFlow Facenet model directly on
+a batch of crops. ``OnnxEmbedder`` runs the same graph exported to ONNX
+(FP32 or INT8) through ONNX Runtime, so workers do not need TensorFlow at
+all. Both apply DeepFace's Facenet preprocessing: the crop is resized to
+fit 160x160 keeping its aspect ratio, zero-padded to the centre and scaled
+to [0, 1] in BGR order. Their embeddings are therefore interchangeable.
+Aligned faces are warped straight from the frame into a reused batch
+buffer, without intermediate crops.
+
+Export the graph and check the drift against TensorFlow with::
+
+    python -m recognition.embedding export --int8 --calibration media/faces
+    python -m recognition.embedding validate media/faces --int8
+"""
+
+import argparse
+import resource
+import threading
+import time
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Sequence, Union
+
+import cv2
+import numpy as np
+
+from config import settings
+from recognition.alignment import AlignedFace
+from recognition.onnx_utils import create_session, quantize
+
+MODEL_NAME = "Facenet"
+INPUT_SIZE = (160, 160)  # height, width
+
+
+_buffers = threading.local()
+
+
+def _buffer(name: str, shape: tuple, dtype) -> np.ndarray:
+    """Thread-local array reused across calls, grown along its first axis."""
+    buffer = getattr(_buffers, name, None)
+    if buffer is None or buffer.shape[0] < shape[0] or buffer.shape[1:] != shape[1:]:
+        buffer = np.empty((max(shape[0], 1), *shape[1:]), dtype)
+        setattr(_buffers, name, buffer)
+    return buffer[: shape[0]]
+
+
+def preprocess_aligned(face: AlignedFace, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Write one face into a Facenet input slot with a single warp.
+
+    The alignment transform is composed with DeepFace's aspect-preserving
+    fit into 160x160, so crop, rotation and resize are one ``warpAffine``
+    into a reused uint8 buffer. The padding is zeroed and the pixels are
+    scaled to [0, 1] straight into ``out``.
+    """
+    target_h, target_w = INPUT_SIZE
+    factor = min(target_h / face.height, target_w / face.width)
+    new_w, new_h = max(1, int(face.width * factor)), max(1, int(face.height * factor))
+    top, left = (target_h - new_h) // 2, (target_w - new_w) // 2
+
+    fit = np.array([[new_w / face.width, 0, left], [0, new_h / face.height, top]])
+    matrix = fit[:, :2] @ face.matrix
+    matrix[:, 2] += fit[:, 2]
+
+    pixels = _buffer("pixels", (target_h, target_w, 3), np.uint8)
+    cv2.warpAffine(face.img, matrix, (target_w, target_h), dst=pixels, borderMode=cv2.BORDER_REPLICATE)
+    pixels[:top] = 0
+    pixels[top + new_h :] = 0
+    pixels[:, :left] = 0
+    pixels[:, left + new_w :] = 0
+
+    if out is None:
+        out = np.empty((target_h, target_w, 3), np.float32)
+    np.multiply(pixels, 1 / 255.0, out=out, casting="unsafe")
+    return out
+
+
+def preprocess(face: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Fit a BGR uint8 crop into the Facenet input, as DeepFace does."""
+    h, w = face.shape[:2]
+    return preprocess_aligned(AlignedFace(face, np.array([[1.0, 0, 0], [0, 1.0, 0]]), w, h), out)
+
+
+class Embedder(ABC):
+    """Common batching logic; subclasses implement ``forward``."""
+
+    name = MODEL_NAME
+    backend = ""
+    version = ""
+    input_size = INPUT_SIZE
+
+    @abstractmethod
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        """Embed a preprocessed (N, 160, 160, 3) float32 batch."""
+
+    def preprocess_batch(self, faces: Sequence[Union[AlignedFace, np.ndarray]]) -> np.ndarray:
+        """
+        Preprocess faces into this thread's reusable input batch.
+
+        The returned array is overwritten by the next call on the same
+        thread; ``forward`` copies it into the model, so the buffer is free
+        again once ``embed`` returns.
+        """
+        batch = _buffer("batch", (len(faces), *self.input_size, 3), np.float32)
+        for i, face in enumerate(faces):
+            if isinstance(face, AlignedFace):
+                preprocess_aligned(face, out=batch[i])
+            else:
+                preprocess(face, out=batch[i])
+        return batch
+
+    def embed(self, faces: Sequence[Union[AlignedFace, np.ndarray]]) -> np.ndarray:
+        """Embed aligned faces or BGR uint8 crops, returning an (N, D) float32 array."""
+        return self.forward(self.preprocess_batch(faces))
+
+
+class DeepFaceEmbedder(Embedder):
+    """Facenet through DeepFace's TensorFlow model."""
+
+    backend = "deepface"
+
+    def __init__(self):
+        from deepface import DeepFace
+
+        self.model = DeepFace.build_model(MODEL_NAME).model
+        self.version = f"deepface-{DeepFace.__version__}"
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        if not len(batch):
+            return np.zeros((0, 128), np.float32)
+        return np.asarray(self.model(batch, training=False), dtype=np.float32)
+
+
+class OnnxEmbedder(Embedder):
+    """Facenet exported to ONNX and run through ONNX Runtime."""
+
+    backend = "onnx"
+
+    def __init__(self, onnx_path, providers: Optional[list[str]] = None):
+        self.session = create_session(onnx_path, providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.version = Path(onnx_path).name
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        if not len(batch):
+            return np.zeros((0, 128), np.float32)
+        return self.session.run(None, {self.input_name: batch})[0].astype(np.float32)
+
+
+def onnx_path_for(int8: bool = False) -> Path:
+    """Location of the cached Facenet ONNX artifact."""
+    name = f"{MODEL_NAME.lower()}.int8.onnx" if int8 else f"{MODEL_NAME.lower()}.onnx"
+    return Path(settings.ONNX_CACHE_DIR) / name
+
+
+def export_onnx(int8: bool = False, calibration_dir: Optional[str] = None) -> Path:
+    """Export DeepFace's Facenet to ONNX once and return the cached artifact."""
+    fp32_path = onnx_path_for()
+    if not fp32_path.exists():
+        import tensorflow as tf
+        import tf2onnx
+        from deepface import DeepFace
+
+        fp32_path.parent.mkdir(parents=True, exist_ok=True)
+        model = DeepFace.build_model(MODEL_NAME).model
+        spec = [tf.TensorSpec((None, *INPUT_SIZE, 3), tf.float32, name="input")]
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=str(fp32_path))
+    if not int8:
+        return fp32_path
+
+    int8_path = onnx_path_for(int8=True)
+    if not int8_path.exists():
+        feeds = None
+        if calibration_dir:
+            feeds = ({"input": preprocess(face)[None]} for face in _read_faces(calibration_dir))
+        quantize(fp32_path, int8_path, feeds)
+    return int8_path
+
+
+@lru_cache(maxsize=1)
+def get_embedder() -> Embedder:
+    """Return the process-wide embedder selected by EMBEDDING_BACKEND."""
+    backend = settings.EMBEDDING_BACKEND
+    if backend == "deepface":
+        return DeepFaceEmbedder()
+    if backend in ("onnx", "onnx-int8"):
+        embedder = OnnxEmbedder(export_onnx(int8=backend == "onnx-int8"))
+        embedder.backend = backend
+        return embedder
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def _read_faces(directory: str) -> list[np.ndarray]:
+    faces = []
+    for path in sorted(Path(directory).iterdir()):
+        img = cv2.imread(str(path))
+        if img is not None:
+            faces.append(img)
+    return faces
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _timed(embedder: Embedder, faces: list[np.ndarray]) -> tuple[np.ndarray, float]:
+    embedder.embed(faces[:1])  # warm-up
+    start = time.perf_counter()
+    embeddings = embedder.embed(faces)
+    return embeddings, (time.perf_counter() - start) * 1000 / len(faces)
+
+
+def validate(faces: list[np.ndarray], int8: bool = False) -> dict:
+    """Cosine-similarity drift and per-face latency of ONNX against TensorFlow."""
+    onnx = OnnxEmbedder(export_onnx(int8=int8))
+    onnx_embeddings, onnx_ms = _timed(onnx, faces)
+    onnx_rss = _rss_mb()  # measured before TensorFlow is imported
+
+    reference = DeepFaceEmbedder()
+    tf_embeddings, tf_ms = _timed(reference, faces)
+
+    a = tf_embeddings / np.linalg.norm(tf_embeddings, axis=1, keepdims=True)
+    b = onnx_embeddings / np.linalg.norm(onnx_embeddings, axis=1, keepdims=True)
+    cosine = (a * b).sum(1)
+    return {
+        "faces": len(faces),
+        "cosine_mean": round(float(cosine.mean()), 6),
+        "cosine_min": round(float(cosine.min()), 6),
+        "tensorflow_ms_per_face": round(tf_ms, 2),
+        "onnx_ms_per_face": round(onnx_ms, 2),
+        "onnx_peak_rss_mb": round(onnx_rss, 1),
+        "total_peak_rss_mb": round(_rss_mb(), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export and validate the ONNX Facenet embedder")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_cmd = sub.add_parser("export", help="export Facenet to the ONNX cache")
+    export_cmd.add_argument("--int8", action="store_true")
+    export_cmd.add_argument("--calibration", help="directory of face crops for static INT8 calibration")
+    validate_cmd = sub.add_parser("validate", help="compare ONNX embeddings against TensorFlow")
+    validate_cmd.add_argument("faces", help="directory of face crops")
+    validate_cmd.add_argument("--int8", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        print(export_onnx(int8=args.int8, calibration_dir=args.calibration))
+        return
+
+    faces = _read_faces(args.faces)
+    if not faces:
+        parser.error(f"no readable images in {args.faces}")
+    for key, value in validate(faces, int8=args.int8).items():
+        print(f"{key:24s} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Enrollment-time face processing.
+
+When a face is added or its image replaced, the face is detected, aligned
+and cropped once, and its embedding is computed and stored with the row.
+Recognition then matches against stored embeddings and never has to go
+back to the raw gallery images.
+"""
+
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from config import settings
+from recognition.alignment import align_face_box
+from recognition.batching import detect
+from recognition.embedding import get_embedder
+
+
+class NoFaceDetected(ValueError):
+    """Raised when an enrollment image does not contain a detectable face."""
+
+
+@dataclass
+class Enrollment:
+    """Normalized crop and embedding computed for one enrolled face."""
+
+    crop: bytes  # JPEG of the aligned crop at the embedding model's input size
+    embedding: bytes  # float32 vector
+    embedding_model: str
+    embedding_version: str
+
+
+def embedding_signature() -> tuple[str, str]:
+    """Model name and version identifying embeddings from the active embedder."""
+    embedder = get_embedder()
+    return f"{embedder.name}/{embedder.backend}", embedder.version
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    """Inverse of the serialisation used in ``Enrollment.embedding``."""
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def enroll(img: np.ndarray) -> Enrollment:
+    """Detect, align, crop and embed the largest face in ``img``."""
+    detections = detect(settings.GALLERY_DETECTOR, img)
+    if not len(detections):
+        raise NoFaceDetected("No face detected in the enrollment image")
+
+    boxes = detections.boxes.astype(int)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    largest = int(areas.argmax())
+    keypoints = None if detections.keypoints is None else detections.keypoints[largest]
+    face = align_face_box(img, boxes[largest], keypoints)
+    if not face.size:
+        raise NoFaceDetected("Detected face is empty")
+
+    embedder = get_embedder()
+    batch = embedder.preprocess_batch([face])
+    normalized = (batch[0] * 255).round().astype(np.uint8)
+    _, jpeg = cv2.imencode(".jpg", normalized, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    embedding = embedder.forward(batch)[0].astype(np.float32)
+
+    model, version = embedding_signature()
+    return Enrollment(
+        crop=jpeg.tobytes(),
+        embedding=embedding.tobytes(),
+        embedding_model=model,
+        embedding_version=version,
+    )
+
+
+def enroll_bytes(data: bytes) -> Enrollment:
+    """Decode an uploaded image and enroll the face in it."""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Invalid image")
+    return enroll(img)
+
+
+def enroll_file(path) -> Enrollment:
+    """Enroll the face in an image file, used to backfill older rows."""
+    img = cv2.imread(str(path))
+    if img is None:
+        raise ValueError(f"Cannot read image {path}")
+    return enroll(img)
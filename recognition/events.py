@@ -0,0 +1,215 @@
+"""
+Broker for live dashboard events.
+
+Request handlers and inference threads ``publish`` events (new visits,
+face changes). Each Server-Sent Events connection ``subscribe``s with its
+own bounded asyncio queue, so an idle dashboard just waits on its queue
+instead of reloading everything. The latest events are kept for replay, so
+a client that reconnects with ``Last-Event-ID`` receives what it missed.
+A client that fell too far behind, or that reconnects after a server
+restart, gets a RESET event telling it to reload instead.
+
+On its own the broker only reaches subscribers in the same process. With
+an ``EventLog`` attached, ``publish`` appends to the log instead, and a
+poller thread in every subscribed process delivers what any process
+appended, so events from other workers and from ``ingest.py`` arrive
+too. Event ids are then the log's ids, the same in every worker.
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+RESET = "reset"  # event type telling a client to reload its full state
+
+
+@dataclass(frozen=True)
+class Event:
+    seq: int
+    type: str
+    data: dict
+    epoch: str
+
+    @property
+    def id(self) -> str:
+        return f"{self.epoch}-{self.seq}"
+
+    def encode(self) -> str:
+        """The event in text/event-stream framing."""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n"
+
+
+class Subscription:
+    """Bounded queue of events for one connection; overflowing it queues a RESET."""
+
+    def __init__(self, broker: "EventBroker", loop: asyncio.AbstractEventLoop, size: int):
+        self._broker = broker
+        self.loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+
+    def offer(self, event: Event):
+        """Queue an event; must run on the subscription's event loop."""
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: drop the backlog and have the client reload
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(Event(event.seq, RESET, {}, event.epoch))
+
+    async def get(self, timeout: float) -> Optional[Event]:
+        """Next event, or None after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class EventLog:
+    """
+    Ordered store of events shared by every process, e.g. a database table.
+
+    ``append`` must give each event an id greater than all earlier ones.
+    """
+
+    def append(self, type: str, data: dict):
+        raise NotImplementedError
+
+    def read(self, after: int, limit: int) -> list[tuple[int, str, dict]]:
+        """Up to ``limit`` ``(id, type, data)`` events with ids above ``after``, oldest first."""
+        raise NotImplementedError
+
+    def last_id(self) -> int:
+        raise NotImplementedError
+
+    def trim(self, before: float):
+        """Drop events appended before the ``time.time()`` timestamp ``before``."""
+
+
+class EventBroker:
+    """Fan-out of published events to every subscribed connection."""
+
+    TRIM_INTERVAL = 60.0  # seconds between trims of the shared log
+
+    def __init__(self, history: int = settings.EVENTS_HISTORY, queue_size: int = settings.EVENTS_QUEUE_SIZE):
+        self.epoch = secrets.token_hex(4)  # event ids of an earlier process never match
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history: deque[Event] = deque(maxlen=history)
+        self._subscribers: set[Subscription] = set()
+        self._log: Optional[EventLog] = None
+        self._poller: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._closed = False
+
+    def attach(self, log: EventLog):
+        """Publish through ``log`` and deliver what every process appends to it."""
+        last_id = log.last_id()
+        with self._lock:
+            self._log = log
+            self.epoch = "log"  # ids come from the log and mean the same in every worker
+            self._seq = last_id  # only events from now on, earlier ones are in the initial load
+            self._history.clear()
+
+    def publish(self, type: str, data: dict):
+        """Send an event to every subscriber; safe to call from any thread."""
+        if self._log is not None:
+            try:
+                self._log.append(type, data)
+            except Exception:
+                logger.exception("Cannot append %s event to the shared log", type)
+            self._wake.set()  # deliver our own event without waiting for the next poll
+            return
+        with self._lock:
+            self._seq += 1
+            self._deliver(Event(self._seq, type, data, self.epoch))
+
+    def _deliver(self, event: Event):
+        """Record and fan out an event; the lock must be held."""
+        self._seq = event.seq
+        self._history.append(event)
+        for subscription in list(self._subscribers):
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                self._subscribers.discard(subscription)  # its event loop is closed
+
+    def _poll(self):
+        """Deliver events appended to the shared log by any process until ``close``."""
+        trimmed = 0.0
+        while not self._closed:
+            try:
+                events = self._log.read(self._seq, self.queue_size)
+                if time.monotonic() - trimmed > self.TRIM_INTERVAL:
+                    self._log.trim(time.time() - settings.EVENTS_RETENTION_SECONDS)
+                    trimmed = time.monotonic()
+            except Exception:
+                logger.exception("Cannot read the shared event log")
+                events = []
+            with self._lock:
+                for seq, type, data in events:
+                    self._deliver(Event(seq, type, data, self.epoch))
+            if len(events) < self.queue_size:
+                self._wake.wait(settings.EVENTS_POLL_SECONDS)
+                self._wake.clear()
+
+    def _start_polling(self):
+        if self._log is not None and self._poller is None:
+            self._poller = threading.Thread(target=self._poll, name="event-poller", daemon=True)
+            self._poller.start()
+
+    def close(self):
+        """Stop the poller, if any."""
+        self._closed = True
+        self._wake.set()
+
+    def _missed(self, last_event_id: str) -> Optional[list[Event]]:
+        """Events after ``last_event_id``, or None if they cannot all be replayed."""
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        oldest = self._history[0].seq if self._history else self._seq + 1
+        if seq > self._seq or seq + 1 < oldest:
+            return None
+        return [event for event in self._history if event.seq > seq]
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """Subscribe a connection served by the running event loop, replaying missed events."""
+        subscription = Subscription(self, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._start_polling()
+            self._subscribers.add(subscription)
+            if last_event_id:
+                missed = self._missed(last_event_id)
+                if missed is None:
+                    missed = [Event(self._seq, RESET, {}, self.epoch)]
+                for event in missed:
+                    subscription.offer(event)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self) -> dict:
+        """Connected subscribers and events published so far."""
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self._seq}
+
+
+event_broker = EventBroker()
@@ -0,0 +1,97 @@
+"""
+Bounded thread pool for CPU-bound inference work.
+
+Async routes hand the blocking recognition pipeline to this pool and await
+the result, so the event loop keeps serving light endpoints while YOLO and
+the embedding model run. The number of waiting jobs is capped; once the cap
+is reached new work is rejected instead of queueing without limit.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import settings
+
+
+class ExecutorSaturated(Exception):
+    """Raised when the inference queue is full."""
+
+
+class InferenceExecutor:
+    """Thread pool with a bounded backlog and queue-depth accounting."""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Schedule ``fn`` on the pool, or raise ExecutorSaturated if the backlog is full."""
+        with self._lock:
+            if self._queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorSaturated(f"{self._queued} inference jobs already queued")
+            self._queued += 1
+        try:
+            return self._pool.submit(self._call, fn, args, kwargs)
+        except RuntimeError:
+            with self._lock:
+                self._queued -= 1
+            raise
+
+    def _call(self, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        else:
+            with self._lock:
+                self.completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn`` on the pool and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a free worker."""
+        return self._queued
+
+    def stats(self) -> dict:
+        """Pool occupancy and job counters."""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "queue_depth": self._queued,
+                "queue_limit": self.max_queue,
+                "running": self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and release the worker threads."""
+        self._pool.shutdown(wait=wait)
+
+
+inference_executor = InferenceExecutor(
+    max_workers=settings.INFERENCE_WORKERS,
+    max_queue=settings.INFERENCE_QUEUE_SIZE,
+)
@@ -0,0 +1,348 @@
+"""
+Gallery of enrolled face embeddings used for matching.
+"""
+
+import logging
+import threading
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+
+from config import settings
+from recognition.ann import IVFIndex
+from recognition.codecs import make_codec
+from recognition.enrollment import embedding_signature
+from recognition.matching import Match, l2_normalize, top_k
+from recognition.store import EmbeddingStore, StoreSnapshot
+
+logger = logging.getLogger(__name__)
+
+GalleryLoader = Callable[[], Iterable[tuple[int, np.ndarray, bool]]]
+
+
+class Gallery:
+    """
+    Stored embeddings of the enrolled faces, keyed by face id.
+
+    ``loader`` returns ``(face_id, embedding, is_allowed)`` triples from the
+    database and is called lazily on first use and after ``invalidate``.
+    Embeddings are L2-normalized and kept in one contiguous array of rows
+    encoded with the GALLERY_ENCODING codec, with face ids and
+    ``is_allowed`` flags in parallel arrays, so a batch of probes is scored
+    against the whole gallery in one pass over the codes.
+
+    The CRUD paths keep the gallery current in place with ``upsert`` and
+    ``remove``. Rows live in a buffer with spare capacity, removal moves the
+    last row into the freed slot, and every change bumps ``version``.
+
+    When ``name`` is given and GALLERY_STORE_ENABLED is set, the arrays are
+    mapped from a shared ``EmbeddingStore`` file rather than held by every
+    process, and the database is only read when no file for the current
+    embedding model exists. A change is applied to a private copy,
+    published as a new file version and mapped again; other workers remap
+    the new version before their next search.
+
+    With ANN_ENABLED, galleries of at least ANN_MIN_SIZE faces are searched
+    through an ``IVFIndex`` over the same codes, kept in step with the
+    matrix and built on load or as soon as upserts grow the gallery past
+    that size. When ``name`` is given the index is persisted under
+    ANN_INDEX_DIR and restored on the next load, applying only the faces
+    that changed in between.
+    """
+
+    def __init__(self, loader: GalleryLoader, name: Optional[str] = None):
+        self._loader = loader
+        self._codec = make_codec(settings.GALLERY_ENCODING, settings.GALLERY_PQ_SUBSPACES)
+        self._index_path = settings.ANN_INDEX_DIR / f"{name}.npz" if name else None
+        self._index: Optional[IVFIndex] = None
+        self._index_dirty = False
+        self._store = (
+            EmbeddingStore(settings.GALLERY_STORE_DIR / f"{name}.bin")
+            if name and settings.GALLERY_STORE_ENABLED
+            else None
+        )
+        self._snapshot: Optional[StoreSnapshot] = None
+        self._stale = False  # reload from the database instead of the store
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._size = 0
+        self._rows: dict[int, int] = {}  # face id -> row
+        self._ids = np.zeros(0, np.int64)
+        self._allowed = np.zeros(0, bool)
+        self._codes = np.zeros((0, 0), np.uint8)
+        self._dim = 0
+        self.version = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return self._size
+
+    def version_token(self) -> tuple:
+        """
+        Marker that changes whenever the gallery does, for cache keys.
+
+        Combines ``version`` with the stamp of the shared store file, so a
+        change published by another worker shows up as well. Takes no lock
+        and never loads anything, so it is safe to call on the event loop.
+        """
+        return self.version, self._store.stamp() if self._store else None
+
+    def invalidate(self):
+        """Reload from the database on next use."""
+        with self._lock:
+            self._loaded = False
+            self._stale = True
+            self.version += 1
+
+    def _ensure_loaded(self):
+        if self._store is None:
+            if not self._loaded:
+                self._load_entries()
+            return
+        if self._loaded and not self._store.changed(self._snapshot):
+            return
+        with self._store.lock():
+            if not self._refresh():
+                self._publish()
+
+    def _refresh(self) -> bool:
+        """Map the latest store version, or load from the database if unusable."""
+        snapshot = None
+        if not self._stale:
+            try:
+                snapshot = self._store.open()
+            except ValueError:
+                logger.exception("Ignoring unreadable gallery file %s", self._store.path)
+        self._stale = False
+        if snapshot is not None and snapshot.signature == self._signature() and self._readable(snapshot):
+            self._map(snapshot)
+            return True
+        self._load_entries()
+        return False
+
+    def _signature(self) -> str:
+        return "/".join((*embedding_signature(), self._codec.signature))
+
+    def _readable(self, snapshot: StoreSnapshot) -> bool:
+        """Whether the codec can read the stored codes, checked before trusting their width."""
+        if not len(snapshot.ids):
+            return True
+        self._codec.load_state(snapshot.state)
+        return self._codec.dimension(snapshot.codes.shape[1]) is not None
+
+    def _load_entries(self):
+        """Build private arrays from the database loader."""
+        entries = list(self._loader())
+        self._snapshot = None
+        self._size = 0
+        self._rows = {}
+        self._index = None
+        if entries:
+            vectors = l2_normalize(np.stack([embedding for _, embedding, _ in entries]).astype(np.float32))
+            self._codec.fit(vectors)
+            self._dim = vectors.shape[1]
+            self._reserve(len(entries), keep=False)
+            self._size = len(entries)
+            self._ids[: self._size] = [face_id for face_id, _, _ in entries]
+            self._allowed[: self._size] = [is_allowed for _, _, is_allowed in entries]
+            self._codes[: self._size] = self._codec.encode(vectors)
+            self._rows = {int(face_id): row for row, (face_id, _, _) in enumerate(entries)}
+        else:
+            self._ids = np.zeros(0, np.int64)
+            self._allowed = np.zeros(0, bool)
+            self._codes = np.zeros((0, 0), np.uint8)
+        self._after_load()
+
+    def _map(self, snapshot: StoreSnapshot, rows: Optional[dict[int, int]] = None):
+        """Use the read-only arrays of a published store version."""
+        self._snapshot = snapshot
+        self._ids, self._allowed, self._codes = snapshot.ids, snapshot.allowed, snapshot.codes
+        self._size = len(snapshot.ids)
+        if rows is not None:
+            # Our own publish: rows and ANN index already match the new file
+            self._rows = rows
+            self._loaded = True
+            self.version += 1
+            return
+        self._rows = dict(zip(snapshot.ids.tolist(), range(self._size)))
+        self._codec.load_state(snapshot.state)
+        self._dim = self._codec.dimension(snapshot.codes.shape[1]) if self._size else 0
+        self._after_load()
+
+    def _publish(self):
+        """Write the current arrays as a new store version and map it."""
+        size = self._size
+        self._store.publish(
+            self._ids[:size], self._allowed[:size], self._codes[:size], self._signature(), self._codec.state()
+        )
+        self._map(self._store.open(), rows=self._rows)  # same row order as just written
+
+    def _make_private(self):
+        """Copy mapped arrays into writable buffers before changing them."""
+        if self._snapshot is None:
+            return
+        ids, allowed, codes = self._ids, self._allowed, self._codes
+        self._snapshot = None
+        self._ids = np.zeros(0, np.int64)
+        self._reserve(self._size + 1, keep=False)
+        self._ids[: self._size] = ids
+        self._allowed[: self._size] = allowed
+        self._codes[: self._size] = codes
+
+    def _after_load(self):
+        if settings.ANN_ENABLED and self._size >= settings.ANN_MIN_SIZE:
+            self._index = self._open_index()
+        else:
+            self._index = None
+        self._loaded = True
+        self.version += 1
+
+    def _open_index(self) -> IVFIndex:
+        """Sync the current or persisted index with the arrays, or build a new one."""
+        ids, codes = self._ids[: self._size], self._codes[: self._size]
+        index, changed = self._index, None
+        try:
+            if index is None and self._index_path and self._index_path.exists():
+                index = IVFIndex.load(self._index_path, self._codec)
+            if index is not None:
+                changed = index.sync(ids, codes)
+        except Exception:
+            logger.exception("Cannot restore gallery index %s, rebuilding", self._index_path)
+        if changed is None:
+            index = IVFIndex(nlist=settings.ANN_NLIST, codec=self._codec)
+            index.build(ids, codes)
+        index.nprobe = settings.ANN_NPROBE
+        if changed != 0:
+            self._index_dirty = True
+        if self._index is None:
+            self._save_index(index)  # freshly restored or built
+        return index
+
+    def _save_index(self, index: IVFIndex):
+        if self._index_path and self._index_dirty:
+            index.save(self._index_path)
+            self._index_dirty = False
+
+    def persist(self):
+        """Save the ANN index, if any, so the next start does not rebuild it."""
+        with self._lock:
+            if self._loaded and self._index is not None:
+                self._save_index(self._index)
+
+    def _reserve(self, capacity: int, keep: bool = True):
+        """Grow the buffers to hold at least ``capacity`` rows."""
+        width = self._codec.width(self._dim)
+        if capacity <= len(self._ids) and self._codes.shape[1] == width:
+            return
+        capacity = max(capacity, 2 * len(self._ids), 16)
+        ids = np.zeros(capacity, np.int64)
+        allowed = np.zeros(capacity, bool)
+        codes = np.zeros((capacity, width), np.uint8)
+        if keep and self._size:
+            ids[: self._size] = self._ids[: self._size]
+            allowed[: self._size] = self._allowed[: self._size]
+            codes[: self._size] = self._codes[: self._size]
+        self._ids, self._allowed, self._codes = ids, allowed, codes
+
+    def _put(self, face_id: int, embedding: np.ndarray, is_allowed: bool):
+        vector = l2_normalize(np.asarray(embedding, np.float32)[None])
+        if not self._size:
+            self._dim = vector.shape[1]
+            self._codec.fit(vector)
+        row = self._rows.get(face_id)
+        if row is None:
+            self._reserve(self._size + 1)
+            row = self._size
+            self._size += 1
+            self._rows[face_id] = row
+        self._ids[row] = face_id
+        self._allowed[row] = is_allowed
+        self._codes[row] = self._codec.encode(vector)[0]
+        if self._index is not None:
+            self._index.add(face_id, self._codes[row])
+            self._index_dirty = True
+
+    def _delete(self, face_id: int):
+        row = self._rows.pop(face_id, None)
+        if row is None:
+            return
+        last = self._size - 1
+        if row != last:
+            self._ids[row] = self._ids[last]
+            self._allowed[row] = self._allowed[last]
+            self._codes[row] = self._codes[last]
+            self._rows[int(self._ids[row])] = row
+        self._size = last
+        if self._index is not None:
+            self._index.remove(face_id)
+            self._index_dirty = True
+
+    def _apply(self, apply: Callable[[], None]):
+        apply()
+        if self._codec.needs_fit(self._size):
+            self._load_entries()  # re-encode everything, e.g. PQ codebooks now too small
+        elif self._index is None and settings.ANN_ENABLED and self._size >= settings.ANN_MIN_SIZE:
+            self._index = self._open_index()  # grew past ANN_MIN_SIZE through upserts
+
+    def _change(self, apply: Callable[[], None]):
+        """Apply a change in place, publishing it when the gallery is shared."""
+        if self._store is None:
+            if self._loaded:
+                self._apply(apply)
+            self.version += 1
+            return
+        with self._store.lock():
+            if not self._loaded or self._store.changed(self._snapshot):
+                self._refresh()  # start from the latest published version
+            self._make_private()
+            self._apply(apply)
+            self._publish()
+
+    def upsert(self, face_id: int, embedding: Optional[np.ndarray], is_allowed: bool):
+        """Add or replace a face; a missing embedding removes it."""
+        if embedding is None:
+            self.remove(face_id)
+            return
+
+        def apply():
+            if self._size and len(embedding) != self._dim:
+                self._load_entries()  # embedding model changed, rebuild from the database
+            else:
+                self._put(face_id, embedding, is_allowed)
+
+        with self._lock:
+            self._change(apply)
+
+    def remove(self, face_id: int):
+        """Drop a face by moving the last row into its slot."""
+        with self._lock:
+            self._change(lambda: self._delete(face_id))
+
+    def search(self, probes: np.ndarray, k: int) -> list[list[Match]]:
+        """
+        The ``k`` nearest faces for each L2-normalized probe, nearest first.
+
+        The lock is held for the matrix product so in-place updates never
+        race with a search that is reading the same rows.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            if self._index is not None:
+                rows, distances = [], []
+                for face_ids, face_distances in self._index.search(probes, k):
+                    rows.append([self._rows[int(face_id)] for face_id in face_ids])
+                    distances.append(face_distances)
+            else:
+                rows, distances = top_k(self._codec.similarity(probes, self._codes[: self._size]), k)
+            return [
+                [
+                    Match(
+                        face_id=int(self._ids[row]),
+                        distance=float(distance),
+                        is_allowed=bool(self._allowed[row]),
+                    )
+                    for row, distance in zip(probe_rows, probe_distances)
+                ]
+                for probe_rows, probe_distances in zip(rows, distances)
+            ]
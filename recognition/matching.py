@@ -0,0 +1,94 @@
+"""
+Batched recognition of detected face crops.
+
+All crops from a frame, or from several frames, go through a single
+embedding forward pass and are matched against the gallery with one
+matrix product plus a top-k selection. The crops come straight from the detector, so unlike
+``DeepFace.find`` no second face detection is run on them.
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from config import settings
+from recognition.alignment import AlignedFace
+from recognition.embedding import get_embedder
+
+
+@dataclass
+class Match:
+    """One gallery candidate for a probe face."""
+
+    face_id: int  # id of the matched Face row
+    distance: float  # cosine distance, lower is more similar
+    is_allowed: bool = False
+
+
+@dataclass
+class Recognition:
+    """Recognition outcome for one probe face."""
+
+    match: Optional[Match]  # nearest candidate, if within the threshold
+    candidates: list[Match] = field(default_factory=list)  # top-k, nearest first
+
+
+def l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k(similarity: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The ``k`` most similar gallery rows for every probe, nearest first.
+
+    ``similarity`` is the (probes, gallery rows) cosine similarity matrix,
+    normally produced by one matrix product. ``argpartition`` selects the
+    top ``k`` without sorting the whole gallery. Returns the row indices
+    and cosine distances, both shaped (probes, min(k, gallery rows)).
+    """
+    probes, rows = similarity.shape
+    k = min(k, rows)
+    if not probes or not k:
+        return np.zeros((probes, 0), np.int64), np.zeros((probes, 0), np.float32)
+    if k < rows:
+        best = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+    else:
+        best = np.broadcast_to(np.arange(rows), similarity.shape)
+    nearest = np.take_along_axis(similarity, best, 1)
+    order = np.argsort(-nearest, axis=1)
+    best = np.take_along_axis(best, order, 1)
+    # Quantized galleries can overshoot a similarity of 1 by a rounding error
+    distances = np.maximum(1.0 - np.take_along_axis(nearest, order, 1), 0.0)
+    return best, distances
+
+
+def recognize(
+    crops_by_frame: Sequence[Sequence[Union[AlignedFace, np.ndarray]]],
+    gallery,
+    threshold: float = settings.RECOGNITION_THRESHOLD,
+    k: int = settings.RECOGNITION_TOP_K,
+) -> list[list[Recognition]]:
+    """
+    Embed every face in one batch and match them all against ``gallery``.
+
+    Faces are ``AlignedFace`` transforms (warped straight into the model
+    input) or plain BGR crops; empty ones get an empty result.
+    """
+    flat = [crop for crops in crops_by_frame for crop in crops]
+    valid = [i for i, crop in enumerate(flat) if crop.size]
+    results = [Recognition(match=None) for _ in flat]
+
+    if valid:
+        probes = l2_normalize(get_embedder().embed([flat[i] for i in valid]))
+        for i, candidates in zip(valid, gallery.search(probes, max(k, 1))):
+            best = candidates[0] if candidates and candidates[0].distance <= threshold else None
+            results[i] = Recognition(match=best, candidates=candidates[:k])
+
+    grouped, offset = [], 0
+    for crops in crops_by_frame:
+        grouped.append(results[offset : offset + len(crops)])
+        offset += len(crops)
+    return grouped
@@ -0,0 +1,53 @@
+"""
+In-process cache of the face fields shown for a recognized identity.
+
+Gallery matches carry the face id, and name, image and access flag are
+read from this cache, so recognizing a known face issues no identity
+query. The cache is filled with one query on first use, dropped by the
+face create/update/delete paths, and reloaded when the gallery version
+moves on, which also covers changes published by other workers.
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+
+@dataclass(frozen=True)
+class FaceInfo:
+    """Identity fields of one enrolled face."""
+
+    id: int
+    name: str
+    image_url: str
+    is_allowed: bool
+
+
+class FaceMetadataCache:
+    """
+    Face id to ``FaceInfo`` map loaded in bulk by ``loader``.
+
+    ``version`` returns a counter (normally ``Gallery.version``) whose
+    change marks the cache stale.
+    """
+
+    def __init__(self, loader: Callable[[], Iterable[FaceInfo]], version: Optional[Callable[[], int]] = None):
+        self._loader = loader
+        self._version = version or (lambda: 0)
+        self._lock = threading.Lock()
+        self._faces: Optional[dict[int, FaceInfo]] = None
+        self._loaded_version = None
+
+    def invalidate(self):
+        """Reload on next use, after faces were changed."""
+        with self._lock:
+            self._faces = None
+
+    def get(self, face_id: int) -> Optional[FaceInfo]:
+        """Cached fields of a face, or None if it no longer exists."""
+        version = self._version()
+        with self._lock:
+            if self._faces is None or version != self._loaded_version:
+                self._faces = {face.id: face for face in self._loader()}
+                self._loaded_version = version
+            return self._faces.get(face_id)
@@ -0,0 +1,100 @@
+"""
+Motion gate in front of the detector for camera streams.
+
+A fixed camera mostly sees an unchanged scene, and every frame of it
+would otherwise pay for a full detection pass. ``MotionGate`` keeps a
+MOG2 background model of a small grey copy of the stream and lets a frame
+through only when enough of the region of interest (MOTION_ROI) differs
+from the background. Lower MOTION_THRESHOLD values flag smaller
+brightness changes as motion, and MOTION_MIN_AREA is the fraction of the
+region that has to change.
+"""
+
+import threading
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from config import settings
+
+GATE_WIDTH = 160  # pixels; the background model runs on this downscaled width
+
+
+def parse_roi(roi: str) -> tuple[float, float, float, float]:
+    """``"x1,y1,x2,y2"`` as fractions of the frame; empty means the whole frame."""
+    if not roi.strip():
+        return 0.0, 0.0, 1.0, 1.0
+    x1, y1, x2, y2 = (float(v) for v in roi.split(","))
+    if not (0 <= x1 < x2 <= 1 and 0 <= y1 < y2 <= 1):
+        raise ValueError(f"MOTION_ROI must be fractions x1,y1,x2,y2 with x1 < x2 and y1 < y2, got {roi!r}")
+    return x1, y1, x2, y2
+
+
+class MotionTotals:
+    """Frames checked and skipped by every gate of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.skipped = 0
+
+    def add(self, moved: bool):
+        with self._lock:
+            self.checked += 1
+            self.skipped += not moved
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "skipped_ratio": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+            }
+
+
+motion_totals = MotionTotals()
+
+
+class MotionGate:
+    """Background-subtraction gate for the frames of one stream; not thread-safe."""
+
+    def __init__(
+        self,
+        threshold: float = settings.MOTION_THRESHOLD,
+        min_area: float = settings.MOTION_MIN_AREA,
+        roi: str = settings.MOTION_ROI,
+    ):
+        self.threshold = threshold
+        self.min_area = min_area
+        self.roi = parse_roi(roi)
+        self._subtractor = None
+        self._shape: Optional[tuple[int, int]] = None
+        self.checked = 0
+        self.skipped = 0
+
+    @property
+    def skipped_ratio(self) -> float:
+        return self.skipped / self.checked if self.checked else 0.0
+
+    def moving(self, img: np.ndarray) -> bool:
+        """Whether ``img`` changed enough in the region of interest to run detection."""
+        h, w = img.shape[:2]
+        small = cv2.resize(img, (GATE_WIDTH, max(1, round(h * GATE_WIDTH / w))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+        if small.shape != self._shape:
+            # New stream or resolution: start a fresh background model
+            self._subtractor = cv2.createBackgroundSubtractorMOG2(varThreshold=self.threshold, detectShadows=False)
+            self._shape = small.shape
+        mask = self._subtractor.apply(small)
+
+        x1, y1, x2, y2 = self.roi
+        sh, sw = mask.shape
+        region = mask[int(y1 * sh) : max(int(y2 * sh), int(y1 * sh) + 1), int(x1 * sw) : max(int(x2 * sw), int(x1 * sw) + 1)]
+        moved = np.count_nonzero(region) >= self.min_area * region.size
+        self.checked += 1
+        self.skipped += not moved
+        motion_totals.add(moved)
+        return moved
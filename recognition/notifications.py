@@ -0,0 +1,224 @@
+"""
+Telegram notifications, sent by a background worker.
+
+Request handlers and the ingestion loop only ``enqueue`` a notification,
+so a slow or unreachable Telegram API never adds to detection latency.
+One worker thread per process owns a long-lived ``httpx.Client`` and
+sends the queued notifications in order:
+
+- the queue holds at most NOTIFY_QUEUE_SIZE notifications, and further
+  ones are dropped (and counted) instead of blocking the request,
+- a token bucket allows NOTIFY_RATE_PER_MINUTE messages with bursts of
+  NOTIFY_BURST, below Telegram's per-chat limits,
+- failed sends are retried up to NOTIFY_MAX_RETRIES times with
+  exponential backoff from NOTIFY_BACKOFF_SECONDS, honouring the
+  ``retry_after`` that Telegram returns with a 429.
+
+The FastAPI side and ``ingest.py`` use the bot and channel configured in
+``config.settings``. The Django app builds its worker in ``face.utils``
+from the Django settings.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import httpx
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, with bursts of ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Take a token, returning how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        wait = self.delay()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Notification(NamedTuple):
+    message: str
+    image: Optional[bytes] = None
+
+
+class SendFailed(Exception):
+    """A send was rejected; ``retry_after`` is set when retrying makes sense."""
+
+    def __init__(self, reason: str, retry_after: Optional[float] = None):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class NotificationWorker:
+    """
+    Bounded queue of notifications to one Telegram chat and the thread that sends them.
+
+    The thread and its HTTP client are started by the first ``enqueue``.
+    Without a bot token or chat id every notification is ignored.
+    """
+
+    def __init__(
+        self,
+        token: Optional[str],
+        chat_id: Optional[str],
+        api_url: str = settings.TELEGRAM_API_URL,
+        queue_size: int = settings.NOTIFY_QUEUE_SIZE,
+        rate_per_minute: float = settings.NOTIFY_RATE_PER_MINUTE,
+        burst: int = settings.NOTIFY_BURST,
+        max_retries: int = settings.NOTIFY_MAX_RETRIES,
+        backoff: float = settings.NOTIFY_BACKOFF_SECONDS,
+        timeout: float = settings.NOTIFY_TIMEOUT_SECONDS,
+    ):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate_per_minute / 60, burst)
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.token and self.chat_id)
+
+    def enqueue(self, message: str, image: Optional[bytes] = None) -> bool:
+        """Queue a message, with an optional JPEG; False if it will not be sent."""
+        if not self.configured:
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait(Notification(message, image))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            logger.warning("Notification queue full, dropping: %s", message.splitlines()[0])
+            return False
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued notification was sent or given up; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "sent": self.sent,
+                "failed": self.failed,
+                "dropped": self.dropped,
+                "retries": self.retries,
+            }
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        with httpx.Client(base_url=f"{self.api_url}/bot{self.token}", timeout=self.timeout) as client:
+            while True:
+                notification = self._queue.get()
+                try:
+                    sent = self._deliver(client, notification)
+                    with self._lock:
+                        if sent:
+                            self.sent += 1
+                        else:
+                            self.failed += 1
+                finally:
+                    self._queue.task_done()
+
+    def _deliver(self, client: httpx.Client, notification: Notification) -> bool:
+        """Send one notification, retrying with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                self._send(client, notification)
+                return True
+            except SendFailed as e:
+                if e.retry_after is None or attempt == self.max_retries:
+                    logger.error("Error sending Telegram message: %s", e)
+                    return False
+                wait = max(e.retry_after, min(self.backoff * 2**attempt, MAX_BACKOFF_SECONDS))
+                logger.warning("Telegram send failed (%s), retrying in %.1fs", e, wait)
+                with self._lock:
+                    self.retries += 1
+                time.sleep(wait)
+        return False
+
+    def _send(self, client: httpx.Client, notification: Notification):
+        """One Bot API call; raises SendFailed."""
+        try:
+            if notification.image:
+                response = client.post(
+                    "/sendPhoto",
+                    data={"chat_id": self.chat_id, "caption": notification.message},
+                    files={"photo": ("detection.jpg", notification.image, "image/jpeg")},
+                )
+            else:
+                response = client.post("/sendMessage", json={"chat_id": self.chat_id, "text": notification.message})
+        except httpx.TransportError as e:
+            raise SendFailed(f"{type(e).__name__}: {e}", retry_after=0.0)
+
+        if response.status_code == 200:
+            return
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        reason = f"HTTP {response.status_code}: {body.get('description', response.reason_phrase)}"
+        if response.status_code == 429:
+            raise SendFailed(reason, retry_after=float(body.get("parameters", {}).get("retry_after", 0)))
+        if response.status_code >= 500:
+            raise SendFailed(reason, retry_after=0.0)
+        raise SendFailed(reason)  # bad token, chat or request: retrying will not help
+
+
+notifier = NotificationWorker(settings.TELEGRAM_BOT_TOKEN, settings.TELEGRAM_CHANNEL_ID)
+
+
+def send_telegram_message(message: str, image: Optional[bytes] = None) -> bool:
+    """Queue a message, with an optional JPEG, for the configured channel; False if it will not be sent."""
+    return notifier.enqueue(message, image)
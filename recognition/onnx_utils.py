@@ -0,0 +1,54 @@
+"""
+ONNX Runtime helpers shared by the detector and embedding backends.
+"""
+
+from pathlib import Path
+from typing import Iterable, Optional
+
+from config import settings
+
+
+def providers() -> list[str]:
+    """Execution providers from ONNX_PROVIDERS, in priority order."""
+    return [p.strip() for p in settings.ONNX_PROVIDERS.split(",") if p.strip()]
+
+
+def create_session(path, execution_providers: Optional[list[str]] = None):
+    """Open an inference session with full graph optimisation."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(
+        str(path), options, providers=execution_providers or providers()
+    )
+
+
+def quantize(fp32_path: Path, int8_path: Path, feeds: Optional[Iterable[dict]] = None):
+    """
+    INT8-quantize a graph.
+
+    With calibration ``feeds`` (input-name to array dicts) the graph is
+    statically quantized, which is what convolutional models need to run
+    faster; without them only the weights are quantized dynamically.
+    """
+    from onnxruntime.quantization import (
+        CalibrationDataReader,
+        QuantType,
+        quantize_dynamic,
+        quantize_static,
+    )
+
+    feeds = list(feeds or [])
+    if not feeds:
+        quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QUInt8)
+        return
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._feeds = iter(feeds)
+
+        def get_next(self):
+            return next(self._feeds, None)
+
+    quantize_static(str(fp32_path), str(int8_path), Reader(), weight_type=QuantType.QInt8)
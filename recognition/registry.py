@@ -0,0 +1,165 @@
+"""
+Process-wide registry of loaded face detection models.
+
+Loading YOLO weights costs hundreds of milliseconds, so every entry point
+asks the registry for a model instead of constructing one per request.
+Models stay resident until the configured memory budget is exceeded, at
+which point the least recently used ones are evicted.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from config import settings
+from recognition.detectors import load_detector
+
+
+# Pre-trained YOLO models that can be selected for face detection
+AVAILABLE_MODELS = {
+    "yolov8n": "yolov8n.pt",  # YOLOv8 nano - general object detection
+    "yolov8m": "yolov8m.pt",  # YOLOv8 medium - general object detection
+    "yolov8n-face": "yolov8n-face.pt",  # YOLOv8 nano - specific for face detection
+    "yolov8m-face": "yolov8m-face.pt",  # YOLOv8 medium - specific for face detection
+    "yolov8l-face": "yolov8l-face.pt",  # YOLOv8 large - specific for face detection
+    "yolov10s-face": "yolov10s-face.pt",  # YOLOv10 small - specific for face detection
+    "yolov11m-face": "yolov11m-face.pt",  # YOLOv11 medium - specific for face detection
+    "yolov11l-face": "yolov11l-face.pt",  # YOLOv11 large - specific for face detection
+}
+
+DEFAULT_MODEL = "yolov8n"
+
+# Models trained on faces; the others detect every COCO object class
+FACE_MODELS = [key for key in AVAILABLE_MODELS if key.endswith("-face")]
+
+
+def resolve_model_key(key: Optional[str]) -> str:
+    """Map a requested model name to a known key, falling back to the default."""
+    return key if key in AVAILABLE_MODELS else DEFAULT_MODEL
+
+
+def resolve_face_model_key(key: Optional[str]) -> str:
+    """
+    Map a model name requested for recognition to a face detector key.
+
+    Every box of a general model (a person, a chair, a cup) would be
+    embedded and logged as an unknown visit, so only FACE_MODELS are
+    accepted. No key means GALLERY_DETECTOR; any other key raises ValueError.
+    """
+    if not key:
+        return settings.GALLERY_DETECTOR
+    if key not in FACE_MODELS:
+        raise ValueError(f"{key} is not a face detection model, use one of: {', '.join(FACE_MODELS)}")
+    return key
+
+
+def _estimate_bytes(model: Any, path: str) -> int:
+    """Estimate the resident size of a loaded model in bytes."""
+    try:
+        return int(model.nbytes)
+    except Exception:
+        pass
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ModelRegistry:
+    """
+    Thread-safe LRU cache of detection models keyed by AVAILABLE_MODELS name.
+
+    Each model is loaded at most once per process. When the summed size of
+    the resident models exceeds ``budget_bytes`` the least recently used
+    models are evicted, but the most recently requested one is always kept.
+    Models are built by ``load_detector`` and therefore use the backend
+    selected by DETECTOR_BACKEND.
+    """
+
+    def __init__(
+        self,
+        budget_bytes: int,
+        loader: Callable[[str], Any] = load_detector,
+        sizer: Callable[[Any, str], int] = _estimate_bytes,
+    ):
+        self.budget_bytes = budget_bytes
+        self._loader = loader
+        self._sizer = sizer
+        self._models: "OrderedDict[str, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Optional[str]):
+        """Return the model for ``key``, loading it on first use."""
+        key = resolve_model_key(key)
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Load outside the registry lock so other models stay available,
+        # while concurrent requests for the same key wait for one load.
+        with key_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self.misses += 1
+
+            path = AVAILABLE_MODELS[key]
+            model = self._loader(path)
+            size = self._sizer(model, path)
+
+            with self._lock:
+                self._models[key] = (model, size)
+                self._evict()
+            return model
+
+    def _evict(self):
+        """Drop least recently used models until the budget is respected."""
+        while len(self._models) > 1 and self.resident_bytes() > self.budget_bytes:
+            self._models.popitem(last=False)
+            self.evictions += 1
+
+    def resident_bytes(self) -> int:
+        """Total estimated size of the resident models."""
+        return sum(size for _, size in self._models.values())
+
+    def loaded(self) -> list[str]:
+        """Keys of resident models, least recently used first."""
+        with self._lock:
+            return list(self._models)
+
+    def clear(self):
+        """Drop every resident model."""
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> dict:
+        """Cache counters and residency information."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "loaded": list(self._models),
+                "resident_mb": round(self.resident_bytes() / 2**20, 1),
+                "budget_mb": round(self.budget_bytes / 2**20, 1),
+            }
+
+
+registry = ModelRegistry(budget_bytes=settings.MODEL_CACHE_BUDGET_MB * 2**20)
+
+
+def get_model(key: Optional[str]):
+    """Return the shared detection model for ``key``."""
+    return registry.get(key)
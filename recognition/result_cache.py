@@ -0,0 +1,99 @@
+"""
+Cache of recognition results for byte-identical uploads.
+
+Webcam clients and retrying integrations often send the same frame more
+than once. Results are keyed by a hash of the upload bytes together with
+the model key and the gallery version, so any face change (including one
+published by another worker) makes older entries unreachable; they then
+age out through the TTL and LRU eviction. Concurrent requests for a key
+that is still being computed share that one computation instead of
+starting their own.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+
+class ResultCache:
+    """
+    LRU cache of computed results with per-entry expiry and single-flight.
+
+    ``ttl_for`` returns how long a computed value stays cached, in seconds,
+    so callers can cache empty results for a shorter time or not at all (0).
+    """
+
+    def __init__(self, max_entries: int, ttl_for: Callable[[Any], float]):
+        self.max_entries = max_entries
+        self._ttl_for = ttl_for
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._pending: dict[Hashable, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(data: bytes, *parts: Hashable) -> tuple:
+        """Cache key of an upload and whatever else its result depends on."""
+        return (hashlib.blake2b(data, digest_size=16).digest(), *parts)
+
+    def fetch(self, key: Hashable, submit: Callable[[], Future]) -> Future:
+        """
+        Future for the value of ``key``.
+
+        Done already on a hit, shared with the running computation when one
+        is in flight, and otherwise the future returned by ``submit()``.
+        Failures are passed to every waiter but never cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+            elif entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(entry[1])
+                return future
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.coalesced += 1
+                return pending
+            self.misses += 1
+            future = submit()  # may raise, e.g. when the executor is saturated
+            self._pending[key] = future
+        future.add_done_callback(lambda done: self._store(key, done))
+        return future
+
+    def _store(self, key: Hashable, future: Future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            ttl = self._ttl_for(future.result())
+            if ttl <= 0:
+                return
+            self._entries[key] = (time.monotonic() + ttl, future.result())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Hit counters and occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
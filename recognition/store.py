@@ -0,0 +1,155 @@
+"""
+Memory-mapped gallery file shared by all worker processes.
+
+The file holds a fixed header followed by the face id table, the
+``is_allowed`` flags, the encoded embedding rows (see
+``recognition.codecs``) and the codec's training state, each aligned to
+64 bytes. Workers map it read-only, so the matrix exists once in the
+page cache however many workers there are, and a cold start maps the file
+instead of reading embeddings back from the database.
+
+A writer publishes a new version by writing a temporary file next to the
+current one and renaming it over it. Readers still holding the previous
+mapping keep a consistent snapshot and pick up the new file on their next
+``changed`` check.
+"""
+
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process development only
+    fcntl = None
+
+MAGIC = b"FRGAL002"
+ALIGN = 64
+# magic, version, count, bytes per encoded row, codec state length, embedding signature
+_HEADER = struct.Struct("<8sQQII64s")
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _layout(count: int, width: int, state_len: int) -> tuple[int, int, int, int, int]:
+    """Byte offsets of the ids, flags, codes and codec state, and the total file size."""
+    ids_at = _align(_HEADER.size)
+    allowed_at = _align(ids_at + 8 * count)
+    codes_at = _align(allowed_at + count)
+    state_at = _align(codes_at + count * width)
+    return ids_at, allowed_at, codes_at, state_at, state_at + state_len
+
+
+@dataclass
+class StoreSnapshot:
+    """Read-only arrays mapped from one version of the gallery file."""
+
+    version: int
+    signature: str
+    ids: np.ndarray
+    allowed: np.ndarray
+    codes: np.ndarray  # (count, bytes per row) uint8
+    state: bytes  # codec training state
+    stamp: tuple[int, int]  # (inode, mtime) of the mapped file
+
+
+class EmbeddingStore:
+    """Versioned gallery file at ``path``."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def stamp(self) -> Optional[tuple[int, int]]:
+        """(inode, mtime) of the published file, or None; one ``stat`` call, no lock."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def changed(self, snapshot: Optional[StoreSnapshot]) -> bool:
+        """Whether a different version was published since ``snapshot`` was mapped."""
+        return self.stamp() != (snapshot.stamp if snapshot else None)
+
+    def open(self) -> Optional[StoreSnapshot]:
+        """Map the current version, or None if nothing was published yet."""
+        try:
+            with open(self.path, "rb") as f:
+                stamp = os.fstat(f.fileno())
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        magic, version, count, width, state_len, signature = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a gallery file of this format")
+        ids_at, allowed_at, codes_at, state_at, size = _layout(count, width, state_len)
+        if len(buffer) < size:
+            raise ValueError(f"{self.path} is truncated")
+        return StoreSnapshot(
+            version=version,
+            signature=signature.rstrip(b"\0").decode(),
+            ids=np.frombuffer(buffer, np.int64, count, ids_at),
+            allowed=np.frombuffer(buffer, np.bool_, count, allowed_at),
+            codes=np.frombuffer(buffer, np.uint8, count * width, codes_at).reshape(count, width),
+            state=buffer[state_at:size],
+            stamp=(stamp.st_ino, stamp.st_mtime_ns),
+        )
+
+    def publish(
+        self,
+        ids: np.ndarray,
+        allowed: np.ndarray,
+        codes: np.ndarray,
+        signature: str,
+        state: bytes = b"",
+    ) -> int:
+        """Atomically replace the file with a new version and return its number."""
+        try:
+            current = self.open()
+        except ValueError:
+            current = None  # older format, overwritten below
+        version = current.version + 1 if current else 1
+        count = len(ids)
+        width = codes.shape[1] if count else 0
+        ids_at, allowed_at, codes_at, state_at, size = _layout(count, width, len(state))
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.truncate(size)
+            f.write(_HEADER.pack(MAGIC, version, count, width, len(state), signature.encode()[:64]))
+            f.seek(ids_at)
+            f.write(np.ascontiguousarray(ids, np.int64).tobytes())
+            f.seek(allowed_at)
+            f.write(np.ascontiguousarray(allowed, np.bool_).tobytes())
+            f.seek(codes_at)
+            f.write(np.ascontiguousarray(codes, np.uint8).tobytes())
+            f.seek(state_at)
+            f.write(state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        return version
+
+    @contextmanager
+    def lock(self):
+        """Serialise writers across processes so no published update is lost."""
+        if fcntl is None:
+            yield
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(f"{self.path.name}.lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,64 @@
+"""
+Frame pacing for live streams over a WebSocket.
+
+A client can send frames faster than they are recognized. Instead of
+queueing them, each connection keeps only the newest unprocessed frame
+(``LatestFrame``), so a slow server skips ahead rather than falling
+further behind. ``FrameRateLimiter`` caps how many frames per second one
+connection gets processed; frames arriving in between replace each other
+and count as dropped.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+
+class LatestFrame:
+    """Single-slot mailbox that always hands out the newest frame."""
+
+    def __init__(self):
+        self._frame: Optional[bytes] = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame: bytes):
+        """Store a frame, replacing one that was never processed."""
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self.received += 1
+        self._ready.set()
+
+    def close(self):
+        """Wake the consumer; ``get`` returns None once no frame is left."""
+        self._closed = True
+        self._ready.set()
+
+    async def get(self) -> Optional[bytes]:
+        """Wait for and take the newest frame, or None after ``close``."""
+        while self._frame is None:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class FrameRateLimiter:
+    """Spaces processed frames at least ``1 / max_fps`` seconds apart."""
+
+    def __init__(self, max_fps: float):
+        self.interval = 1 / max_fps if max_fps > 0 else 0
+        self._next = 0.0
+
+    async def wait(self):
+        """Sleep until the next frame may be processed."""
+        now = time.monotonic()
+        if self._next > now:
+            await asyncio.sleep(self._next - now)
+            now = self._next
+        self._next = now + self.interval
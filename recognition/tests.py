@@ -0,0 +1,1026 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from config import settings
+from recognition.ann import IVFIndex
+from recognition.batching import MicroBatcher
+from recognition.codecs import PQCodec, make_codec
+from recognition.decoding import decode_upload, jpeg_size, reduction_for
+from recognition.detectors import Detections
+from recognition.events import RESET, EventBroker, EventLog
+from recognition.gallery import Gallery
+from recognition.matching import Match, Recognition, l2_normalize
+from recognition.motion import MotionGate, parse_roi
+from recognition.registry import ModelRegistry, resolve_face_model_key
+from recognition.result_cache import ResultCache
+from recognition.store import EmbeddingStore
+from recognition.streaming import FrameRateLimiter, LatestFrame
+from recognition.tracking import Tracker, iou
+
+
+def random_embeddings(n: int, dim: int = 32, seed: int = 0) -> np.ndarray:
+    return l2_normalize(np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32))
+
+
+class ModelRegistryTests(unittest.TestCase):
+    def registry(self, budget_bytes: int, load_delay: float = 0.0) -> ModelRegistry:
+        self.loads = []
+
+        def loader(path):
+            time.sleep(load_delay)
+            self.loads.append(path)
+            return f"model:{path}"
+
+        return ModelRegistry(budget_bytes, loader=loader, sizer=lambda model, path: 40)
+
+    def test_loads_each_model_once(self):
+        registry = self.registry(budget_bytes=1000)
+
+        self.assertEqual(registry.get("yolov8n-face"), "model:yolov8n-face.pt")
+        self.assertEqual(registry.get("yolov8n-face"), "model:yolov8n-face.pt")
+        self.assertEqual(registry.get("no-such-model"), registry.get("yolov8n"))  # unknown keys use the default
+
+        self.assertEqual(self.loads, ["yolov8n-face.pt", "yolov8n.pt"])
+        stats = registry.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (2, 2, 0))
+
+    def test_evicts_least_recently_used_over_budget(self):
+        registry = self.registry(budget_bytes=100)
+        registry.get("yolov8n")
+        registry.get("yolov8m")
+        registry.get("yolov8n")  # yolov8m is now the least recently used
+        registry.get("yolov8n-face")
+
+        self.assertEqual(registry.loaded(), ["yolov8n", "yolov8n-face"])
+        self.assertEqual(registry.resident_bytes(), 80)
+        self.assertEqual(registry.stats()["evictions"], 1)
+
+        registry.get("yolov8m")
+        self.assertEqual(self.loads.count("yolov8m.pt"), 2)
+
+    def test_keeps_the_newest_model_over_budget(self):
+        registry = self.registry(budget_bytes=10)
+        registry.get("yolov8n")
+        registry.get("yolov8m")
+        self.assertEqual(registry.loaded(), ["yolov8m"])
+
+    def test_concurrent_requests_share_one_load(self):
+        registry = self.registry(budget_bytes=1000, load_delay=0.1)
+        threads = [threading.Thread(target=registry.get, args=("yolov8n",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.loads, ["yolov8n.pt"])
+        stats = registry.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (7, 1))
+
+    def test_recognition_only_accepts_face_models(self):
+        self.assertEqual(resolve_face_model_key("yolov8m-face"), "yolov8m-face")
+        with mock.patch.object(settings, "GALLERY_DETECTOR", "yolov8l-face"):
+            self.assertEqual(resolve_face_model_key(None), "yolov8l-face")
+        for key in ("yolov8n", "yolov8m", "no-such-model"):
+            with self.subTest(key), self.assertRaises(ValueError):
+                resolve_face_model_key(key)
+
+
+class MicroBatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.models = []
+
+    def model_getter(self, key):
+        self.models.append(key)
+
+        def model(frames, **kwargs):
+            self.batches.append(len(frames))
+            return [f"{key}:{frame}" for frame in frames]
+
+        return model
+
+    def test_full_batches_flush_without_waiting_for_the_window(self):
+        batcher = MicroBatcher(window_ms=300, max_batch=8, model_getter=self.model_getter)
+        start = time.monotonic()
+        futures = [batcher.submit("yolov8n", i) for i in range(10)]
+
+        self.assertEqual(futures[0].result(timeout=5), "yolov8n:0")
+        self.assertLess(time.monotonic() - start, 0.25)
+        self.assertEqual([f.result(timeout=5) for f in futures], [f"yolov8n:{i}" for i in range(10)])
+        self.assertEqual(self.batches, [8, 2])
+        self.assertEqual(batcher.stats()["largest_batch"], 8)
+
+    def test_partial_batch_flushes_when_the_window_closes(self):
+        batcher = MicroBatcher(window_ms=50, max_batch=8, model_getter=self.model_getter)
+        start = time.monotonic()
+        futures = [batcher.submit("yolov8n", i) for i in range(3)]
+
+        self.assertEqual([f.result(timeout=5) for f in futures], ["yolov8n:0", "yolov8n:1", "yolov8n:2"])
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        self.assertEqual(self.batches, [3])
+
+    def test_models_are_batched_separately(self):
+        batcher = MicroBatcher(window_ms=50, max_batch=8, model_getter=self.model_getter)
+        face = batcher.submit("yolov8n-face", 1)
+        general = batcher.submit("yolov8n", 2)
+
+        self.assertEqual(face.result(timeout=5), "yolov8n-face:1")
+        self.assertEqual(general.result(timeout=5), "yolov8n:2")
+        self.assertEqual(sorted(self.models), ["yolov8n", "yolov8n-face"])
+
+    def test_errors_reach_every_caller(self):
+        def broken(key):
+            raise RuntimeError("weights missing")
+
+        batcher = MicroBatcher(window_ms=50, max_batch=8, model_getter=broken)
+        futures = [batcher.submit("yolov8n", i) for i in range(3)]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, "weights missing"):
+                future.result(timeout=5)
+
+        batcher._model_getter = self.model_getter  # the worker survives the failure
+        self.assertEqual(batcher.detect("yolov8n", 4, timeout=5), "yolov8n:4")
+
+
+class GalleryTestCase(unittest.TestCase):
+    """Runs every test with its own store and index directories, store and ANN off by default."""
+
+    overrides: dict = {}
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        options = {
+            "GALLERY_ENCODING": "float32",
+            "GALLERY_STORE_ENABLED": False,
+            "GALLERY_STORE_DIR": self.tmp / "store",
+            "ANN_ENABLED": False,
+            "ANN_INDEX_DIR": self.tmp / "index",
+        }
+        options.update(self.overrides)
+        patcher = mock.patch.multiple(settings, **options)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        signature = mock.patch("recognition.gallery.embedding_signature", return_value=("Facenet", "test"))
+        signature.start()
+        self.addCleanup(signature.stop)
+
+    def gallery(self, vectors: np.ndarray, name=None, allowed=None) -> Gallery:
+        allowed = [True] * len(vectors) if allowed is None else allowed
+        return Gallery(lambda: [(i + 1, v, a) for i, (v, a) in enumerate(zip(vectors, allowed))], name=name)
+
+    def assertConsistent(self, gallery: Gallery):
+        """Every face id maps to the row that holds it, and no row is unaccounted for."""
+        size = gallery._size
+        self.assertEqual(len(gallery._rows), size)
+        for face_id, row in gallery._rows.items():
+            self.assertEqual(int(gallery._ids[row]), face_id)
+        self.assertEqual(sorted(gallery._rows.values()), list(range(size)))
+
+
+class GalleryTests(GalleryTestCase):
+    def test_search_returns_nearest_first(self):
+        vectors = random_embeddings(50)
+        gallery = self.gallery(vectors, allowed=[i % 2 == 0 for i in range(50)])
+
+        matches = gallery.search(vectors[[3, 10]], k=3)
+
+        self.assertEqual([m[0].face_id for m in matches], [4, 11])
+        self.assertAlmostEqual(matches[0][0].distance, 0.0, places=5)
+        self.assertFalse(matches[0][0].is_allowed)
+        self.assertTrue(matches[1][0].is_allowed)
+        for probe_matches in matches:
+            distances = [m.distance for m in probe_matches]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_remove_moves_last_row_into_slot(self):
+        vectors = random_embeddings(5)
+        gallery = self.gallery(vectors)
+        self.assertEqual(len(gallery), 5)
+
+        gallery.remove(2)
+
+        self.assertEqual(len(gallery), 4)
+        self.assertEqual(gallery._rows[5], 1)  # the last face took row 1
+        self.assertConsistent(gallery)
+        self.assertEqual(gallery.search(vectors[4:5], k=1)[0][0].face_id, 5)
+        self.assertNotIn(2, [m.face_id for m in gallery.search(vectors[1:2], k=4)[0]])
+
+    def test_upsert_adds_and_replaces_in_place(self):
+        vectors = random_embeddings(12)
+        gallery = self.gallery(vectors[:10])
+        len(gallery)
+
+        gallery.upsert(11, vectors[10], True)
+        gallery.upsert(3, vectors[11], False)
+
+        self.assertEqual(len(gallery), 11)
+        self.assertConsistent(gallery)
+        match = gallery.search(vectors[11:12], k=1)[0][0]
+        self.assertEqual((match.face_id, match.is_allowed), (3, False))
+        self.assertEqual(gallery.search(vectors[10:11], k=1)[0][0].face_id, 11)
+
+    def test_upsert_without_embedding_removes(self):
+        gallery = self.gallery(random_embeddings(3))
+        len(gallery)
+        gallery.upsert(2, None, True)
+        self.assertEqual(sorted(gallery._rows), [1, 3])
+
+    def test_growth_beyond_capacity_keeps_rows(self):
+        vectors = random_embeddings(100)
+        gallery = self.gallery(vectors[:1])
+        len(gallery)
+        for i in range(1, 100):
+            gallery.upsert(i + 1, vectors[i], True)
+
+        self.assertConsistent(gallery)
+        found = [m[0].face_id for m in gallery.search(vectors, k=1)]
+        self.assertEqual(found, list(range(1, 101)))
+
+    def test_every_change_bumps_version(self):
+        vectors = random_embeddings(3)
+        gallery = self.gallery(vectors)
+        len(gallery)
+        versions = [gallery.version]
+        gallery.upsert(4, vectors[0], True)
+        versions.append(gallery.version)
+        gallery.remove(1)
+        versions.append(gallery.version)
+        gallery.invalidate()
+        versions.append(gallery.version)
+        self.assertEqual(len(set(versions)), 4)
+
+    def test_invalidate_reloads_from_loader(self):
+        rows = [(1, random_embeddings(1)[0], True)]
+        gallery = Gallery(lambda: list(rows))
+        self.assertEqual(len(gallery), 1)
+        rows.append((2, random_embeddings(1, seed=1)[0], True))
+        self.assertEqual(len(gallery), 1)
+        gallery.invalidate()
+        self.assertEqual(len(gallery), 2)
+
+    def test_empty_gallery_has_no_matches(self):
+        gallery = self.gallery(np.zeros((0, 32), np.float32))
+        self.assertEqual(gallery.search(random_embeddings(2), k=3), [[], []])
+
+
+class IVFIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.vectors = random_embeddings(400)
+        self.ids = np.arange(100, 500, dtype=np.int64)
+        self.index = IVFIndex(nlist=8, nprobe=8)
+        self.index.build(self.ids, self.index.codec.encode(self.vectors))
+
+    def test_probing_every_list_is_exact(self):
+        results = self.index.search(self.vectors[:20], k=5)
+
+        exact = np.argsort(-(self.vectors[:20] @ self.vectors.T), axis=1)[:, :5]
+        for (ids, distances), expected in zip(results, exact):
+            self.assertEqual(ids.tolist(), self.ids[expected].tolist())
+            self.assertTrue(np.all(distances >= 0))
+            self.assertTrue(np.all(np.diff(distances) >= 0))
+
+    def test_add_replace_and_remove(self):
+        new = random_embeddings(2, seed=1)
+        codes = self.index.codec.encode(new)
+        self.index.add(1000, codes[0])
+        self.index.add(100, codes[1])  # replaces face 100's code
+        self.index.remove(101)
+
+        self.assertEqual(len(self.index), 400)
+        self.assertEqual(self.index.search(new[:1], k=1)[0][0].tolist(), [1000])
+        self.assertEqual(self.index.search(new[1:], k=1)[0][0].tolist(), [100])
+        ids, _ = self.index.entries()
+        self.assertNotIn(101, ids.tolist())
+
+    def test_save_and_load_round_trip(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        path = Path(tmp) / "index.npz"
+        self.index.save(path)
+        restored = IVFIndex.load(path)
+
+        self.assertEqual(len(restored), len(self.index))
+        np.testing.assert_array_equal(restored.centroids, self.index.centroids)
+        for (a_ids, a_dist), (b_ids, b_dist) in zip(
+            restored.search(self.vectors[:10], k=3), self.index.search(self.vectors[:10], k=3)
+        ):
+            np.testing.assert_array_equal(a_ids, b_ids)
+            np.testing.assert_allclose(a_dist, b_dist)
+
+    def test_sync_applies_only_differences(self):
+        vectors = self.vectors.copy()
+        vectors[0] = random_embeddings(1, seed=2)[0]
+        ids, vectors = self.ids[:-1], vectors[:-1]  # last face deleted
+
+        codes = self.index.codec.encode(vectors)
+
+        changed = self.index.sync(ids, codes)
+
+        self.assertEqual(changed, 2)
+        self.assertEqual(len(self.index), 399)
+        self.assertEqual(self.index.search(vectors[:1], k=1)[0][0].tolist(), [100])
+        self.assertEqual(self.index.sync(ids, codes), 0)
+
+    def test_sync_asks_for_rebuild(self):
+        encode = self.index.codec.encode
+        self.assertIsNone(self.index.sync(self.ids, encode(random_embeddings(400, dim=16))))
+        many = np.arange(2000, dtype=np.int64)
+        self.assertIsNone(self.index.sync(many, encode(random_embeddings(2000))))
+
+    def test_pq_lists_hold_codes_scored_by_the_codec(self):
+        codec = make_codec("pq", pq_subspaces=8)
+        codec.fit(self.vectors)
+        codes = codec.encode(self.vectors)
+        index = IVFIndex(nlist=8, nprobe=8, codec=codec)
+        index.build(self.ids, codes)
+
+        _, stored = index.entries()
+        self.assertEqual(stored.shape, (400, 8))
+        self.assertEqual(stored.dtype, np.uint8)
+        ids, distances = index.search(self.vectors[:1], k=400)[0]
+        similarity = codec.similarity(self.vectors[:1], codes)[0]
+        expected = np.maximum(1.0 - similarity[ids - 100], 0.0)
+        np.testing.assert_allclose(distances, expected, atol=1e-6)
+
+        codec.fit(self.vectors[:300])  # retrained codebooks make the stored codes meaningless
+        self.assertIsNone(index.sync(self.ids, codec.encode(self.vectors)))
+
+
+class GalleryIndexTests(GalleryTestCase):
+    overrides = {"ANN_ENABLED": True, "ANN_MIN_SIZE": 50, "ANN_NLIST": 4, "ANN_NPROBE": 4}
+
+    def test_index_used_from_min_size(self):
+        small = self.gallery(random_embeddings(49))
+        len(small)
+        self.assertIsNone(small._index)
+
+        vectors = random_embeddings(60)
+        large = self.gallery(vectors)
+        self.assertEqual([m[0].face_id for m in large.search(vectors[:5], k=1)], [1, 2, 3, 4, 5])
+        self.assertIsNotNone(large._index)
+
+    def test_index_built_when_upserts_cross_min_size(self):
+        vectors = random_embeddings(60)
+        gallery = self.gallery(vectors[:40])
+        len(gallery)
+        for i in range(40, 60):
+            gallery.upsert(i + 1, vectors[i], True)
+            self.assertEqual(gallery._index is not None, i + 1 >= 50)
+        self.assertEqual(len(gallery._index), 60)
+        self.assertEqual(gallery.search(vectors[55:56], k=1)[0][0].face_id, 56)
+
+    def test_index_follows_removals(self):
+        vectors = random_embeddings(60)
+        gallery = self.gallery(vectors)
+        len(gallery)
+        gallery.remove(7)
+        self.assertEqual(len(gallery._index), 59)
+        self.assertNotIn(7, [m.face_id for m in gallery.search(vectors[6:7], k=5)[0]])
+
+    def test_persisted_index_is_restored(self):
+        vectors = random_embeddings(60)
+        gallery = self.gallery(vectors, name="faces")
+        len(gallery)
+        self.assertTrue((self.tmp / "index" / "faces.npz").exists())
+
+        with mock.patch.object(IVFIndex, "build") as build:
+            restarted = self.gallery(vectors, name="faces")
+            self.assertEqual(restarted.search(vectors[:1], k=1)[0][0].face_id, 1)
+        build.assert_not_called()
+
+
+class EmbeddingStoreTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, ignore_errors=True)
+        self.store = EmbeddingStore(Path(tmp) / "faces.bin")
+
+    def publish(self, count: int, signature: str = "Facenet/test/float32") -> int:
+        codes = random_embeddings(count).view(np.uint8)
+        return self.store.publish(np.arange(count), np.arange(count) % 2 == 0, codes, signature, b"state")
+
+    def test_publish_and_open_round_trip(self):
+        self.assertIsNone(self.store.open())
+        codes = random_embeddings(5).view(np.uint8)
+        self.assertEqual(self.store.publish(np.arange(5), np.ones(5, bool), codes, "sig", b"xyz"), 1)
+
+        snapshot = self.store.open()
+
+        self.assertEqual(snapshot.version, 1)
+        self.assertEqual(snapshot.signature, "sig")
+        np.testing.assert_array_equal(snapshot.ids, np.arange(5))
+        np.testing.assert_array_equal(snapshot.codes, codes)
+        self.assertEqual(bytes(snapshot.state), b"xyz")
+
+    def test_new_version_is_detected_and_old_snapshot_stays_valid(self):
+        self.publish(3)
+        old = self.store.open()
+        self.assertFalse(self.store.changed(old))
+
+        self.assertEqual(self.publish(4), 2)
+
+        self.assertTrue(self.store.changed(old))
+        self.assertEqual(len(old.ids), 3)  # still mapped from the replaced file
+        self.assertEqual(len(self.store.open().ids), 4)
+
+    def test_publish_leaves_no_temporary_files(self):
+        self.publish(3)
+        self.publish(3)
+        self.assertEqual([p.name for p in self.store.path.parent.iterdir() if p.suffix == ".tmp"], [])
+
+    def test_rejects_truncated_and_foreign_files(self):
+        self.publish(10)
+        data = self.store.path.read_bytes()
+        self.store.path.write_bytes(data[: len(data) // 2])
+        with self.assertRaises(ValueError):
+            self.store.open()
+
+        self.store.path.write_bytes(b"NOTAGALLERY" + bytes(200))
+        with self.assertRaises(ValueError):
+            self.store.open()
+
+
+class SharedGalleryTests(GalleryTestCase):
+    overrides = {"GALLERY_STORE_ENABLED": True}
+
+    def test_workers_share_published_changes(self):
+        vectors = random_embeddings(10)
+        loads = []
+        rows = [(i + 1, v, True) for i, v in enumerate(vectors[:8])]
+        first = Gallery(lambda: loads.append("first") or rows, name="faces")
+        second = Gallery(lambda: loads.append("second") or rows, name="faces")
+
+        self.assertEqual(len(first), 8)
+        self.assertEqual(len(second), 8)
+        self.assertEqual(loads, ["first"])  # the second worker mapped the published file
+
+        token = second.version_token()
+        first.upsert(9, vectors[8], True)
+        first.remove(1)
+
+        self.assertNotEqual(second.version_token(), token)
+        self.assertEqual(second.search(vectors[8:9], k=1)[0][0].face_id, 9)
+        self.assertEqual(len(second), 8)
+        self.assertConsistent(second)
+        self.assertEqual(loads, ["first"])
+
+    def test_signature_mismatch_reloads_from_database(self):
+        vectors = random_embeddings(4)
+        len(self.gallery(vectors, name="faces"))
+
+        loads = []
+        with mock.patch("recognition.gallery.embedding_signature", return_value=("Facenet", "other")):
+            other = Gallery(lambda: loads.append(1) or [(1, vectors[0], True)], name="faces")
+            self.assertEqual(len(other), 1)
+            self.assertEqual(loads, [1])
+            self.assertTrue(EmbeddingStore(self.tmp / "store" / "faces.bin").open().signature.endswith("other/float32"))
+
+    def test_pq_subspaces_change_reloads_from_database(self):
+        vectors = random_embeddings(20)
+        with mock.patch.multiple(settings, GALLERY_ENCODING="pq", GALLERY_PQ_SUBSPACES=4):
+            len(self.gallery(vectors, name="faces"))
+
+        loads = []
+        with mock.patch.multiple(settings, GALLERY_ENCODING="pq", GALLERY_PQ_SUBSPACES=8):
+            gallery = Gallery(lambda: loads.append(1) or [(i + 1, v, True) for i, v in enumerate(vectors)], name="faces")
+            self.assertEqual(gallery.search(vectors[:1], k=1)[0][0].face_id, 1)
+            self.assertEqual(loads, [1])
+            snapshot = EmbeddingStore(self.tmp / "store" / "faces.bin").open()
+            self.assertTrue(snapshot.signature.endswith("/pq8"))
+            self.assertEqual(snapshot.codes.shape[1], 8)
+
+    def test_invalidate_reloads_instead_of_mapping(self):
+        rows = [(1, random_embeddings(1)[0], True)]
+        gallery = Gallery(lambda: list(rows), name="faces")
+        len(gallery)
+        rows.append((2, random_embeddings(1, seed=1)[0], True))
+        gallery.invalidate()
+        self.assertEqual(len(gallery), 2)
+
+
+class CodecTests(unittest.TestCase):
+    # Largest acceptable round-trip error per element, and the bytes per 128-d row
+    expected = {"float32": (0.0, 512), "float16": (1e-3, 256), "int8": (0.01, 132), "pq": (0.5, 16)}
+
+    def setUp(self):
+        self.vectors = random_embeddings(1000, dim=128)
+
+    def codec(self, name):
+        codec = make_codec(name, pq_subspaces=16)
+        codec.fit(self.vectors)
+        return codec
+
+    def test_round_trip_error_and_width(self):
+        for name, (tolerance, width) in self.expected.items():
+            with self.subTest(name):
+                codec = self.codec(name)
+                codes = codec.encode(self.vectors)
+                self.assertEqual(codes.shape, (1000, width))
+                self.assertEqual(codes.dtype, np.uint8)
+                self.assertEqual(codec.dimension(width), 128)
+                self.assertLessEqual(np.abs(codec.decode(codes) - self.vectors).max(), tolerance)
+
+    def test_quantized_search_keeps_nearest_neighbour(self):
+        probes = l2_normalize(self.vectors[:50] + 0.02 * random_embeddings(50, dim=128, seed=1))
+        for name in ("float16", "int8"):
+            with self.subTest(name):
+                codec = self.codec(name)
+                found = codec.similarity(probes, codec.encode(self.vectors)).argmax(1)
+                self.assertEqual(found.tolist(), list(range(50)))
+
+    def test_pq_ranking_close_to_exact(self):
+        codec = self.codec("pq")
+        exact = (self.vectors[:50] @ self.vectors.T).argmax(1)
+        found = codec.similarity(self.vectors[:50], codec.encode(self.vectors)).argmax(1)
+        self.assertGreaterEqual((found == exact).mean(), 0.8)
+
+    def test_similarity_matches_decoded_vectors(self):
+        probes = random_embeddings(5, dim=128, seed=3)
+        for name in self.expected:
+            with self.subTest(name):
+                codec = self.codec(name)
+                codes = codec.encode(self.vectors)
+                np.testing.assert_allclose(
+                    codec.similarity(probes, codes), probes @ codec.decode(codes).T, atol=1e-4
+                )
+
+    def test_pq_state_round_trip(self):
+        codec = self.codec("pq")
+        restored = PQCodec(16)
+        restored.load_state(codec.state())
+        np.testing.assert_array_equal(restored.encode(self.vectors), codec.encode(self.vectors))
+        self.assertFalse(restored.needs_fit(1000))
+        self.assertTrue(restored.needs_fit(2001))
+
+    def test_pq_rejects_codes_of_other_subspace_counts(self):
+        state = self.codec("pq").state()
+        other = PQCodec(8)
+        other.load_state(state)
+        self.assertEqual(other.signature, "pq8")
+        self.assertIsNone(other.dimension(16))
+        self.assertIsNone(other.dimension(8))  # codebooks are still for 16 subspaces
+
+    def test_unknown_encoding(self):
+        with self.assertRaises(ValueError):
+            make_codec("int4")
+
+
+class QuantizedGalleryTests(GalleryTestCase):
+    overrides = {"ANN_ENABLED": True, "ANN_MIN_SIZE": 50, "ANN_NLIST": 4, "GALLERY_PQ_SUBSPACES": 8}
+
+    def test_encoded_gallery_finds_enrolled_faces(self):
+        vectors = random_embeddings(60)
+        for encoding in ("float16", "int8", "pq"):
+            with self.subTest(encoding), mock.patch.object(settings, "GALLERY_ENCODING", encoding):
+                gallery = self.gallery(vectors)
+                found = [m[0].face_id for m in gallery.search(vectors[:20], k=1)]
+                self.assertGreaterEqual(np.mean(np.array(found) == np.arange(1, 21)), 0.9)
+
+    def test_restart_finds_upserted_faces_unchanged(self):
+        vectors = random_embeddings(80)
+        rows = [(i + 1, v, True) for i, v in enumerate(vectors[:79])]
+        for encoding in ("float16", "int8", "pq"):
+            with self.subTest(encoding), mock.patch.object(settings, "GALLERY_ENCODING", encoding):
+                gallery = Gallery(lambda: rows, name=encoding)
+                len(gallery)
+                gallery.upsert(80, vectors[79], True)
+                gallery.persist()
+
+                with mock.patch.object(IVFIndex, "add") as add:
+                    restarted = Gallery(lambda: rows + [(80, vectors[79], True)], name=encoding)
+                    len(restarted)
+                add.assert_not_called()
+
+    def test_distances_never_negative(self):
+        vectors = random_embeddings(60)
+        for encoding in ("float16", "int8", "pq"):
+            with self.subTest(encoding), mock.patch.object(settings, "GALLERY_ENCODING", encoding):
+                gallery = self.gallery(vectors)
+                for ann_enabled in (True, False):
+                    with mock.patch.object(settings, "ANN_ENABLED", ann_enabled):
+                        gallery.invalidate()
+                        matches = gallery.search(vectors, k=3)
+                    self.assertEqual(gallery._index is not None, ann_enabled)
+                    self.assertTrue(all(m.distance >= 0 for probe in matches for m in probe))
+
+
+@mock.patch.object(settings, "DECODE_DOWNSCALE", True)
+class UploadDecodingTests(unittest.TestCase):
+    def setUp(self):
+        # A 4000x3000 photo with a bright 1000 px "face" and a dark 400 px one
+        self.photo = np.full((3000, 4000, 3), 128, np.uint8)
+        self.photo[1000:2000, 1000:2000] = 255
+        self.photo[2400:2800, 3000:3400] = 0
+        self.data = cv2.imencode(".jpg", self.photo)[1].tobytes()
+
+    def detections(self, *boxes) -> Detections:
+        return Detections(boxes=np.array(boxes, np.float32), scores=np.ones(len(boxes), np.float32))
+
+    def test_jpeg_size_reads_the_frame_header(self):
+        self.assertEqual(jpeg_size(self.data), (4000, 3000))
+        self.assertIsNone(jpeg_size(cv2.imencode(".png", self.photo[:10, :10])[1].tobytes()))
+        self.assertIsNone(jpeg_size(b"\xff\xd8"))
+
+    def test_reduction_keeps_the_detector_input_covered(self):
+        self.assertEqual(reduction_for(4000, 640), 4)
+        self.assertEqual(reduction_for(6000, 640), 8)
+        self.assertEqual(reduction_for(1280, 640), 2)
+        self.assertEqual(reduction_for(1000, 640), 1)
+
+    def test_large_jpeg_is_decoded_reduced(self):
+        frame = decode_upload(self.data, 640)
+        self.assertEqual(frame.factor, 4)
+        self.assertEqual(frame.image.shape, (750, 1000, 3))
+        self.assertEqual(frame.scale, 4.0)
+
+        with mock.patch.object(settings, "DECODE_DOWNSCALE", False):
+            self.assertEqual(decode_upload(self.data, 640).image.shape, (3000, 4000, 3))
+
+    def test_faces_are_cropped_at_original_coordinates(self):
+        frame = decode_upload(self.data, 640)
+
+        image, faces = frame.for_faces(self.detections([1000, 1000, 2000, 2000]))
+        self.assertIs(image, frame.image)  # large enough at the detection scale
+        np.testing.assert_allclose(faces.boxes, [[250, 250, 500, 500]])
+
+        image, faces = frame.for_faces(self.detections([1000, 1000, 2000, 2000], [3000, 2400, 3400, 2800]))
+        self.assertEqual(image.shape, (1500, 2000, 3))  # decoded again for the small face
+        np.testing.assert_allclose(faces.boxes, [[500, 500, 1000, 1000], [1500, 1200, 1700, 1400]])
+        (x1, y1, x2, y2), (a1, b1, a2, b2) = faces.boxes.astype(int)
+        self.assertGreater(image[y1 + 10 : y2 - 10, x1 + 10 : x2 - 10].mean(), 240)
+        self.assertLess(image[b1 + 10 : b2 - 10, a1 + 10 : a2 - 10].mean(), 15)
+
+    def test_unreadable_upload(self):
+        with self.assertRaises(ValueError):
+            decode_upload(b"not an image", 640)
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.pool.shutdown)
+        self.calls = 0
+
+    def compute(self, value, delay: float = 0.0):
+        def submit():
+            self.calls += 1
+            return self.pool.submit(lambda: time.sleep(delay) or value)
+
+        return submit
+
+    def test_hit_after_first_computation(self):
+        cache = ResultCache(8, lambda value: 60)
+        key = ResultCache.key(b"frame", "yolov8n", 1)
+
+        self.assertEqual(cache.fetch(key, self.compute("a")).result(), "a")
+        self.assertEqual(cache.fetch(key, self.compute("b")).result(), "a")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_key_depends_on_bytes_and_parts(self):
+        key = ResultCache.key(b"frame", "yolov8n", 1)
+        self.assertEqual(key, ResultCache.key(b"frame", "yolov8n", 1))
+        self.assertNotEqual(key, ResultCache.key(b"frame!", "yolov8n", 1))
+        self.assertNotEqual(key, ResultCache.key(b"frame", "yolov8n", 2))  # gallery changed
+
+    def test_entries_expire(self):
+        cache = ResultCache(8, lambda value: 0.05)
+        cache.fetch("k", self.compute("a")).result()
+        time.sleep(0.1)
+        self.assertEqual(cache.fetch("k", self.compute("b")).result(), "b")
+        self.assertEqual(self.calls, 2)
+
+    def test_zero_ttl_and_failures_are_not_cached(self):
+        cache = ResultCache(8, lambda value: 0 if value is None else 60)
+        cache.fetch("empty", self.compute(None)).result()
+        cache.fetch("empty", self.compute(None)).result()
+        self.assertEqual(self.calls, 2)
+
+        def failing():
+            future = Future()
+            future.set_exception(RuntimeError("model failed"))
+            return future
+
+        with self.assertRaises(RuntimeError):
+            cache.fetch("bad", failing).result()
+        self.assertEqual(cache.fetch("bad", self.compute("ok")).result(), "ok")
+
+    def test_concurrent_requests_share_one_computation(self):
+        cache = ResultCache(8, lambda value: 60)
+        start = threading.Barrier(5)
+        results = []
+
+        def request():
+            start.wait()
+            results.append(cache.fetch("k", self.compute("a", delay=0.2)).result())
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ["a"] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()["coalesced"], 4)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache(2, lambda value: 60)
+        for key in ("a", "b"):
+            cache.fetch(key, self.compute(key)).result()
+        cache.fetch("a", self.compute("a"))  # "b" is now the oldest
+        cache.fetch("c", self.compute("c")).result()
+
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.fetch("b", self.compute("b2")).result(), "b2")
+        self.assertEqual(cache.fetch("c", self.compute("c2")).result(), "c")
+
+    def test_clear(self):
+        cache = ResultCache(8, lambda value: 60)
+        cache.fetch("k", self.compute("a")).result()
+        cache.clear()
+        self.assertEqual(cache.fetch("k", self.compute("b")).result(), "b")
+
+
+class GalleryVersionTokenTests(GalleryTestCase):
+    overrides = {"GALLERY_STORE_ENABLED": True}
+
+    def test_token_never_loads_and_changes_with_the_gallery(self):
+        loads = []
+        gallery = Gallery(lambda: loads.append(1) or [(1, random_embeddings(1)[0], True)], name="faces")
+        token = gallery.version_token()
+        self.assertEqual(loads, [])
+
+        len(gallery)
+        self.assertNotEqual(gallery.version_token(), token)
+        token = gallery.version_token()
+        gallery.upsert(2, random_embeddings(1, seed=1)[0], True)
+        self.assertNotEqual(gallery.version_token(), token)
+
+
+class LatestFrameTests(unittest.IsolatedAsyncioTestCase):
+    async def test_only_the_newest_frame_is_processed(self):
+        mailbox = LatestFrame()
+        for frame in (b"1", b"2", b"3"):
+            mailbox.put(frame)
+
+        self.assertEqual(await mailbox.get(), b"3")
+        self.assertEqual((mailbox.received, mailbox.dropped), (3, 2))
+
+    async def test_get_waits_for_a_frame(self):
+        mailbox = LatestFrame()
+        waiting = asyncio.create_task(mailbox.get())
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiting.done())
+
+        mailbox.put(b"frame")
+        self.assertEqual(await asyncio.wait_for(waiting, 1), b"frame")
+
+    async def test_close_hands_out_the_last_frame_then_none(self):
+        mailbox = LatestFrame()
+        mailbox.put(b"frame")
+        mailbox.close()
+        self.assertEqual(await mailbox.get(), b"frame")
+        self.assertIsNone(await mailbox.get())
+
+
+class FrameRateLimiterTests(unittest.IsolatedAsyncioTestCase):
+    async def test_frames_are_spaced_out(self):
+        limiter = FrameRateLimiter(max_fps=20)
+        start = time.monotonic()
+        for _ in range(5):
+            await limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    async def test_zero_means_unlimited(self):
+        limiter = FrameRateLimiter(max_fps=0)
+        start = time.monotonic()
+        for _ in range(100):
+            await limiter.wait()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+
+class IoUTests(unittest.TestCase):
+    def test_pairwise_overlap(self):
+        a = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], float)
+        b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [50, 50, 60, 60]], float)
+        np.testing.assert_allclose(iou(a, b), [[1.0, 1 / 3, 0.0], [0.0, 0.0, 0.0]])
+
+
+class TrackerTests(unittest.TestCase):
+    def test_moving_face_keeps_its_track(self):
+        tracker = Tracker(iou_threshold=0.3, max_age=2)
+        ids = {tracker.update([[100 + 5 * i, 100, 200 + 5 * i, 200]])[0].id for i in range(20)}
+        self.assertEqual(ids, {1})
+
+    def test_tracks_follow_their_faces(self):
+        tracker = Tracker(iou_threshold=0.3, max_age=2)
+        first = tracker.update([[0, 0, 100, 100], [300, 0, 400, 100]])
+        second = tracker.update([[302, 0, 402, 100], [2, 0, 102, 100]])
+        self.assertEqual([t.id for t in second], [first[1].id, first[0].id])
+
+        third = tracker.update([[2, 0, 102, 100], [302, 0, 402, 100], [600, 0, 700, 100]])
+        self.assertEqual([t.id for t in third], [first[0].id, first[1].id, 3])
+
+    def test_lost_tracks_are_dropped_after_max_age(self):
+        tracker = Tracker(iou_threshold=0.3, max_age=2)
+        track = tracker.update([[0, 0, 100, 100]])[0]
+        for misses in (1, 2):
+            tracker.update([])
+            self.assertEqual(track.misses, misses)
+            self.assertIn(track, tracker.tracks)
+
+        tracker.update([])
+        self.assertEqual(tracker.tracks, [])
+        self.assertNotEqual(tracker.update([[0, 0, 100, 100]])[0].id, track.id)
+
+    def test_missed_frame_within_max_age_keeps_the_track(self):
+        tracker = Tracker(iou_threshold=0.3, max_age=2)
+        track = tracker.update([[0, 0, 100, 100]])[0]
+        tracker.update([])
+        self.assertIs(tracker.update([[0, 0, 100, 100]])[0], track)
+        self.assertEqual(track.misses, 0)
+
+
+@mock.patch.multiple(settings, TRACK_RETRY_FRAMES=5, TRACK_REVERIFY_FRAMES=30, TRACK_CONFIDENT_DISTANCE=0.3)
+class TrackRecognitionTests(unittest.TestCase):
+    def frames_until_recognition(self, recognition):
+        tracker = Tracker()
+        track = tracker.update([[0, 0, 100, 100]])[0]
+        self.assertTrue(track.needs_recognition())
+        track.remember(recognition)
+        frames = 0
+        while not track.needs_recognition():
+            tracker.update([[0, 0, 100, 100]])
+            frames += 1
+        return frames
+
+    def test_confident_identity_is_reverified_rarely(self):
+        recognition = Recognition(Match(face_id=1, distance=0.1, is_allowed=True))
+        self.assertEqual(self.frames_until_recognition(recognition), 30)
+
+    def test_uncertain_identity_is_retried_sooner(self):
+        self.assertEqual(self.frames_until_recognition(Recognition(None)), 5)
+        self.assertEqual(self.frames_until_recognition(Recognition(Match(face_id=1, distance=0.45))), 5)
+
+
+class MotionGateTests(unittest.TestCase):
+    def setUp(self):
+        self.scene = np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8)
+
+    def with_object(self, y1, y2, x1, x2) -> np.ndarray:
+        frame = self.scene.copy()
+        frame[y1:y2, x1:x2] = 255
+        return frame
+
+    def test_static_scene_is_skipped_and_motion_passes(self):
+        gate = MotionGate(threshold=16, min_area=0.01, roi="")
+        self.assertTrue(gate.moving(self.scene))  # no background model yet
+        self.assertEqual([gate.moving(self.scene) for _ in range(10)], [False] * 10)
+
+        self.assertTrue(gate.moving(self.with_object(100, 300, 200, 400)))
+        self.assertEqual((gate.checked, gate.skipped), (12, 10))
+
+    def test_only_the_region_of_interest_counts(self):
+        gate = MotionGate(threshold=16, min_area=0.01, roi="0,0,0.5,0.5")
+        for _ in range(5):
+            gate.moving(self.scene)
+
+        self.assertFalse(gate.moving(self.with_object(300, 460, 400, 620)))
+        self.assertTrue(gate.moving(self.with_object(20, 200, 20, 300)))
+
+    def test_new_resolution_restarts_the_background(self):
+        gate = MotionGate(threshold=16, min_area=0.01, roi="")
+        for _ in range(3):
+            gate.moving(self.scene)
+        self.assertTrue(gate.moving(self.scene[:240]))
+
+    def test_parse_roi(self):
+        self.assertEqual(parse_roi(""), (0.0, 0.0, 1.0, 1.0))
+        self.assertEqual(parse_roi("0.1,0.2,0.9,1"), (0.1, 0.2, 0.9, 1.0))
+        with self.assertRaises(ValueError):
+            parse_roi("0.5,0,0.2,1")
+
+
+class EventBrokerTests(unittest.IsolatedAsyncioTestCase):
+    async def receive(self, subscription, count: int) -> list:
+        return [await subscription.get(timeout=1) for _ in range(count)]
+
+    async def test_published_events_reach_every_subscriber(self):
+        broker = EventBroker(history=10, queue_size=10)
+        first, second = broker.subscribe(), broker.subscribe()
+
+        broker.publish("visit", {"id": 1})
+        threading.Thread(target=broker.publish, args=("face", {"action": "deleted"})).start()
+
+        for subscription in (first, second):
+            events = await self.receive(subscription, 2)
+            self.assertEqual([e.type for e in events], ["visit", "face"])
+            self.assertEqual(events[0].id, f"{broker.epoch}-1")
+        self.assertEqual(
+            events[0].encode(), f'id: {broker.epoch}-1\nevent: visit\ndata: {{"id": 1}}\n\n'
+        )
+
+        first.close()
+        self.assertEqual(broker.stats(), {"subscribers": 1, "published": 2})
+
+    async def test_reconnect_replays_missed_events(self):
+        broker = EventBroker(history=10, queue_size=10)
+        for i in range(1, 4):
+            broker.publish("visit", {"id": i})
+
+        subscription = broker.subscribe(last_event_id=f"{broker.epoch}-1")
+
+        events = await self.receive(subscription, 2)
+        self.assertEqual([e.data["id"] for e in events], [2, 3])
+        self.assertIsNone(await subscription.get(timeout=0.05))
+
+    async def test_unknown_or_expired_ids_get_a_reset(self):
+        broker = EventBroker(history=2, queue_size=10)
+        for i in range(1, 6):
+            broker.publish("visit", {"id": i})
+
+        for last_event_id in (f"{broker.epoch}-2", "0000-4", f"{broker.epoch}-9", "garbage"):
+            with self.subTest(last_event_id):
+                subscription = broker.subscribe(last_event_id=last_event_id)
+                self.assertEqual([e.type for e in await self.receive(subscription, 1)], [RESET])
+                self.assertIsNone(await subscription.get(timeout=0.05))
+
+        subscription = broker.subscribe(last_event_id=f"{broker.epoch}-3")  # oldest kept is 4
+        self.assertEqual([e.data["id"] for e in await self.receive(subscription, 2)], [4, 5])
+
+    async def test_slow_subscriber_gets_a_reset_instead_of_a_backlog(self):
+        broker = EventBroker(history=10, queue_size=3)
+        subscription = broker.subscribe()
+        for i in range(1, 6):
+            broker.publish("visit", {"id": i})
+
+        events = await self.receive(subscription, 2)
+        self.assertEqual([e.type for e in events], [RESET, "visit"])
+        self.assertEqual(events[1].data["id"], 5)
+        self.assertIsNone(await subscription.get(timeout=0.05))
+
+
+class ListEventLog(EventLog):
+    """Shared log kept in a list, standing in for the events table."""
+
+    def __init__(self):
+        self.events = []
+
+    def append(self, type: str, data: dict):
+        self.events.append((len(self.events) + 1, type, data))
+
+    def read(self, after: int, limit: int) -> list:
+        return self.events[after : after + limit]
+
+    def last_id(self) -> int:
+        return len(self.events)
+
+
+@mock.patch.object(settings, "EVENTS_POLL_SECONDS", 0.01)
+class SharedEventBrokerTests(unittest.IsolatedAsyncioTestCase):
+    def worker(self, log: EventLog) -> EventBroker:
+        broker = EventBroker(history=10, queue_size=10)
+        broker.attach(log)
+        self.addCleanup(broker.close)
+        return broker
+
+    async def test_events_reach_subscribers_of_every_process(self):
+        log = ListEventLog()
+        log.append("visit", {"id": 0})  # before start: already part of the initial load
+        api, other_api, ingest = self.worker(log), self.worker(log), self.worker(log)
+        first, second = api.subscribe(), other_api.subscribe()
+
+        ingest.publish("visit", {"id": 1})
+        api.publish("face", {"action": "deleted"})
+
+        for subscription in (first, second):
+            events = [await subscription.get(timeout=1) for _ in range(2)]
+            self.assertEqual([(e.id, e.type) for e in events], [("log-2", "visit"), ("log-3", "face")])
+        self.assertEqual(other_api.stats(), {"subscribers": 1, "published": 3})
+
+        # The ids mean the same everywhere, so a client can reconnect to another worker
+        replayed = api.subscribe(last_event_id="log-2")
+        self.assertEqual((await replayed.get(timeout=1)).id, "log-3")
+        expired = api.subscribe(last_event_id="log-0")  # before this worker started
+        self.assertEqual((await expired.get(timeout=1)).type, RESET)
+
+    async def test_failing_log_does_not_break_publishers(self):
+        log = ListEventLog()
+        broker = self.worker(log)
+        with mock.patch.object(log, "append", side_effect=RuntimeError("database is locked")):
+            with self.assertLogs("recognition.events", "ERROR"):
+                broker.publish("visit", {"id": 1})
+        self.assertEqual(log.events, [])
+
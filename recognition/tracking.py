@@ -0,0 +1,152 @@
+"""
+SORT-style multi-object tracking of detected faces across video frames.
+
+Every track follows one face with a constant-velocity Kalman filter over
+box centre, area and aspect ratio. Each frame, the predicted boxes are
+matched to the new detections greedily by IoU. Matched tracks are
+corrected, unmatched detections start new tracks, and tracks unmatched
+for more than TRACK_MAX_AGE frames are dropped.
+
+A track remembers the last recognition of its face, so the embedding
+model only runs for tracks that are new, whose identity is uncertain
+(every TRACK_RETRY_FRAMES frames), or that are due for re-verification
+(every TRACK_REVERIFY_FRAMES frames). Every other frame reuses the cached
+identity.
+"""
+
+import itertools
+from typing import Optional
+
+import numpy as np
+
+from config import settings
+from recognition.matching import Recognition
+
+# Constant-velocity model over (cx, cy, area, aspect, vcx, vcy, varea)
+_F = np.eye(7)
+_F[0, 4] = _F[1, 5] = _F[2, 6] = 1
+_H = np.eye(4, 7)
+_R = np.diag([1.0, 1.0, 10.0, 10.0])
+_Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+_P0 = np.diag([10.0, 10.0, 10.0, 10.0, 1e4, 1e4, 1e4])
+
+
+def _to_measurement(box) -> np.ndarray:
+    x1, y1, x2, y2 = box
+    w, h = max(x2 - x1, 1.0), max(y2 - y1, 1.0)
+    return np.array([x1 + w / 2, y1 + h / 2, w * h, w / h])
+
+
+def _to_box(state: np.ndarray) -> np.ndarray:
+    cx, cy, area, aspect = state[:4]
+    w = np.sqrt(max(area * aspect, 1.0))
+    h = max(area, 1.0) / w
+    return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) x1, y1, x2, y2 boxes."""
+    a, b = a[:, None], b[None]
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+class Track:
+    """One tracked face and its cached identity."""
+
+    def __init__(self, track_id: int, box):
+        self.id = track_id
+        self._x = np.zeros(7)
+        self._x[:4] = _to_measurement(box)
+        self._p = _P0.copy()
+        self.hits = 1
+        self.misses = 0  # consecutive frames without a matching detection
+        self.recognition: Optional[Recognition] = None
+        self.frames_since_recognition = 0
+
+    def predict(self) -> np.ndarray:
+        """Advance the filter one frame and return the predicted box."""
+        if self._x[2] + self._x[6] <= 0:
+            self._x[6] = 0  # keep the area positive
+        self._x = _F @ self._x
+        self._p = _F @ self._p @ _F.T + _Q
+        self.frames_since_recognition += 1
+        return _to_box(self._x)
+
+    def correct(self, box):
+        """Fold a matched detection into the filter."""
+        residual = _to_measurement(box) - _H @ self._x
+        s = _H @ self._p @ _H.T + _R
+        gain = self._p @ _H.T @ np.linalg.inv(s)
+        self._x = self._x + gain @ residual
+        self._p = (np.eye(7) - gain @ _H) @ self._p
+        self.hits += 1
+        self.misses = 0
+
+    @property
+    def confident(self) -> bool:
+        """Whether the cached identity is a match closer than TRACK_CONFIDENT_DISTANCE."""
+        match = self.recognition.match if self.recognition else None
+        return match is not None and match.distance <= settings.TRACK_CONFIDENT_DISTANCE
+
+    def needs_recognition(self) -> bool:
+        """New, uncertain tracks are recognized again sooner than confident ones."""
+        if self.recognition is None:
+            return True
+        interval = settings.TRACK_REVERIFY_FRAMES if self.confident else settings.TRACK_RETRY_FRAMES
+        return self.frames_since_recognition >= interval
+
+    def remember(self, recognition: Recognition):
+        """Cache a fresh recognition of the track's face."""
+        self.recognition = recognition
+        self.frames_since_recognition = 0
+
+
+class Tracker:
+    """Tracks of one video stream; not thread-safe, feed frames in order."""
+
+    def __init__(
+        self,
+        iou_threshold: float = settings.TRACK_IOU_THRESHOLD,
+        max_age: int = settings.TRACK_MAX_AGE,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.tracks: list[Track] = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes: np.ndarray) -> list[Track]:
+        """Match one frame's detection boxes to tracks; returns a track per box, in order."""
+        boxes = np.asarray(boxes, np.float64).reshape(-1, 4)
+        predicted = np.array([track.predict() for track in self.tracks]).reshape(-1, 4)
+        assigned: list[Optional[Track]] = [None] * len(boxes)
+
+        if len(self.tracks) and len(boxes):
+            overlap = iou(predicted, boxes)
+            used_tracks, used_boxes = set(), set()
+            # Greedy assignment, best overlap first
+            for flat in np.argsort(-overlap, axis=None):
+                t, b = divmod(int(flat), len(boxes))
+                if overlap[t, b] < self.iou_threshold:
+                    break
+                if t in used_tracks or b in used_boxes:
+                    continue
+                used_tracks.add(t)
+                used_boxes.add(b)
+                self.tracks[t].correct(boxes[b])
+                assigned[b] = self.tracks[t]
+
+        for track in self.tracks:
+            if track not in assigned:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_age]
+
+        for b, track in enumerate(assigned):
+            if track is None:
+                assigned[b] = Track(next(self._ids), boxes[b])
+                self.tracks.append(assigned[b])
+        return assigned
@@ -0,0 +1,135 @@
+"""
+Startup model preloading and readiness tracking.
+
+Workers load GALLERY_DETECTOR (used for enrollment and, by default, for
+recognition) and any other PRELOAD_MODELS detectors, the recognition model
+and the dlib landmark predictor, then run each once on a dummy frame so
+the first real request does not pay for lazy initialisation. Readiness is
+only reported once this has finished, which lets a load balancer hold
+traffic back from cold workers. Only the detectors are required: the recognition model and
+the landmark predictor depend on optional packages and files, so their
+failures are reported as warnings and do not keep the worker unready.
+"""
+
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+from config import settings
+from recognition.alignment import get_landmark_predictor
+from recognition.embedding import get_embedder
+from recognition.registry import get_model, resolve_model_key
+
+
+def _split(value: str) -> list[str]:
+    """Split a comma-separated setting into its non-empty items."""
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def preload_models() -> list[str]:
+    """Detector keys to warm up: GALLERY_DETECTOR first, then PRELOAD_MODELS, without duplicates."""
+    keys = [resolve_model_key(key) for key in [settings.GALLERY_DETECTOR, *_split(settings.PRELOAD_MODELS)]]
+    return list(dict.fromkeys(keys))
+
+
+class Readiness:
+    """Tracks the progress of the startup warm-up."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.warmed: list[str] = []
+        self.errors: dict[str, str] = {}
+        self.warnings: dict[str, str] = {}  # failed optional steps
+
+    @property
+    def is_ready(self) -> bool:
+        """True once warm-up has finished without errors in required steps."""
+        return self._event.is_set() and not self.errors
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until warm-up finishes; returns whether the worker is ready."""
+        self._event.wait(timeout)
+        return self.is_ready
+
+    def status(self) -> dict:
+        """Readiness report suitable for a health endpoint."""
+        with self._lock:
+            if self.is_ready:
+                state = "ready"
+            elif self._event.is_set():
+                state = "failed"
+            else:
+                state = "warming_up" if self.started_at else "pending"
+            duration = None
+            if self.started_at and self.finished_at:
+                duration = round(self.finished_at - self.started_at, 2)
+            return {
+                "status": state,
+                "warmed": list(self.warmed),
+                "errors": dict(self.errors),
+                "warnings": dict(self.warnings),
+                "warmup_seconds": duration,
+            }
+
+
+readiness = Readiness()
+_warmup_thread: Optional[threading.Thread] = None
+_start_lock = threading.Lock()
+
+
+def warm_up(
+    models: Optional[Iterable[str]] = None,
+    recognition_model: Optional[str] = settings.PRELOAD_RECOGNITION_MODEL,
+    landmarks: bool = settings.PRELOAD_LANDMARKS,
+    state: Readiness = readiness,
+):
+    """Load and exercise each configured model once, recording the outcome."""
+    if models is None:
+        models = preload_models()
+
+    state.started_at = time.time()
+    frame = np.zeros((640, 640, 3), dtype=np.uint8)
+    steps = []  # (name, step, required)
+
+    for key in models:
+        key = resolve_model_key(key)
+        steps.append((f"detector:{key}", lambda key=key: get_model(key)([frame]), True))
+
+    if recognition_model:
+
+        def warm_recognition():
+            get_embedder().embed([frame[:160, :160]])
+
+        steps.append((f"recognition:{recognition_model}", warm_recognition, False))
+
+    if landmarks:
+        steps.append(("landmarks:dlib", get_landmark_predictor, False))
+
+    for name, step, required in steps:
+        try:
+            step()
+            with state._lock:
+                state.warmed.append(name)
+        except Exception as e:
+            with state._lock:
+                (state.errors if required else state.warnings)[name] = str(e)
+
+    state.finished_at = time.time()
+    state._event.set()
+
+
+def start_warmup(**kwargs) -> threading.Thread:
+    """Run warm_up in a background thread once per process."""
+    global _warmup_thread
+    with _start_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(
+                target=warm_up, kwargs=kwargs, name="model-warmup", daemon=True
+            )
+            _warmup_thread.start()
+        return _warmup_thread
@@ -0,0 +1,75 @@
+"""
+Server-Sent Events feed for the admin dashboard.
+"""
+
+import json
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Header
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
+
+from config import settings
+from database import SessionLocal
+from models import DashboardEvent
+from recognition.events import EventLog, event_broker
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+class DatabaseEventLog(EventLog):
+    """The ``events`` table, so every worker and ``ingest.py`` share one event stream."""
+
+    def append(self, type: str, data: dict):
+        with SessionLocal() as db:
+            db.add(DashboardEvent(type=type, data=json.dumps(data, default=str), created=time.time()))
+            db.commit()
+
+    def read(self, after: int, limit: int) -> list[tuple[int, str, dict]]:
+        with SessionLocal() as db:
+            rows = (
+                db.query(DashboardEvent)
+                .filter(DashboardEvent.id > after)
+                .order_by(DashboardEvent.id)
+                .limit(limit)
+                .all()
+            )
+            return [(row.id, row.type, json.loads(row.data)) for row in rows]
+
+    def last_id(self) -> int:
+        with SessionLocal() as db:
+            return db.query(func.max(DashboardEvent.id)).scalar() or 0
+
+    def trim(self, before: float):
+        with SessionLocal() as db:
+            db.query(DashboardEvent).filter(DashboardEvent.created < before).delete()
+            db.commit()
+
+
+def share_events():
+    """Route this process's events through the database when EVENTS_SHARED is set; needs init_db."""
+    if settings.EVENTS_SHARED:
+        event_broker.attach(DatabaseEventLog())
+
+
+@router.get("/")
+async def stream_events(last_event_id: Optional[str] = Header(default=None)):
+    """Push new visits ("visit") and face changes ("face") as they happen."""
+    subscription = event_broker.subscribe(last_event_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                event = await subscription.get(timeout=settings.EVENTS_KEEPALIVE_SECONDS)
+                # A comment line keeps proxies from closing an idle connection
+                yield event.encode() if event else ": keep-alive\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
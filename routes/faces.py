@@ -2,154 +2,426 @@
 Face recognition and face management routes with REAL detection.
 """
 
+import asyncio
 import os
-import cv2
-import numpy as np
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Form
-from sqlalchemy.orm import Session
-from ultralytics import YOLO
-from deepface import DeepFace
-
-from database import get_db
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from functools import partial
+from typing import NamedTuple, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status, Form, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, defer
+
+from database import SessionLocal, get_db
 from models import User, Face, Visit
-from schemas import FaceResponse, FaceListResponse, RecognitionResponse, RecognitionResult
+from schemas import FaceResponse, FaceListResponse, RecognitionCandidate, RecognitionResponse, RecognitionResult
 from auth import get_current_user
 from config import settings
+from recognition.alignment import align_detections
+from recognition.batching import detect, detection_batcher
+from recognition.decoding import UploadedFrame, capture_profile, decode_upload, upload_totals
+from recognition.detectors import Detections
+from recognition.executor import ExecutorSaturated, inference_executor
+from recognition.events import event_broker
+from recognition.enrollment import decode_embedding, embedding_signature, enroll_bytes, enroll_file
+from recognition.gallery import Gallery
+from recognition.matching import Recognition, recognize
+from recognition.metadata import FaceInfo, FaceMetadataCache
+from recognition.motion import MotionGate, motion_totals
+from recognition.registry import registry, resolve_face_model_key, resolve_model_key
+from recognition.result_cache import ResultCache
+from recognition.streaming import FrameRateLimiter, LatestFrame
+from recognition.tracking import Track, Tracker
 
 router = APIRouter(prefix="/api/faces", tags=["faces"])
 
-AVAILABLE_MODELS = {
-    "yolov8n": "yolov8n.pt",
-    "yolov8m": "yolov8m.pt",
-    "yolov8n-face": "yolov8n-face.pt",
-    "yolov8m-face": "yolov8m-face.pt",
-    "yolov8l-face": "yolov8l-face.pt",
-    "yolov10s-face": "yolov10s-face.pt",
-    "yolov11m-face": "yolov11m-face.pt",
-    "yolov11l-face": "yolov11l-face.pt",
-}
+
+
+def _apply_enrollment(face: Face, enrollment):
+    """Store the enrollment crop and embedding on a face row."""
+    face.crop = enrollment.crop
+    face.embedding = enrollment.embedding
+    face.embedding_model = enrollment.embedding_model
+    face.embedding_version = enrollment.embedding_version
+
+
+def _load_gallery():
+    """Stored embeddings and access flags for the gallery, backfilling rows that lack a current embedding."""
+    db = SessionLocal()
+    try:
+        signature = embedding_signature()
+        entries = []
+        for face in db.query(Face).options(defer(Face.crop)).all():
+            if face.embedding is None or (face.embedding_model, face.embedding_version) != signature:
+                try:
+                    _apply_enrollment(face, enroll_file(settings.MEDIA_ROOT / face.image))
+                except ValueError:
+                    continue
+            entries.append((face.id, decode_embedding(face.embedding), bool(face.is_allowed)))
+        db.commit()
+        return entries
+    finally:
+        db.close()
+
+
+faces_gallery = Gallery(_load_gallery, name="faces")
+
+
+def _load_metadata():
+    """Identity fields of every face, in one query."""
+    db = SessionLocal()
+    try:
+        rows = db.query(Face.id, Face.name, Face.image, Face.is_allowed).all()
+        return [
+            FaceInfo(id=id, name=name, image_url=f"{settings.MEDIA_URL}{image}", is_allowed=bool(is_allowed))
+            for id, name, image, is_allowed in rows
+        ]
+    finally:
+        db.close()
+
+
+face_metadata = FaceMetadataCache(_load_metadata, version=lambda: faces_gallery.version)
+
+
+def _sync_gallery(face: Face):
+    """Apply a created or edited face to the in-memory gallery and metadata cache."""
+    embedding = decode_embedding(face.embedding) if face.embedding else None
+    faces_gallery.upsert(face.id, embedding, bool(face.is_allowed))
+    face_metadata.invalidate()
+
+
+def _candidates(recognition) -> list[RecognitionCandidate]:
+    return [
+        RecognitionCandidate(id=c.face_id, distance=c.distance, is_allowed=c.is_allowed)
+        for c in recognition.candidates
+    ]
+
+
+class FrameOutcome(NamedTuple):
+    """Results of one upload, cached as a whole by ``result_cache``."""
+
+    results: list[RecognitionResult]
+    visits: list[dict]  # Visit columns, logged again for every request
+    error: Optional[str]
+
+
+def _result_ttl(outcome: FrameOutcome) -> float:
+    if outcome.error:
+        return 0  # e.g. the embedding model failed, retry it next time
+    if not outcome.results:
+        return settings.RESULT_CACHE_NEGATIVE_TTL
+    return settings.RESULT_CACHE_TTL
+
+
+result_cache = ResultCache(settings.RESULT_CACHE_SIZE, _result_ttl)
+
+
+def _decode(contents: bytes, model: str) -> UploadedFrame:
+    """Decode an upload only as large as the detector input, see recognition.decoding."""
+    try:
+        return decode_upload(contents, registry.get(model).imgsz)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image")
+
+
+def _decode_and_detect(contents: bytes, model: str) -> tuple[UploadedFrame, Detections]:
+    """Decode an upload and detect its faces, with boxes in original-image coordinates."""
+    frame = _decode(contents, model)
+    return frame, detect(model, frame.image).scaled(frame.scale)
+
+
+def _recognize_faces(frame: UploadedFrame, detections: Detections) -> tuple[list[Optional[Recognition]], Optional[str]]:
+    """Recognitions of the detected faces, or Nones and the error if recognition failed."""
+    # Embed every face in the frame in one batch and match them together
+    try:
+        faces = align_detections(*frame.for_faces(detections))
+        return recognize([faces], faces_gallery)[0], None
+    except Exception as e:
+        return [None] * len(detections), str(e)
+
+
+def _outcome(
+    detections: Detections,
+    recognitions: list[Optional[Recognition]],
+    error: Optional[str],
+    tracks: Optional[list[Track]] = None,
+    logged: Optional[list[bool]] = None,
+) -> FrameOutcome:
+    """Response entries for the faces of a frame, and visits for those marked in ``logged`` (all by default)."""
+    boxes = [[int(v) for v in box] for box in detections.boxes]
+    recognized_people = []
+    visits = []
+
+    for i, (box, recognition) in enumerate(zip(boxes, recognitions)):
+        match = recognition.match if recognition else None
+        track_id = tracks[i].id if tracks else None
+        log_visit = logged is None or logged[i]
+        if recognition is None:
+            person_data = RecognitionResult(
+                name="Error",
+                confidence=0.0,
+                box=box,
+                is_allowed=False,
+                error=error,
+                track_id=track_id
+            )
+            recognized_people.append(person_data)
+        elif match:
+            # Identity comes from the metadata cache, not a per-face query
+            face_info = face_metadata.get(match.face_id)
+
+            if face_info:
+                person_data = RecognitionResult(
+                    id=face_info.id,
+                    name=face_info.name,
+                    filename=face_info.image_url,
+                    confidence=match.distance,
+                    box=box,
+                    is_allowed=face_info.is_allowed,
+                    candidates=_candidates(recognition),
+                    track_id=track_id
+                )
+                # Log visit
+                if log_visit:
+                    visits.append(dict(
+                        face_id=face_info.id,
+                        person_name=face_info.name,
+                        confidence=f"{100*(1-match.distance):.1f}%",
+                        is_allowed=face_info.is_allowed
+                    ))
+            else:
+                person_data = RecognitionResult(
+                    name="Unknown (Match found but not in database)",
+                    confidence=match.distance,
+                    box=box,
+                    is_allowed=False,
+                    candidates=_candidates(recognition),
+                    track_id=track_id
+                )
+            recognized_people.append(person_data)
+        else:
+            person_data = RecognitionResult(
+                name="Unknown",
+                confidence=1.0,
+                box=box,
+                is_allowed=False,
+                candidates=_candidates(recognition),
+                track_id=track_id
+            )
+            recognized_people.append(person_data)
+            # Log unknown visit
+            if log_visit:
+                visits.append(dict(
+                    face_id=None,
+                    person_name="Unknown",
+                    confidence="N/A",
+                    is_allowed=False
+                ))
+
+    return FrameOutcome(recognized_people, visits, error)
+
+
+def _recognize_image(contents: bytes, model: str) -> FrameOutcome:
+    """Run detection and recognition on raw image bytes (blocking)."""
+    frame, detections = _decode_and_detect(contents, model)
+    recognitions, error = _recognize_faces(frame, detections)
+    return _outcome(detections, recognitions, error)
+
+
+def _identity(recognition: Recognition) -> Optional[int]:
+    return recognition.match.face_id if recognition.match else None
+
+
+def recognize_tracked(frame: UploadedFrame, detections: Detections, tracker: Tracker) -> FrameOutcome:
+    """
+    Like ``_recognize_image`` for a video frame, but only the tracks that
+    need it are recognized; the others reuse their cached identity.
+
+    A visit is logged when a track's identity is first known or changes,
+    not for every frame the person stays in view.
+    """
+    tracks = tracker.update(detections.boxes)
+    pending = [i for i, track in enumerate(tracks) if track.needs_recognition()]
+    logged = [False] * len(tracks)
+    error = None
+    if pending:
+        recognitions, error = _recognize_faces(frame, detections.select(pending))
+        for i, recognition in zip(pending, recognitions):
+            if recognition is None:
+                continue  # failed: keep any earlier identity and retry next frame
+            previous = tracks[i].recognition
+            logged[i] = previous is None or _identity(previous) != _identity(recognition)
+            tracks[i].remember(recognition)
+    return _outcome(detections, [track.recognition for track in tracks], error, tracks, logged)
+
+
+def _recognize_stream_frame(
+    contents: bytes, model: str, tracker: Tracker, gate: Optional[MotionGate]
+) -> Optional[FrameOutcome]:
+    """Decode, detect and track one frame of a live stream (blocking); None if the motion gate skipped it."""
+    frame = _decode(contents, model)
+    if gate is not None and not gate.moving(frame.image):
+        return None
+    detections = detect(model, frame.image).scaled(frame.scale)
+    return recognize_tracked(frame, detections, tracker)
+
+
+def log_visits(db: Session, visits: list[dict]):
+    """Store the visits collected in a ``FrameOutcome`` and announce them to dashboards."""
+    if not visits:
+        return
+    rows = [Visit(**visit) for visit in visits]
+    db.add_all(rows)
+    db.flush()
+    ids = [row.id for row in rows]  # read before commit expires the rows
+    db.commit()
+    timestamp = datetime.now(timezone.utc).isoformat()
+    for visit_id, visit in zip(ids, visits):
+        event_broker.publish("visit", {"id": visit_id, **visit, "timestamp": timestamp})
+
+
+def _publish_face(action: str, face: Optional[Face] = None, face_id: Optional[int] = None):
+    """Announce a face change to dashboards; deletions only carry the id."""
+    data = FaceResponse.model_validate(face).model_dump(mode="json") if face else {"id": face_id}
+    event_broker.publish("face", {"action": action, "face": data})
+
+
+def _submit_recognition(contents: bytes, model: str) -> Future:
+    """Recognition of an upload, served from ``result_cache`` when possible."""
+    submit = partial(inference_executor.submit, _recognize_image, contents, model)
+    if not settings.RESULT_CACHE_ENABLED:
+        return submit()
+    key = ResultCache.key(contents, resolve_model_key(model), faces_gallery.version_token())
+    return result_cache.fetch(key, submit)
 
 
 @router.post("/detect", response_model=RecognitionResponse)
 async def detect_faces(
     image: UploadFile = File(...),
-    model: str = Form(default="yolov8n"),
+    model: Optional[str] = Form(default=None),
     db: Session = Depends(get_db)
 ):
-    """Detect and recognize faces in uploaded image."""
+    """Detect and recognize faces in uploaded image; ``model`` must be a face detector."""
+    try:
+        model = resolve_face_model_key(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     try:
-        model_path = AVAILABLE_MODELS.get(model, AVAILABLE_MODELS["yolov8n"])
-        
         contents = await image.read()
-        np_img = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image")
-        
-        yolo_model = YOLO(model_path)
-        results = yolo_model(img)
-        recognized_people = []
-        
-        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
-        temp_path = os.path.join(settings.MEDIA_ROOT, "temp_detection.jpg")
-        cv2.imwrite(temp_path, img)
-        
-        for result in results:
-            for box in result.boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                face_img = img[y1:y2, x1:x2]
-                
-                try:
-                    faces_dir = os.path.join(settings.MEDIA_ROOT, "faces")
-                    os.makedirs(faces_dir, exist_ok=True)
-                    
-                    df_results = DeepFace.find(
-                        face_img, 
-                        db_path=faces_dir, 
-                        model_name="Facenet"
-                    )
-                    
-                    if df_results and len(df_results) > 0 and len(df_results[0]) > 0:
-                        best_match = df_results[0].iloc[0]
-                        face_path = best_match["identity"]
-                        filename = os.path.basename(face_path)
-                        
-                        face_obj = db.query(Face).filter(Face.image.contains(filename)).first()
-                        
-                        if face_obj:
-                            person_data = RecognitionResult(
-                                id=face_obj.id,
-                                name=face_obj.name,
-                                filename=f"/media/faces/{filename}",
-                                confidence=float(best_match["distance"]),
-                                box=[int(x1), int(y1), int(x2), int(y2)],
-                                is_allowed=face_obj.is_allowed
-                            )
-                            # Log visit
-                            visit = Visit(
-                                face_id=face_obj.id,
-                                person_name=face_obj.name,
-                                confidence=f"{100*(1-float(best_match['distance'])):.1f}%",
-                                is_allowed=face_obj.is_allowed
-                            )
-                            db.add(visit)
-                            db.commit()
-                        else:
-                            person_data = RecognitionResult(
-                                name="Unknown (Match found but not in database)",
-                                filename=f"/media/faces/{filename}",
-                                confidence=float(best_match["distance"]),
-                                box=[int(x1), int(y1), int(x2), int(y2)],
-                                is_allowed=False
-                            )
-                        recognized_people.append(person_data)
-                    else:
-                        person_data = RecognitionResult(
-                            name="Unknown",
-                            confidence=1.0,
-                            box=[int(x1), int(y1), int(x2), int(y2)],
-                            is_allowed=False
-                        )
-                        recognized_people.append(person_data)
-                        # Log unknown visit
-                        visit = Visit(
-                            face_id=None,
-                            person_name="Unknown",
-                            confidence="N/A",
-                            is_allowed=False
-                        )
-                        db.add(visit)
-                        db.commit()
-                
-                except Exception as e:
-                    person_data = RecognitionResult(
-                        name="Error",
-                        confidence=0.0,
-                        box=[int(x1), int(y1), int(x2), int(y2)],
-                        is_allowed=False,
-                        error=str(e)
-                    )
-                    recognized_people.append(person_data)
-        
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        # Inference runs on the bounded pool so the event loop stays free;
+        # shielded because the future may be shared with identical requests
+        outcome = await asyncio.shield(asyncio.wrap_future(_submit_recognition(contents, model)))
+        await run_in_threadpool(log_visits, db, outcome.visits)
         
         return RecognitionResponse(
             status="success",
-            recognized_people=recognized_people,
-            people_count=len(recognized_people)
+            recognized_people=outcome.results,
+            people_count=len(outcome.results)
         )
     
+    except HTTPException:
+        raise
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Inference queue is full, retry later")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+async def _receive_frames(websocket: WebSocket, frames: LatestFrame):
+    """Move binary frames from the socket into the mailbox until disconnect."""
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                frames.put(message["bytes"])
+    finally:
+        frames.close()
+
+
+@router.websocket("/stream")
+async def stream_faces(
+    websocket: WebSocket,
+    model: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Recognize and track faces in binary JPEG frames sent over a WebSocket, newest frame first."""
+    await websocket.accept()
+    try:
+        model = resolve_face_model_key(model)
+    except ValueError as e:
+        await websocket.send_json({"status": "error", "detail": str(e)})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.send_json({"status": "ready", "max_fps": settings.STREAM_MAX_FPS})
+    frames = LatestFrame()
+    limiter = FrameRateLimiter(settings.STREAM_MAX_FPS)
+    tracker = Tracker()  # frames of one connection are processed one at a time
+    gate = MotionGate() if settings.MOTION_GATE_ENABLED else None
+    receiver = asyncio.create_task(_receive_frames(websocket, frames))
+    try:
+        while True:
+            await limiter.wait()
+            contents = await frames.get()
+            if contents is None:
+                break
+            try:
+                outcome = await inference_executor.run(_recognize_stream_frame, contents, model, tracker, gate)
+            except HTTPException as e:
+                await websocket.send_json({"status": "error", "detail": e.detail, "dropped": frames.dropped})
+                continue
+            except ExecutorSaturated:
+                # This frame is skipped, the next one is tried after the usual interval
+                await websocket.send_json({"status": "busy", "dropped": frames.dropped})
+                continue
+            except Exception as e:
+                await websocket.send_json({"status": "error", "detail": f"Error: {str(e)}", "dropped": frames.dropped})
+                continue
+            metrics = {"dropped": frames.dropped}
+            if gate is not None:
+                metrics["motion_skipped_ratio"] = round(gate.skipped_ratio, 3)
+            if outcome is None:
+                # No motion: detection skipped, the last results still stand
+                await websocket.send_json({"status": "skipped", **metrics})
+                continue
+            await run_in_threadpool(log_visits, db, outcome.visits)
+            response = RecognitionResponse(
+                status="success",
+                recognized_people=outcome.results,
+                people_count=len(outcome.results)
+            )
+            await websocket.send_json({**response.model_dump(), **metrics})
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # client went away while a result was being sent
+    finally:
+        receiver.cancel()
+
+
+@router.get("/stats")
+def recognition_stats():
+    """Get model cache, inference pool, batching, result cache, motion gate, event feed and upload statistics."""
+    return {
+        "models": registry.stats(),
+        "executor": inference_executor.stats(),
+        "batching": detection_batcher.stats(),
+        "result_cache": result_cache.stats(),
+        "motion_gate": motion_totals.stats(),
+        "events": event_broker.stats(),
+        "uploads": upload_totals.stats(),
+    }
+
+
+@router.get("/capture-profile")
+def get_capture_profile(model: str = "yolov8n"):
+    """Get the capture size and JPEG quality clients should upload frames for ``model`` with."""
+    return {"model": resolve_model_key(model), **capture_profile(registry.get(model).imgsz)}
+
+
 @router.get("/", response_model=FaceListResponse)
 def list_faces(db: Session = Depends(get_db)):
     """Get all stored faces."""
-    faces = db.query(Face).all()
+    faces = db.query(Face).options(defer(Face.crop), defer(Face.embedding)).all()
     return FaceListResponse(faces=faces, total=len(faces))
 
 
@@ -169,15 +441,25 @@ async def create_face(
         file_path = os.path.join(faces_dir, filename)
         
         contents = await image.read()
+        # Detect, align and embed the face once, at enrollment time
+        enrollment = await inference_executor.run(enroll_bytes, contents)
         with open(file_path, "wb") as f:
             f.write(contents)
         
         new_face = Face(name=name, image=f"faces/{filename}", is_allowed=is_allowed)
+        _apply_enrollment(new_face, enrollment)
         db.add(new_face)
         db.commit()
         db.refresh(new_face)
+        # Gallery upserts may publish the shared store or rebuild the index
+        await run_in_threadpool(_sync_gallery, new_face)
+        _publish_face("created", new_face)
         
         return new_face
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Inference queue is full, retry later")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -185,7 +467,7 @@ async def create_face(
 @router.get("/{face_id}", response_model=FaceResponse)
 def get_face(face_id: int, db: Session = Depends(get_db)):
     """Get a specific face."""
-    face = db.query(Face).filter(Face.id == face_id).first()
+    face = db.query(Face).options(defer(Face.crop), defer(Face.embedding)).filter(Face.id == face_id).first()
     if not face:
         raise HTTPException(status_code=404, detail="Face not found")
     return face
@@ -214,6 +496,10 @@ async def update_face(
             faces_dir = os.path.join(settings.MEDIA_ROOT, "faces")
             os.makedirs(faces_dir, exist_ok=True)
             
+            contents = await image.read()
+            enrollment = await inference_executor.run(enroll_bytes, contents)
+            _apply_enrollment(face, enrollment)
+            
             old_path = os.path.join(settings.MEDIA_ROOT, face.image)
             if os.path.exists(old_path):
                 os.remove(old_path)
@@ -221,7 +507,6 @@ async def update_face(
             filename = f"{face.name}_{image.filename}"
             file_path = os.path.join(faces_dir, filename)
             
-            contents = await image.read()
             with open(file_path, "wb") as f:
                 f.write(contents)
             
@@ -229,7 +514,15 @@ async def update_face(
         
         db.commit()
         db.refresh(face)
+        await run_in_threadpool(_sync_gallery, face)
+        _publish_face("updated", face)
         return face
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except ExecutorSaturated:
+        db.rollback()
+        raise HTTPException(status_code=503, detail="Inference queue is full, retry later")
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -249,6 +542,9 @@ def delete_face(face_id: int, db: Session = Depends(get_db)):
         
         db.delete(face)
         db.commit()
+        faces_gallery.remove(face_id)
+        face_metadata.invalidate()
+        _publish_face("deleted", face_id=face_id)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
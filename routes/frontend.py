@@ -31,6 +31,8 @@ async def index():
     content = content.replace("{% url 'face_list' %}", "/api/faces/")
     # Fix detect endpoint
     content = content.replace('"/detect/"', '"/api/faces/detect"')
+    content = content.replace('"/capture-profile/', '"/api/faces/capture-profile')
+    content = content.replace("{{ live_stream_path }}", "/api/faces/stream")
     
     # Wrap in basic HTML structure
     return f"""<!DOCTYPE html>
@@ -229,69 +231,150 @@ async def admin_dashboard():
     </div>
     
     <script>
+        // Dashboard state: loaded once, then kept current by the /api/events/ feed
+        let faces = new Map();
+        let visits = [];
+        let totalVisits = 0;
+        let unknownVisits = 0;
+        const MAX_VISITS = 50;
+        
+        function renderVisit(visit) {
+            return `
+                <tr class="hover:bg-gray-50">
+                    <td class="px-6 py-4 text-sm text-gray-900">${new Date(visit.timestamp).toLocaleString()}</td>
+                    <td class="px-6 py-4 text-sm font-medium text-gray-900">${visit.person_name}</td>
+                    <td class="px-6 py-4 text-sm text-gray-500">${visit.confidence}</td>
+                    <td class="px-6 py-4 text-sm">
+                        <span class="px-2 py-1 text-xs font-bold rounded-full ${visit.is_allowed ? 'bg-green-100 text-green-800' : 'bg-red-100 text-red-800'}">
+                            ${visit.is_allowed ? '✓ ALLOWED' : '✗ DENIED'}
+                        </span>
+                    </td>
+                </tr>
+            `;
+        }
+        
+        function renderFace(face) {
+            return `
+                <div class="bg-gray-50 rounded-lg p-4 border ${face.is_allowed ? 'border-green-200' : 'border-red-200'}">
+                    <div class="flex items-center gap-3 mb-2">
+                        <div class="h-12 w-12 rounded-full bg-blue-100 flex items-center justify-center">
+                            <svg xmlns="http://www.w3.org/2000/svg" class="h-6 w-6 text-blue-500" fill="none" viewBox="0 0 24 24" stroke="currentColor">
+                                <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z" />
+                            </svg>
+                        </div>
+                        <div>
+                            <h4 class="font-medium text-gray-900">${face.name}</h4>
+                            <p class="text-xs text-gray-500">ID: ${face.id}</p>
+                        </div>
+                    </div>
+                    <span class="px-2 py-1 text-xs font-bold rounded-full ${face.is_allowed ? 'bg-green-100 text-green-800' : 'bg-red-100 text-red-800'}">
+                        ${face.is_allowed ? '✓ ALLOWED' : '✗ DENIED'}
+                    </span>
+                </div>
+            `;
+        }
+        
+        function renderCounters() {
+            document.getElementById('totalFaces').textContent = faces.size;
+            document.getElementById('totalVisits').textContent = totalVisits;
+            document.getElementById('unknownVisits').textContent = unknownVisits;
+        }
+        
+        function renderVisits() {
+            const visitsTable = document.getElementById('visitsTable');
+            if (visits.length > 0) {
+                visitsTable.innerHTML = visits.map(renderVisit).join('');
+            } else {
+                visitsTable.innerHTML = '<tr><td colspan="4" class="px-6 py-4 text-center text-gray-500">No visits yet</td></tr>';
+            }
+        }
+        
+        function renderFaces() {
+            const facesList = document.getElementById('facesList');
+            if (faces.size > 0) {
+                facesList.innerHTML = Array.from(faces.values()).map(renderFace).join('');
+            } else {
+                facesList.innerHTML = '<p class="text-gray-500">No faces registered yet</p>';
+            }
+        }
+        
+        // Events that arrive while loadData() is in flight are held back and
+        // applied once it resolves, so the loaded state does not overwrite them
+        let loading = 0;
+        let pending = [];
+        let lastVisitId = 0;
+        
         async function loadData() {
+            loading += 1;
             try {
                 // Load faces
                 const facesRes = await fetch('/api/faces/');
                 const facesData = await facesRes.json();
-                document.getElementById('totalFaces').textContent = facesData.total || 0;
+                faces = new Map((facesData.faces || []).map(face => [face.id, face]));
                 
                 // Load visits
                 const visitsRes = await fetch('/api/visits/');
                 const visitsData = await visitsRes.json();
-                document.getElementById('totalVisits').textContent = visitsData.total || 0;
-                document.getElementById('unknownVisits').textContent = visitsData.unknown_count || 0;
-                
-                // Display visits
-                const visitsTable = document.getElementById('visitsTable');
-                if (visitsData.visits && visitsData.visits.length > 0) {
-                    visitsTable.innerHTML = visitsData.visits.map(visit => `
-                        <tr class="hover:bg-gray-50">
-                            <td class="px-6 py-4 text-sm text-gray-900">${new Date(visit.timestamp).toLocaleString()}</td>
-                            <td class="px-6 py-4 text-sm font-medium text-gray-900">${visit.person_name}</td>
-                            <td class="px-6 py-4 text-sm text-gray-500">${visit.confidence}</td>
-                            <td class="px-6 py-4 text-sm">
-                                <span class="px-2 py-1 text-xs font-bold rounded-full ${visit.is_allowed ? 'bg-green-100 text-green-800' : 'bg-red-100 text-red-800'}">
-                                    ${visit.is_allowed ? '✓ ALLOWED' : '✗ DENIED'}
-                                </span>
-                            </td>
-                        </tr>
-                    `).join('');
+                visits = visitsData.visits || [];
+                totalVisits = visitsData.total || 0;
+                unknownVisits = visitsData.unknown_count || 0;
+                lastVisitId = Math.max(0, ...visits.map(visit => visit.id));
+            } catch (error) {
+                console.error('Error loading data:', error);
+            } finally {
+                loading -= 1;
+            }
+            if (!loading) {
+                const queued = pending;
+                pending = [];
+                queued.forEach(([type, data]) => applyEvent(type, data));
+                renderCounters();
+                renderVisits();
+                renderFaces();
+            }
+        }
+        
+        function applyEvent(type, data) {
+            if (type === 'visit') {
+                if (data.id <= lastVisitId) return; // already part of the loaded visits
+                lastVisitId = data.id;
+                visits = [data, ...visits].slice(0, MAX_VISITS);
+                totalVisits += 1;
+                if (data.face_id === null) unknownVisits += 1;
+                renderVisits();
+            } else if (type === 'face') {
+                if (data.action === 'deleted') {
+                    faces.delete(data.face.id);
                 } else {
-                    visitsTable.innerHTML = '<tr><td colspan="4" class="px-6 py-4 text-center text-gray-500">No visits yet</td></tr>';
+                    faces.set(data.face.id, data.face);
                 }
-                
-                // Display faces
-                const facesList = document.getElementById('facesList');
-                if (facesData.faces && facesData.faces.length > 0) {
-                    facesList.innerHTML = facesData.faces.map(face => `
-                        <div class="bg-gray-50 rounded-lg p-4 border ${face.is_allowed ? 'border-green-200' : 'border-red-200'}">
-                            <div class="flex items-center gap-3 mb-2">
-                                <div class="h-12 w-12 rounded-full bg-blue-100 flex items-center justify-center">
-                                    <svg xmlns="http://www.w3.org/2000/svg" class="h-6 w-6 text-blue-500" fill="none" viewBox="0 0 24 24" stroke="currentColor">
-                                        <path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M16 7a4 4 0 11-8 0 4 4 0 018 0zM12 14a7 7 0 00-7 7h14a7 7 0 00-7-7z" />
-                                    </svg>
-                                </div>
-                                <div>
-                                    <h4 class="font-medium text-gray-900">${face.name}</h4>
-                                    <p class="text-xs text-gray-500">ID: ${face.id}</p>
-                                </div>
-                            </div>
-                            <span class="px-2 py-1 text-xs font-bold rounded-full ${face.is_allowed ? 'bg-green-100 text-green-800' : 'bg-red-100 text-red-800'}">
-                                ${face.is_allowed ? '✓ ALLOWED' : '✗ DENIED'}
-                            </span>
-                        </div>
-                    `).join('');
+                renderFaces();
+            }
+            renderCounters();
+        }
+        
+        function onEvent(type) {
+            return (e) => {
+                const data = JSON.parse(e.data);
+                if (loading) {
+                    pending.push([type, data]);
                 } else {
-                    facesList.innerHTML = '<p class="text-gray-500">No faces registered yet</p>';
+                    applyEvent(type, data);
                 }
-            } catch (error) {
-                console.error('Error loading data:', error);
-            }
+            };
         }
         
+        // Incremental updates pushed by the server instead of polling. The
+        // stream is opened before the initial load so nothing falls in between.
+        const events = new EventSource('/api/events/');
+        events.addEventListener('visit', onEvent('visit'));
+        events.addEventListener('face', onEvent('face'));
+        // Missed too many events (or the server restarted): start over
+        events.addEventListener('reset', loadData);
+        
         loadData();
-        setInterval(loadData, 5000); // Refresh every 5 seconds
+        // Slow full refresh as a safety net for events that never arrive
+        setInterval(loadData, 60000);
     </script>
 </body>
 </html>"""
@@ -0,0 +1,17 @@
+"""
+Health and readiness routes.
+"""
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from recognition.warmup import readiness
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/ready")
+def ready():
+    """Report whether model warm-up has finished on this worker."""
+    status_code = 200 if readiness.is_ready else 503
+    return JSONResponse(status_code=status_code, content=readiness.status())
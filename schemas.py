@@ -86,6 +86,8 @@ class FaceResponse(FaceBase):
     """Schema for face response."""
     id: int
     image: str
+    embedding_model: Optional[str] = None
+    embedding_version: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     
@@ -99,6 +101,13 @@ class FaceListResponse(BaseModel):
     total: int
 
 
+class RecognitionCandidate(BaseModel):
+    """Schema for a nearest gallery face of a recognition result."""
+    id: int
+    distance: float
+    is_allowed: bool
+
+
 class RecognitionResult(BaseModel):
     """Schema for face recognition result."""
     id: Optional[int] = None
@@ -107,7 +116,9 @@ class RecognitionResult(BaseModel):
     confidence: float
     box: list[int]  # [x1, y1, x2, y2]
     is_allowed: bool
+    candidates: list[RecognitionCandidate] = []
     error: Optional[str] = None
+    track_id: Optional[int] = None  # live streams only
 
 
 class RecognitionResponse(BaseModel):